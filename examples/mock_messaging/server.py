@@ -33,6 +33,7 @@ from sap_core.domain.models import (
 from sap_core.pipelines.ingest import ingest_artifact
 from sap_core.pipelines.skills import earn_skill, report_skill
 from sap_store.sqlite.db import db_session
+from sap_store.sqlite.exposure import record_exposure
 
 DEMO_STATE: Dict[str, Any] = {}
 
@@ -196,21 +197,7 @@ def _ensure_exposure(con, workspace_id: str, actor_id: str, capsule_id: str) ->
     ).fetchone()
     if row:
         return
-    con.execute(
-        """
-        INSERT INTO exposure(exposure_id, workspace_id, actor_id, capsule_id, exposure_type, timestamp, strength)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            str(ulid.new()),
-            workspace_id,
-            actor_id,
-            capsule_id,
-            "seen",
-            datetime.utcnow().isoformat(),
-            0.85,
-        ),
-    )
+    record_exposure(con, workspace_id, actor_id, capsule_id, "seen", strength=0.85)
 
 
 def _ensure_skill_report(con, req: SkillReportRequest) -> None:
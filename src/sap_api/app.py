@@ -2,6 +2,10 @@ from __future__ import annotations
 
 from fastapi import FastAPI
 
+from sap_core.pipelines.exposure_buffer import exposure_buffer
+from sap_core.pipelines.workspace_context import WARM_WORKSPACES, warm_workspace_contexts
+from sap_models.registry import registry
+from sap_store.sqlite.db import db_session
 from sap_store.sqlite.migrate import apply_all
 from sap_api.routes.health import router as health_router
 from sap_api.routes.workspace import router as workspace_router
@@ -9,18 +13,41 @@ from sap_api.routes.actor import router as actor_router
 from sap_api.routes.ingest import router as ingest_router
 from sap_api.routes.capsule import router as capsule_router
 from sap_api.routes.draft import router as draft_router
+from sap_api.routes.exposure import router as exposure_router
+from sap_api.routes.session import router as session_router
 from sap_api.routes.skills import router as skills_router
 
 
+def _warm_embedder() -> None:
+    # Rare thoughts need centroids; without any there is no reason to load the model.
+    with db_session() as con:
+        row = con.execute(
+            "SELECT EXISTS (SELECT 1 FROM centroid) OR EXISTS (SELECT 1 FROM centroid_delta)"
+        ).fetchone()
+        if row[0]:
+            registry.get_embedder(wait=False)
+
+
 def create_app() -> FastAPI:
     apply_all()
-    app = FastAPI(title="SAP", version="0.2")
+    if WARM_WORKSPACES:
+        with db_session() as con:
+            warm_workspace_contexts(con)
+    # Buffered exposure events are written out before the process exits.
+    app = FastAPI(
+        title="SAP",
+        version="0.2",
+        on_startup=[exposure_buffer.start, _warm_embedder],
+        on_shutdown=[exposure_buffer.close],
+    )
     app.include_router(health_router)
     app.include_router(workspace_router)
     app.include_router(actor_router)
     app.include_router(ingest_router)
     app.include_router(capsule_router)
     app.include_router(draft_router)
+    app.include_router(session_router)
+    app.include_router(exposure_router)
     app.include_router(skills_router)
     return app
 
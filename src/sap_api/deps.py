@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+from sap_core.pipelines.workspace_context import workspace_contexts
 from sap_store.sqlite.db import db_session
 from sap_models.config import load_model_config
+from sap_models.registry import registry
 from sap_models.router import ModelRouter
 
 
@@ -18,3 +20,15 @@ def get_model_router() -> ModelRouter:
         catalog=cfg.catalog,
         budget=cfg.budget,
     )
+
+
+def get_draft_embedder(con, workspace_id: str):
+    """Embedder for rare thoughts, or None while the workspace has no group and goal centroids.
+
+    Never blocks on the model: the first call for a workspace with centroids starts the load in
+    the background and analysis runs without rare thoughts until it is ready.
+    """
+    ctx = workspace_contexts.get(con, workspace_id)
+    if ctx.group_centroid is None or ctx.goal_centroid is None:
+        return None
+    return registry.get_embedder(wait=False)
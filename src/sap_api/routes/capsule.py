@@ -6,7 +6,12 @@ from fastapi import APIRouter, Depends
 
 from sap_api.deps import get_con
 from sap_core.domain.models import Capsule, CapsuleType, Lens, Scope
-from sap_core.retrieval.retrieve import fts_capsules, load_capsules
+from sap_core.retrieval.retrieve import (
+    CapsuleFilter,
+    fts_capsules,
+    load_capsules,
+    recent_capsule_ids,
+)
 
 router = APIRouter(prefix="/v1/capsule", tags=["capsule"])
 
@@ -21,24 +26,9 @@ def query_capsules(
     limit: int = 50,
     con=Depends(get_con),
 ) -> List[Capsule]:
-    ids: List[str] = []
+    filters = CapsuleFilter(type=type, scope=scope, lens=lens)
     if q:
-        ids = fts_capsules(con, workspace_id, q, limit=limit)
+        ids = fts_capsules(con, workspace_id, q, limit=limit, filters=filters)
     else:
-        sql = "SELECT capsule_id FROM capsule WHERE workspace_id=?"
-        params: List[object] = [workspace_id]
-        if type is not None:
-            sql += " AND type=?"
-            params.append(type.value)
-        if scope is not None:
-            sql += " AND scope=?"
-            params.append(scope.value)
-        sql += " ORDER BY created_at DESC LIMIT ?"
-        params.append(limit)
-        rows = con.execute(sql, params).fetchall()
-        ids = [r["capsule_id"] for r in rows]
-
-    capsules = load_capsules(con, workspace_id, ids)
-    if lens is not None:
-        capsules = [c for c in capsules if lens in c.lens_tags]
-    return capsules
+        ids = recent_capsule_ids(con, workspace_id, limit=limit, filters=filters)
+    return load_capsules(con, workspace_id, ids)
@@ -1,8 +1,15 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
+import asyncio
+from contextlib import suppress
+import json
+from threading import Event, Thread
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
-from sap_api.deps import get_con, get_model_router
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.responses import StreamingResponse
+
+from sap_api.deps import get_con, get_draft_embedder, get_model_router
 from sap_core.domain.models import (
     AlignmentReport,
     AnalysisMode,
@@ -10,37 +17,145 @@ from sap_core.domain.models import (
     DraftRenderRequest,
     DraftRenderResponse,
 )
-from sap_core.pipelines.draft_analyze import analyze_draft
+from sap_core.pipelines.draft_analyze import ANALYSIS_STAGES, analysis_stages
 from sap_core.pipelines.draft_render import render_draft
+from sap_core.pipelines.incremental import typing_sessions
+from sap_core.pipelines.report_cache import cached_analyze_draft
+from sap_core.retrieval.query import compile_fts_query
 from sap_core.retrieval.retrieve import retrieve_bundle
 from sap_models.config import load_model_config
 from sap_models.registry import registry
 from sap_models.router import ModelRouter
+from sap_store.sqlite.db import db_session
 
 router = APIRouter(prefix="/v1/draft", tags=["draft"])
 
 
+def _etags(header: Optional[str]) -> List[str]:
+    """Entity tags listed in an If-None-Match header (weak tags compare as strong)."""
+    if not header:
+        return []
+    tags = []
+    for part in header.split(","):
+        tag = part.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tags.append(tag.strip('"'))
+    return tags
+
+
 @router.post("/analyze", response_model=AlignmentReport)
-def analyze(req: DraftAnalyzeRequest, con=Depends(get_con)) -> AlignmentReport:
-    report = analyze_draft(
-        con=con,
+def analyze(
+    req: DraftAnalyzeRequest,
+    response: Response,
+    con=Depends(get_con),
+    if_none_match: Optional[str] = Header(None),
+) -> Union[AlignmentReport, Response]:
+    embedder = get_draft_embedder(con, req.workspace_id)
+    if req.session_id and req.mode == AnalysisMode.typing:
+        return typing_sessions.get(req.workspace_id, req.session_id).analyze(
+            con,
+            draft_text=req.draft_text,
+            recipients=req.recipients,
+            recipient_lenses=req.recipient_lenses,
+            embedder=embedder,
+        )
+    # The ETag is the report's content address, so a match needs no analysis at all.
+    key, report = cached_analyze_draft(
+        con,
         workspace_id=req.workspace_id,
         draft_text=req.draft_text,
         recipients=req.recipients,
         recipient_lenses=req.recipient_lenses,
         mode=req.mode,
-        query_vec=None,
+        embedder=embedder,
+        if_none_match=_etags(if_none_match),
     )
+    etag = f'"{key}"'
+    if report is None:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return report
 
 
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+async def _stream_analysis(req: DraftAnalyzeRequest) -> AsyncIterator[bytes]:
+    """SSE events for each analysis stage as it completes.
+
+    The stages run on a dedicated thread with their own connection. When the client goes
+    away Starlette cancels this generator; the thread then stops before its next stage.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Optional[Tuple[str, dict]]]" = asyncio.Queue()
+    cancelled = Event()
+
+    def post(item: Optional[Tuple[str, dict]]) -> None:
+        # The loop may already be gone if the server is shutting down.
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def run() -> None:
+        try:
+            with db_session() as con:
+                stages = analysis_stages(
+                    con,
+                    workspace_id=req.workspace_id,
+                    draft_text=req.draft_text,
+                    recipients=req.recipients,
+                    recipient_lenses=req.recipient_lenses,
+                    mode=req.mode,
+                    embedder=get_draft_embedder(con, req.workspace_id),
+                )
+                try:
+                    while not cancelled.is_set():
+                        step = next(stages, None)
+                        if step is None:
+                            break
+                        stage, report = step
+                        fields = set(ANALYSIS_STAGES[stage])
+                        post((stage, report.model_dump(mode="json", include=fields)))
+                finally:
+                    stages.close()
+        except Exception as exc:
+            post(("error", {"detail": str(exc)}))
+        finally:
+            post(None)
+
+    Thread(target=run, name="draft-analyze-stream", daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            yield _sse(*item)
+    finally:
+        cancelled.set()
+
+
+@router.post("/analyze/stream")
+async def analyze_stream(req: DraftAnalyzeRequest) -> StreamingResponse:
+    """Server-sent events, one per stage in ANALYSIS_STAGES order (cheapest first).
+
+    Each event carries the report fields its stage filled in; `policy_decision` is last.
+    """
+    return StreamingResponse(
+        _stream_analysis(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/render", response_model=DraftRenderResponse)
 def render(
     req: DraftRenderRequest,
     con=Depends(get_con),
     model_router: ModelRouter = Depends(get_model_router),
 ) -> DraftRenderResponse:
-    capsules = retrieve_bundle(con, req.workspace_id, query=req.draft_text[:600], query_vec=None)
+    query = compile_fts_query(con, req.draft_text)
+    capsules = retrieve_bundle(con, req.workspace_id, query=query, query_vec=None)
     cfg = load_model_config()
     decision = model_router.route(AnalysisMode.before_send, value_score=0.9)
     llm = None
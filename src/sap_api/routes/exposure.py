@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from sap_api.deps import get_con
+from sap_core.domain.models import ExposureBulkRequest, ExposureBulkResponse
+from sap_core.pipelines.exposure_buffer import ExposureBufferFull, exposure_buffer
+
+router = APIRouter(prefix="/v1/exposure", tags=["exposure"])
+
+
+@router.post("/bulk", response_model=ExposureBulkResponse, status_code=202)
+def bulk_exposure(req: ExposureBulkRequest, con=Depends(get_con)) -> ExposureBulkResponse:
+    workspace_ids = sorted({e.workspace_id for e in req.events})
+    if workspace_ids:
+        qmarks = ",".join("?" for _ in workspace_ids)
+        known = {
+            r["workspace_id"]
+            for r in con.execute(
+                f"SELECT workspace_id FROM workspace WHERE workspace_id IN ({qmarks})",
+                workspace_ids,
+            ).fetchall()
+        }
+        missing = [w for w in workspace_ids if w not in known]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"workspace not found: {missing[0]}")
+    if len(req.events) > exposure_buffer.max_pending:
+        raise HTTPException(
+            status_code=413,
+            detail=f"at most {exposure_buffer.max_pending} events per request",
+        )
+    try:
+        pending = exposure_buffer.submit(req.events)
+    except ExposureBufferFull as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+    return ExposureBulkResponse(accepted=len(req.events), pending=pending)
@@ -3,10 +3,27 @@ from __future__ import annotations
 from fastapi import APIRouter
 
 from sap_core.domain.models import HealthResponse
+from sap_core.pipelines.exposure_buffer import exposure_buffer
+from sap_core.pipelines.report_cache import report_cache
+from sap_core.pipelines.workspace_context import workspace_contexts
+from sap_core.retrieval.capsule_cache import capsule_cache
+from sap_core.retrieval.result_cache import retrieval_cache
+from sap_core.scoring.embed_cache import sentence_embeddings
 
 router = APIRouter(prefix="/v1", tags=["health"])
 
 
 @router.get("/health", response_model=HealthResponse)
 def health() -> HealthResponse:
-    return HealthResponse(status="ok", version="0.2")
+    return HealthResponse(
+        status="ok",
+        version="0.2",
+        caches={
+            "capsules": capsule_cache.stats(),
+            "retrieval": retrieval_cache.stats(),
+            "workspace_context": workspace_contexts.stats(),
+            "exposure_buffer": exposure_buffer.stats(),
+            "sentence_embeddings": sentence_embeddings.stats(),
+            "reports": report_cache.stats(),
+        },
+    )
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+import json
+from threading import Lock
+from typing import Dict
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from sap_api.deps import get_draft_embedder
+from sap_core.domain.models import AlignmentReport, DraftSessionEdit, DraftSessionOpen
+from sap_core.pipelines.incremental import (
+    Finding,
+    IncrementalAnalyzer,
+    diff_findings,
+    finding_ids,
+)
+from sap_store.sqlite.db import connect
+
+router = APIRouter(prefix="/v1/draft", tags=["draft"])
+
+
+class DraftSession:
+    """Server-side state of one composer connection.
+
+    Holds the current draft, a dedicated SQLite connection and the incremental analyzer
+    (which keeps sentence facts, the retrieved bundle and recipient exposure maps). Edits
+    only bump `version`; the analysis loop always works on the newest text and drops any
+    result that was overtaken by edits while it ran.
+    """
+
+    def __init__(self, opened: DraftSessionOpen):
+        self.opened = opened
+        self.text = opened.draft_text
+        self.seq = 0
+        self.version = 0
+        self.analyzer = IncrementalAnalyzer(opened.workspace_id)
+        self.findings: Dict[str, Finding] = {}
+        self.dirty = asyncio.Event()
+        self.con = connect()
+        self._db_lock = Lock()
+
+    def apply(self, edit: DraftSessionEdit) -> None:
+        end = len(self.text) if edit.end is None else edit.end
+        if not 0 <= edit.start <= end <= len(self.text):
+            raise ValueError(f"edit range [{edit.start}, {end}) outside draft of {len(self.text)}")
+        self.text = self.text[: edit.start] + edit.text + self.text[end:]
+        self.seq = edit.seq
+        self.version += 1
+        self.dirty.set()
+
+    def analyze(self, text: str) -> AlignmentReport:
+        with self._db_lock:
+            try:
+                report = self.analyzer.analyze(
+                    self.con,
+                    draft_text=text,
+                    recipients=self.opened.recipients,
+                    recipient_lenses=self.opened.recipient_lenses,
+                    embedder=get_draft_embedder(self.con, self.opened.workspace_id),
+                )
+            except Exception:
+                self.con.rollback()
+                raise
+            # Retrieval may enqueue index rebuild jobs.
+            self.con.commit()
+            return report
+
+    def close(self) -> None:
+        with self._db_lock:
+            self.con.close()
+
+
+async def _analysis_loop(websocket: WebSocket, session: DraftSession) -> None:
+    """Analyze the newest draft whenever it changes and push the findings delta.
+
+    A failed analysis is reported as an error message and the loop waits for the next edit;
+    a failed send means the client is gone, so the socket is closed and the loop ends.
+    """
+    while True:
+        await session.dirty.wait()
+        session.dirty.clear()
+        version, seq, text = session.version, session.seq, session.text
+        try:
+            report = await run_in_threadpool(session.analyze, text)
+        except Exception as exc:
+            message = {"type": "error", "seq": seq, "detail": f"analysis failed: {exc}"}
+        else:
+            if version != session.version:
+                continue
+            current = finding_ids(report)
+            delta = diff_findings(session.findings, current)
+            session.findings = current
+            message = {
+                "type": "findings",
+                "seq": seq,
+                **delta,
+                "policy_decision": report.policy_decision,
+                "context_capsule_ids": report.context_capsule_ids,
+                "context_spans": [s.model_dump(mode="json") for s in report.context_spans],
+            }
+        try:
+            await websocket.send_json(message)
+        except Exception:
+            with suppress(Exception):
+                await websocket.close(code=1011)
+            return
+
+
+@router.websocket("/session")
+async def draft_session(websocket: WebSocket) -> None:
+    await websocket.accept()
+    try:
+        opened = DraftSessionOpen(**await websocket.receive_json())
+    except (ValidationError, ValueError, TypeError):
+        await websocket.close(code=1008)
+        return
+
+    session = DraftSession(opened)
+    task = asyncio.create_task(_analysis_loop(websocket, session))
+    try:
+        await websocket.send_json({"type": "opened", "workspace_id": opened.workspace_id})
+        session.dirty.set()
+        while True:
+            # Decoded here so a frame that is not JSON gets the same error reply as a bad edit.
+            frame = await websocket.receive_text()
+            try:
+                session.apply(DraftSessionEdit(**json.loads(frame)))
+            except (ValidationError, ValueError, TypeError) as exc:
+                await websocket.send_json({"type": "error", "detail": str(exc)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await task
+        await run_in_threadpool(session.close)
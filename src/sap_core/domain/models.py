@@ -112,6 +112,8 @@ class PolicyConfig(BaseModel):
     allow_llm_on_typing: bool = False
     allow_llm_before_send: bool = True
     allow_external_sync: bool = False
+    # Days after which a recipient's exposure to a glossary term counts half; None = no decay.
+    exposure_half_life_days: Optional[float] = 180.0
     expected_evidence_by_lens: Dict[Lens, EvidenceLevel] = Field(
         default_factory=lambda: {
             Lens.manufacturing: EvidenceLevel.measured,
@@ -152,6 +154,16 @@ class ExposureEvent(BaseModel):
     strength: float = Field(default=0.7, ge=0.0, le=1.0)
 
 
+class ExposureBulkRequest(BaseModel):
+    events: List[ExposureEvent] = Field(default_factory=list)
+
+
+class ExposureBulkResponse(BaseModel):
+    accepted: int
+    # Events queued in this process and not yet committed (including these).
+    pending: int
+
+
 class SkillClaimType(str, Enum):
     reported = "reported"
     earned = "earned"
@@ -241,6 +253,7 @@ class AlignmentReport(BaseModel):
     clarity_gaps: List[GapFinding] = Field(default_factory=list)
     rare_thoughts: List[RareThoughtFinding] = Field(default_factory=list)
     context_capsule_ids: List[str] = Field(default_factory=list)
+    context_spans: List[SourceSpan] = Field(default_factory=list)
     policy_decision: str = "silent"
 
 
@@ -265,6 +278,26 @@ class DraftAnalyzeRequest(BaseModel):
     recipients: List[str] = Field(default_factory=list)
     recipient_lenses: List[Lens] = Field(default_factory=list)
     mode: AnalysisMode = AnalysisMode.before_send
+    # Typing-mode calls with a session_id are analyzed incrementally (changed sentences only).
+    session_id: Optional[str] = None
+
+
+class DraftSessionOpen(BaseModel):
+    """First message on /v1/draft/session: pins workspace, recipients and lenses."""
+
+    workspace_id: str
+    recipients: List[str] = Field(default_factory=list)
+    recipient_lenses: List[Lens] = Field(default_factory=list)
+    draft_text: str = ""
+
+
+class DraftSessionEdit(BaseModel):
+    """Text delta: replace draft[start:end] with `text`; end=None means to the end of the draft."""
+
+    seq: int
+    start: int = 0
+    end: Optional[int] = None
+    text: str = ""
 
 
 class DraftRenderRequest(BaseModel):
@@ -286,3 +319,4 @@ class HealthResponse(BaseModel):
     status: str
     version: str
     models_loaded: Optional[List[str]] = None
+    caches: Optional[Dict[str, Dict[str, int]]] = None
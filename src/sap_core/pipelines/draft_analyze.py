@@ -1,52 +1,62 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional
-import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from sap_core.domain.models import (
     AlignmentReport,
     AnalysisMode,
-    CapsuleType,
     GapFinding,
     Lens,
     PolicyConfig,
+    RareThoughtFinding,
 )
+from sap_core.pipelines.workspace_context import WorkspaceContext, workspace_contexts
+from sap_core.retrieval.chunks import retrieve_chunks
+from sap_core.retrieval.query import compile_fts_query
 from sap_core.retrieval.retrieve import retrieve_bundle
-from sap_core.scoring.scoring import build_glossary_index, gap_findings, mismatch_findings
+from sap_core.scoring.document import DraftDocument
+from sap_core.scoring.embed_cache import sentence_embeddings
+from sap_core.scoring.scoring import (
+    gap_findings,
+    mismatch_findings,
+    rare_thought_findings,
+    split_spans,
+)
+from sap_store.sqlite.exposure import load_term_exposure
 
 
-def load_policy(con, workspace_id: str) -> PolicyConfig:
-    row = con.execute("SELECT policy_json FROM policy WHERE workspace_id=?", (workspace_id,)).fetchone()
-    if not row:
-        return PolicyConfig(workspace_id=workspace_id)
-    return PolicyConfig(**json.loads(row["policy_json"]))
+def recipient_term_exposure(con, workspace_id: str, actor_id: str) -> Dict[str, float]:
+    half_life = workspace_contexts.get(con, workspace_id).policy.exposure_half_life_days
+    return load_term_exposure(con, workspace_id, [actor_id], half_life_days=half_life)[actor_id]
 
 
-def recipient_term_exposure(con, workspace_id: str, actor_id: str) -> Dict[str, float]:
-    rows = con.execute(
-        """
-        SELECT c.body, c.meta_json
-        FROM exposure e
-        JOIN capsule c ON c.capsule_id = e.capsule_id
-        WHERE e.workspace_id=? AND e.actor_id=? AND c.type='glossary'
-        """,
-        (workspace_id, actor_id),
-    ).fetchall()
-    out: Dict[str, float] = {}
-    for r in rows:
-        meta = json.loads(r["meta_json"] or "{}")
-        if "terms" in meta:
-            for t in meta["terms"]:
-                term = (t.get("term") or "").strip().lower()
-                if term:
-                    out[term] = max(out.get(term, 0.0), 0.8)
-        else:
-            body = r["body"]
-            parts = body.split(":", 1)
-            if parts:
-                key = parts[0].strip().lower()
-                out[key] = max(out.get(key, 0.0), 0.8)
-    return out
+# Sentences beyond this many are not considered for rare thoughts.
+RARE_THOUGHT_MAX_SPANS = int(os.environ.get("SAP_RARE_THOUGHT_MAX_SPANS", "64"))
+
+
+def rare_thoughts(
+    ctx: WorkspaceContext,
+    draft_text: str,
+    embedder=None,
+    spans: Optional[List[Tuple[int, int]]] = None,
+) -> List[RareThoughtFinding]:
+    """Score every draft sentence against the workspace centroids in one batch.
+
+    Needs an embedder and both centroids; sentence vectors come from the shared
+    sentence cache, so only sentences it has not seen reach the model.
+    """
+    if embedder is None or ctx.group_centroid is None or ctx.goal_centroid is None:
+        return []
+    spans = [
+        (start, end)
+        for start, end in (split_spans(draft_text) if spans is None else spans)
+        if draft_text[start:end].strip()
+    ][:RARE_THOUGHT_MAX_SPANS]
+    if not spans:
+        return []
+    vecs = sentence_embeddings.embed(embedder, [draft_text[s:e].strip() for s, e in spans])
+    return rare_thought_findings(spans, vecs, ctx.group_centroid, ctx.goal_centroid, draft_text)
 
 
 def decide_policy(report: AlignmentReport, policy: PolicyConfig) -> str:
@@ -62,7 +72,16 @@ def decide_policy(report: AlignmentReport, policy: PolicyConfig) -> str:
     return "silent"
 
 
-def analyze_draft(
+# Stages of analysis_stages, cheapest first, and the report fields each one fills in.
+ANALYSIS_STAGES: Dict[str, Tuple[str, ...]] = {
+    "gaps": ("clarity_gaps",),
+    "mismatches": ("blockers", "context_capsule_ids", "context_spans"),
+    "rare_thoughts": ("rare_thoughts",),
+    "policy_decision": ("policy_decision",),
+}
+
+
+def analysis_stages(
     con,
     workspace_id: str,
     draft_text: str,
@@ -70,46 +89,102 @@ def analyze_draft(
     recipient_lenses: List[Lens],
     mode: AnalysisMode,
     query_vec: Optional[List[float]] = None,
-) -> AlignmentReport:
-    policy = load_policy(con, workspace_id)
-    capsules = retrieve_bundle(con, workspace_id, query=draft_text[:600], query_vec=query_vec)
-
-    constraints = [c for c in capsules if c.type == CapsuleType.constraint]
-    capabilities = [c for c in capsules if c.type == CapsuleType.capability]
-    glossary_caps = [c for c in capsules if c.type == CapsuleType.glossary]
-    glossary_idx = build_glossary_index(glossary_caps)
-
-    expected = None
-    if recipient_lenses:
-        levels = [policy.expected_evidence_by_lens.get(l) for l in recipient_lenses]
-        levels = [x for x in levels if x is not None]
-        if levels:
-            order = {
-                "hypothesis": 0,
-                "estimate": 1,
-                "simulated": 2,
-                "measured": 3,
-                "certified": 4,
-            }
-            expected = max(levels, key=lambda e: order[e.value])
-
-    all_gaps: List[GapFinding] = []
-    for rid in recipients:
-        exposure_terms = recipient_term_exposure(con, workspace_id, rid)
-        all_gaps.extend(gap_findings(draft_text, glossary_idx, exposure_terms, recipient_actor_id=rid))
-
-    blockers = mismatch_findings(draft_text, constraints, capabilities, expected)
-
+    embedder=None,
+    exposure: Optional[Dict[str, Dict[str, float]]] = None,
+    ctx: Optional[WorkspaceContext] = None,
+    read_only: bool = False,
+) -> Iterator[Tuple[str, AlignmentReport]]:
+    """Run the analysis stage by stage, yielding (stage, report) after each one.
+
+    Stages follow ANALYSIS_STAGES: lexical gaps need no retrieval, mismatches wait for the
+    retrieved bundle, rare thoughts for sentence vectors; the policy decision comes last.
+    The same report object is yielded each time, filled in up to that stage, so callers can
+    forward partial results and stop early (closing the generator skips the rest).
+    `exposure` (load_term_exposure for the recipients) skips loading it again; `ctx` pins a
+    prebuilt context instead of the generation-checked cached one. `read_only` keeps the run
+    free of writes: no index jobs are queued and stale exposure is folded in memory only.
+    """
+    if ctx is None:
+        ctx = workspace_contexts.get(con, workspace_id)
+    policy = ctx.policy
     report = AlignmentReport(
         mode=mode,
         workspace_id=workspace_id,
         recipients=recipients,
         lens_target=recipient_lenses[0] if recipient_lenses else None,
-        blockers=blockers,
-        clarity_gaps=all_gaps,
-        rare_thoughts=[],
-        context_capsule_ids=[c.capsule_id for c in capsules],
         policy_decision="silent",
     )
+
+    # Tokenized once; every detector and recipient below reads from the same pass.
+    doc = DraftDocument(draft_text)
+    if exposure is None:
+        exposure = load_term_exposure(
+            con,
+            workspace_id,
+            recipients,
+            half_life_days=policy.exposure_half_life_days,
+            read_only=read_only,
+        )
+    all_gaps: List[GapFinding] = []
+    for rid in recipients:
+        all_gaps.extend(
+            gap_findings(draft_text, ctx.glossary, exposure[rid], recipient_actor_id=rid, doc=doc)
+        )
+    report.clarity_gaps = all_gaps
+    yield "gaps", report
+
+    query = compile_fts_query(con, draft_text)
+    capsules = retrieve_bundle(
+        con, workspace_id, query=query, query_vec=query_vec, read_only=read_only
+    )
+    chunk_query = compile_fts_query(con, draft_text, table="fts_chunks")
+    chunk_hits = retrieve_chunks(
+        con, workspace_id, query=chunk_query, query_vec=query_vec, read_only=read_only
+    )
+
+    # Constraint and glossary checks are keyed on the draft's own wording, so they run over
+    # the whole workspace; capability timing checks only apply to capabilities retrieved
+    # for this draft.
+    retrieved = {c.capsule_id for c in capsules}
+    report.blockers = mismatch_findings(
+        draft_text,
+        ctx.constraints,
+        ctx.capabilities,
+        ctx.expected_evidence(recipient_lenses),
+        index=ctx.conflicts,
+        allowed_capabilities=retrieved,
+        doc=doc,
+    )
+    report.context_capsule_ids = [c.capsule_id for c in capsules]
+    report.context_spans = [h.to_span() for h in chunk_hits]
+    yield "mismatches", report
+
+    report.rare_thoughts = rare_thoughts(ctx, draft_text, embedder, spans=doc.sentences)
+    yield "rare_thoughts", report
+
     report.policy_decision = decide_policy(report, policy)
+    yield "policy_decision", report
+
+
+def analyze_draft(
+    con,
+    workspace_id: str,
+    draft_text: str,
+    recipients: List[str],
+    recipient_lenses: List[Lens],
+    mode: AnalysisMode,
+    query_vec: Optional[List[float]] = None,
+    embedder=None,
+) -> AlignmentReport:
+    for _stage, report in analysis_stages(
+        con,
+        workspace_id,
+        draft_text,
+        recipients,
+        recipient_lenses,
+        mode,
+        query_vec=query_vec,
+        embedder=embedder,
+    ):
+        pass
     return report
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from collections import deque
+import os
+from threading import Condition, Lock, Thread
+import time
+from typing import Deque, Dict, List, Optional, Sequence
+
+from sap_core.domain.models import ExposureEvent
+from sap_core.pipelines.workspace_context import load_policy
+from sap_store.sqlite.db import connect
+from sap_store.sqlite.exposure import ExposureRow, record_exposures
+
+# A flush starts once this many events are pending...
+EXPOSURE_FLUSH_SIZE = int(os.environ.get("SAP_EXPOSURE_FLUSH_SIZE", "500"))
+# ...or once the oldest pending event has waited this long.
+EXPOSURE_FLUSH_MS = float(os.environ.get("SAP_EXPOSURE_FLUSH_MS", "250"))
+# Submissions block while this many events are pending, and fail after the timeout.
+EXPOSURE_BUFFER_LIMIT = int(os.environ.get("SAP_EXPOSURE_BUFFER_LIMIT", "20000"))
+EXPOSURE_SUBMIT_TIMEOUT_MS = float(os.environ.get("SAP_EXPOSURE_SUBMIT_TIMEOUT_MS", "1000"))
+
+
+class ExposureBufferFull(Exception):
+    """The buffer stayed full for the whole submit timeout; retry later."""
+
+
+class ExposureWriteBuffer:
+    """In-process group-commit buffer for exposure events.
+
+    Request handlers only append to a queue. One background thread drains it in batches of
+    up to `flush_size` events, one transaction per batch, writing each workspace's events
+    with a single executemany. The SQLite write lock is therefore taken a few times a second
+    rather than once per message view. Events are visible to analysis once their batch
+    commits. `close()` flushes whatever is still queued.
+    """
+
+    def __init__(
+        self,
+        flush_size: int = EXPOSURE_FLUSH_SIZE,
+        flush_ms: float = EXPOSURE_FLUSH_MS,
+        max_pending: int = EXPOSURE_BUFFER_LIMIT,
+        submit_timeout_ms: float = EXPOSURE_SUBMIT_TIMEOUT_MS,
+    ) -> None:
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_ms / 1000.0
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout_ms / 1000.0
+        self._events: Deque[ExposureEvent] = deque()
+        self._oldest: Optional[float] = None
+        self._cond = Condition()
+        self._write_lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._closing = False
+        self._con = None
+        self.accepted = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closing = False
+            self._thread = Thread(target=self._run, name="exposure-flush", daemon=True)
+            self._thread.start()
+
+    def submit(self, events: Sequence[ExposureEvent]) -> int:
+        """Queue events for the next flush; returns the number pending afterwards.
+
+        Blocks while the buffer is full and raises ExposureBufferFull if it is still full
+        after the submit timeout (callers should surface that as a retryable error).
+        """
+        if not events:
+            return len(self._events)
+        if len(events) > self.max_pending:
+            raise ValueError(f"at most {self.max_pending} events per submission")
+        self.start()
+        deadline = time.monotonic() + self.submit_timeout
+        with self._cond:
+            while len(self._events) + len(events) > self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closing:
+                    self.rejected += len(events)
+                    raise ExposureBufferFull(f"{len(self._events)} exposure events pending")
+                self._cond.wait(remaining)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._events.extend(events)
+            self.accepted += len(events)
+            if len(self._events) >= self.flush_size:
+                self._cond.notify_all()
+            return len(self._events)
+
+    def _take_batch(self) -> List[ExposureEvent]:
+        n = min(self.flush_size, len(self._events))
+        batch = [self._events.popleft() for _ in range(n)]
+        self._oldest = time.monotonic() if self._events else None
+        # Wake submitters waiting for room.
+        self._cond.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closing:
+                    if len(self._events) >= self.flush_size:
+                        break
+                    if self._oldest is not None:
+                        wait = self._oldest + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                if self._closing:
+                    return
+                batch = self._take_batch()
+            self._write(batch)
+
+    def flush(self) -> int:
+        """Write everything pending from the calling thread; returns events written."""
+        written = 0
+        while True:
+            with self._cond:
+                if not self._events:
+                    return written
+                batch = self._take_batch()
+            written += self._write(batch)
+
+    def close(self) -> None:
+        """Stop the flush thread and write out the queue (call on shutdown)."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+        with self._write_lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    def _write(self, batch: List[ExposureEvent]) -> int:
+        by_workspace: Dict[str, List[ExposureRow]] = {}
+        for e in batch:
+            by_workspace.setdefault(e.workspace_id, []).append(
+                (e.actor_id, e.capsule_id, e.exposure_type, e.timestamp.isoformat(), e.strength)
+            )
+        with self._write_lock:
+            if self._con is None:
+                self._con = connect()
+            con = self._con
+            try:
+                self._write_groups(con, by_workspace)
+                con.commit()
+                written = len(batch)
+            except Exception:
+                con.rollback()
+                # One bad workspace (e.g. deleted) must not sink the rest of the batch.
+                written = 0
+                for workspace_id, rows in by_workspace.items():
+                    try:
+                        self._write_groups(con, {workspace_id: rows})
+                        con.commit()
+                        written += len(rows)
+                    except Exception:
+                        con.rollback()
+                        self.dropped += len(rows)
+            self.written += written
+            self.batches += 1
+        return written
+
+    @staticmethod
+    def _write_groups(con, by_workspace: Dict[str, List[ExposureRow]]) -> None:
+        for workspace_id, rows in by_workspace.items():
+            half_life = load_policy(con, workspace_id).exposure_half_life_days
+            record_exposures(con, workspace_id, rows, half_life)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._events),
+            "max_pending": self.max_pending,
+            "accepted": self.accepted,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+
+exposure_buffer = ExposureWriteBuffer()
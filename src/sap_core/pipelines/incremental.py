@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import os
+from threading import Lock
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sap_core.domain.models import (
+    AlignmentReport,
+    AnalysisMode,
+    Capsule,
+    GapFinding,
+    Lens,
+    MismatchFinding,
+    SourceSpan,
+)
+from sap_core.pipelines.draft_analyze import decide_policy, rare_thoughts
+from sap_core.pipelines.workspace_context import WorkspaceContext, workspace_contexts
+from sap_core.retrieval.chunks import retrieve_chunks
+from sap_core.retrieval.query import compile_fts_query
+from sap_core.retrieval.retrieve import retrieve_bundle
+from sap_core.scoring.document import DraftDocument
+from sap_core.scoring.scoring import (
+    EVID_ORDER,
+    KNOWN_TERM_STRENGTH,
+    ConflictScan,
+    Span,
+    acronym_gap,
+    evidence_level_from_flags,
+    evidence_mismatch,
+    evidence_span,
+    glossary_gap,
+    split_spans,
+)
+from sap_store.sqlite.exposure import load_term_exposure
+from sap_store.sqlite.state import all_generations
+
+TYPING_SESSION_LIMIT = int(os.environ.get("SAP_TYPING_SESSIONS", "1024"))
+# Recipient exposure maps are not generation-tracked, so sessions re-read them this often.
+EXPOSURE_TTL_SECONDS = float(os.environ.get("SAP_EXPOSURE_TTL_SECONDS", "30"))
+
+
+@dataclass
+class SentenceFacts:
+    """Recipient-independent scoring facts for one sentence; spans are sentence-relative."""
+
+    acronyms: List[Tuple[str, Span]] = field(default_factory=list)
+    glossary_hits: List[Tuple[str, Span]] = field(default_factory=list)
+    confident: Optional[Span] = None
+    hedged: Optional[Span] = None
+    conflicts: ConflictScan = field(default_factory=ConflictScan)
+
+
+def _shift(span: Span, offset: int) -> Span:
+    return (span[0] + offset, span[1] + offset)
+
+
+def _first(spans: List[Tuple[int, Optional[Span]]]) -> Optional[Span]:
+    return next((_shift(span, offset) for offset, span in spans if span is not None), None)
+
+
+class IncrementalAnalyzer:
+    """Typing-mode analyzer for one draft session.
+
+    Sentence facts are cached by sentence text. On each call the draft is re-split with
+    split_spans, unchanged sentences reuse their facts (spans shifted to the new offset) and
+    only new or edited sentences are scored. The cache is dropped whenever the workspace
+    context is rebuilt, since glossary and constraints may have changed.
+    """
+
+    def __init__(self, workspace_id: str):
+        self.workspace_id = workspace_id
+        self._generation: Optional[Tuple[int, ...]] = None
+        self._facts: Dict[str, SentenceFacts] = {}
+        self._exposure: Dict[str, Tuple[float, Dict[str, float]]] = {}
+        self._bundle_key: Optional[Tuple[Any, ...]] = None
+        self._bundle: List[Capsule] = []
+        self._spans_key: Optional[Tuple[Any, ...]] = None
+        self._spans: List[SourceSpan] = []
+        self.last_spans: List[Span] = []
+        self.last_scored = 0
+        self.last_reused = 0
+        # The sentence, exposure and bundle caches are not thread-safe; concurrent requests
+        # for the same typing session take turns.
+        self._lock = Lock()
+
+    def _recipient_exposure(
+        self, con, ctx: WorkspaceContext, actor_ids: List[str]
+    ) -> Dict[str, Dict[str, float]]:
+        now = time.monotonic()
+        expired = [
+            rid
+            for rid in dict.fromkeys(actor_ids)
+            if rid not in self._exposure or now - self._exposure[rid][0] > EXPOSURE_TTL_SECONDS
+        ]
+        if expired:
+            loaded = load_term_exposure(
+                con, self.workspace_id, expired, half_life_days=ctx.policy.exposure_half_life_days
+            )
+            for rid, terms in loaded.items():
+                self._exposure[rid] = (now, terms)
+        return {rid: self._exposure[rid][1] for rid in actor_ids}
+
+    def _retrieve(self, con, query: str, query_vec: Optional[List[float]]) -> List[Capsule]:
+        # Edits that leave the compiled query unchanged keep the previous bundle.
+        key = (self._generation, query, None if query_vec is None else tuple(query_vec))
+        if key != self._bundle_key:
+            self._bundle = retrieve_bundle(con, self.workspace_id, query=query, query_vec=query_vec)
+            self._bundle_key = key
+        return self._bundle
+
+    def _context_spans(
+        self, con, draft_text: str, query_vec: Optional[List[float]]
+    ) -> List[SourceSpan]:
+        # Same reuse rule as _retrieve; chunk writes are not part of the context generation.
+        query = compile_fts_query(con, draft_text, table="fts_chunks")
+        chunk_generation = all_generations(con, self.workspace_id, ("chunk_generation",))
+        key = (
+            self._generation,
+            chunk_generation,
+            query,
+            None if query_vec is None else tuple(query_vec),
+        )
+        if key != self._spans_key:
+            hits = retrieve_chunks(con, self.workspace_id, query=query, query_vec=query_vec)
+            self._spans = [h.to_span() for h in hits]
+            self._spans_key = key
+        return self._spans
+
+    def _score_sentence(self, ctx: WorkspaceContext, sentence: str) -> SentenceFacts:
+        doc = DraftDocument(sentence)
+        return SentenceFacts(
+            acronyms=doc.acronyms,
+            glossary_hits=[
+                (term, (start, end)) for start, end, term in doc.matches(ctx.glossary.matcher)
+            ],
+            confident=doc.first_confident(),
+            hedged=doc.first_hedged(),
+            conflicts=ctx.conflicts.scan(doc),
+        )
+
+    def _update(self, ctx: WorkspaceContext, draft_text: str) -> List[Tuple[int, SentenceFacts]]:
+        if ctx.generation != self._generation:
+            self._facts = {}
+            self._exposure = {}
+            self._generation = ctx.generation
+        facts: Dict[str, SentenceFacts] = {}
+        out: List[Tuple[int, SentenceFacts]] = []
+        scored = 0
+        self.last_spans = split_spans(draft_text)
+        for start, end in self.last_spans:
+            sentence = draft_text[start:end]
+            f = facts.get(sentence) or self._facts.get(sentence)
+            if f is None:
+                f = self._score_sentence(ctx, sentence)
+                scored += 1
+            facts[sentence] = f
+            out.append((start, f))
+        # Only sentences still present are kept, so the cache tracks the current draft.
+        self._facts = facts
+        self.last_scored = scored
+        self.last_reused = len(out) - scored
+        return out
+
+    def analyze(
+        self,
+        con,
+        draft_text: str,
+        recipients: List[str],
+        recipient_lenses: List[Lens],
+        query_vec: Optional[List[float]] = None,
+        mode: AnalysisMode = AnalysisMode.typing,
+        embedder=None,
+    ) -> AlignmentReport:
+        with self._lock:
+            return self._analyze(
+                con, draft_text, recipients, recipient_lenses, query_vec, mode, embedder
+            )
+
+    def _analyze(
+        self,
+        con,
+        draft_text: str,
+        recipients: List[str],
+        recipient_lenses: List[Lens],
+        query_vec: Optional[List[float]],
+        mode: AnalysisMode,
+        embedder,
+    ) -> AlignmentReport:
+        ctx = workspace_contexts.get(con, self.workspace_id)
+        sentences = self._update(ctx, draft_text)
+        query = compile_fts_query(con, draft_text)
+        capsules = self._retrieve(con, query, query_vec)
+        retrieved = {c.capsule_id for c in capsules}
+
+        # Same order as gap_findings: per recipient, acronym gaps and then glossary gaps.
+        gaps: List[GapFinding] = []
+        exposures = self._recipient_exposure(con, ctx, recipients)
+        for rid in recipients:
+            exposure = exposures[rid]
+            for offset, f in sentences:
+                for acr, span in f.acronyms:
+                    key = acr.lower()
+                    if exposure.get(key, 0.0) <= KNOWN_TERM_STRENGTH and key not in ctx.glossary:
+                        gaps.append(acronym_gap(acr, _shift(span, offset), rid))
+            for offset, f in sentences:
+                for term, span in f.glossary_hits:
+                    if exposure.get(term, 0.0) <= KNOWN_TERM_STRENGTH:
+                        definition = ctx.glossary.get(term, "")
+                        gaps.append(glossary_gap(term, definition, _shift(span, offset), rid))
+
+        draft_len = len(draft_text)
+        blockers: List[MismatchFinding] = []
+        expected = ctx.expected_evidence(recipient_lenses)
+        if expected is not None:
+            confident = _first([(o, f.confident) for o, f in sentences])
+            hedged = _first([(o, f.hedged) for o, f in sentences])
+            stated = evidence_level_from_flags(confident is not None, hedged is not None)
+            if EVID_ORDER[stated] < EVID_ORDER[expected]:
+                span = evidence_span(confident, hedged, draft_len)
+                blockers.append(evidence_mismatch(stated, expected, span))
+        scan = ConflictScan.combine(f.conflicts.shifted(o) for o, f in sentences)
+        blockers.extend(ctx.conflicts.findings(scan, allowed_capabilities=retrieved))
+
+        report = AlignmentReport(
+            mode=mode,
+            workspace_id=self.workspace_id,
+            recipients=recipients,
+            lens_target=recipient_lenses[0] if recipient_lenses else None,
+            blockers=blockers,
+            clarity_gaps=gaps,
+            rare_thoughts=rare_thoughts(ctx, draft_text, embedder, spans=self.last_spans),
+            context_capsule_ids=[c.capsule_id for c in capsules],
+            context_spans=self._context_spans(con, draft_text, query_vec),
+            policy_decision="silent",
+        )
+        report.policy_decision = decide_policy(report, ctx.policy)
+        return report
+
+
+Finding = Union[GapFinding, MismatchFinding]
+
+
+def finding_ids(report: AlignmentReport) -> Dict[str, Finding]:
+    """Stable ids for a report's findings, independent of where in the draft they sit.
+
+    Identical findings (same kind, recipient and text) are told apart by occurrence order,
+    so an edit earlier in the draft moves a finding instead of replacing it.
+    """
+    out: Dict[str, Finding] = {}
+    seen: Dict[str, int] = {}
+    findings: List[Finding] = [*report.blockers, *report.clarity_gaps]
+    for f in findings:
+        who = getattr(f, "recipient_actor_id", None) or ""
+        base = hashlib.blake2b(
+            f"{f.kind}|{who}|{f.description}".encode("utf-8"), digest_size=8
+        ).hexdigest()
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        out[f"{base}.{n}"] = f
+    return out
+
+
+def diff_findings(
+    previous: Dict[str, Finding], current: Dict[str, Finding]
+) -> Dict[str, Any]:
+    """Finding delta between two finding_ids() maps: added, removed ids, and moved spans."""
+    return {
+        "added": [
+            {"id": fid, "finding": f.model_dump(mode="json")}
+            for fid, f in current.items()
+            if fid not in previous
+        ],
+        "removed": [fid for fid in previous if fid not in current],
+        "moved": [
+            {"id": fid, "span": list(f.span)}
+            for fid, f in current.items()
+            if fid in previous and tuple(previous[fid].span) != tuple(f.span)
+        ],
+    }
+
+
+class TypingSessionRegistry:
+    """LRU of IncrementalAnalyzer objects keyed by (workspace_id, session_id)."""
+
+    def __init__(self, max_sessions: int = TYPING_SESSION_LIMIT) -> None:
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Tuple[str, str], IncrementalAnalyzer]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, workspace_id: str, session_id: str) -> IncrementalAnalyzer:
+        key = (workspace_id, session_id)
+        with self._lock:
+            analyzer = self._sessions.get(key)
+            if analyzer is None:
+                analyzer = IncrementalAnalyzer(workspace_id)
+                self._sessions[key] = analyzer
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return analyzer
+
+    def drop(self, workspace_id: str, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop((workspace_id, session_id), None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+typing_sessions = TypingSessionRegistry()
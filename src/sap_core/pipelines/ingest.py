@@ -2,11 +2,12 @@ from __future__ import annotations
 
 from datetime import datetime
 import json
-from typing import Iterable, List, Tuple
+from typing import Iterable, List, Optional, Tuple
 
 import ulid
 
 from sap_core.domain.models import ArtifactIngestRequest, ArtifactIngestResponse
+from sap_core.retrieval.vector_index import add_embedding
 
 
 def _chunk_text(text: str, max_len: int = 1000, overlap: int = 150) -> List[Tuple[int, int, str]]:
@@ -34,7 +35,8 @@ def _ensure_workspace(con, workspace_id: str) -> None:
         raise ValueError(f"workspace_id not found: {workspace_id}")
 
 
-def ingest_artifact(con, req: ArtifactIngestRequest) -> ArtifactIngestResponse:
+def ingest_artifact(con, req: ArtifactIngestRequest, embedder=None) -> ArtifactIngestResponse:
+    """Store an artifact and its chunks; with an `embedder`, chunk vectors are stored too."""
     _ensure_workspace(con, req.workspace_id)
 
     now = datetime.utcnow().isoformat()
@@ -59,8 +61,10 @@ def ingest_artifact(con, req: ArtifactIngestRequest) -> ArtifactIngestResponse:
     )
 
     chunks = _chunk_text(req.body)
+    chunk_ids: List[str] = []
     for start, end, text in chunks:
         chunk_id = str(ulid.new())
+        chunk_ids.append(chunk_id)
         con.execute(
             """
             INSERT INTO chunk(chunk_id, artifact_id, workspace_id, start_char, end_char, text, created_at)
@@ -73,8 +77,16 @@ def ingest_artifact(con, req: ArtifactIngestRequest) -> ArtifactIngestResponse:
             (text, chunk_id, req.workspace_id),
         )
 
+    embeddings_created = 0
+    if embedder is not None and chunks:
+        vecs = embedder.embed([text for _start, _end, text in chunks])
+        model_name: Optional[str] = getattr(embedder, "model_name", None)
+        for chunk_id, vec in zip(chunk_ids, vecs):
+            add_embedding(con, req.workspace_id, "chunk", chunk_id, vec, model_name=model_name)
+            embeddings_created += 1
+
     return ArtifactIngestResponse(
         artifact_id=artifact_id,
         chunks_created=len(chunks),
-        embeddings_created=0,
+        embeddings_created=embeddings_created,
     )
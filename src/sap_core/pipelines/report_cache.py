@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sap_core.domain.models import AlignmentReport, AnalysisMode, Lens
+from sap_core.pipelines.draft_analyze import analysis_stages
+from sap_core.pipelines.workspace_context import workspace_contexts
+from sap_core.scoring.scoring import KNOWN_TERM_STRENGTH
+from sap_store.sqlite.exposure import load_term_exposure
+from sap_store.sqlite.state import REPORT_GENERATION_COLUMNS, all_generations
+
+REPORT_CACHE_SIZE = int(os.environ.get("SAP_REPORT_CACHE_SIZE", "512"))
+# Also keep reports in the report_cache table so they survive restarts.
+REPORT_CACHE_PERSIST = os.environ.get("SAP_REPORT_CACHE_PERSIST", "0") == "1"
+# Persisted reports older than this are ignored and pruned.
+REPORT_CACHE_MAX_AGE_SECONDS = float(os.environ.get("SAP_REPORT_CACHE_MAX_AGE_SECONDS", "86400"))
+
+
+def _embedder_name(embedder) -> str:
+    if embedder is None:
+        return ""
+    return getattr(embedder, "model_name", type(embedder).__name__)
+
+
+def report_key(
+    generation: Tuple[int, ...],
+    draft_text: str,
+    recipients: Iterable[str],
+    recipient_lenses: Iterable[Lens],
+    mode: AnalysisMode,
+    known_terms: Dict[str, List[str]],
+    embedder_name: str = "",
+) -> str:
+    """Content address of an analysis: hash of every input its findings depend on.
+
+    Lenses keep their order (the first one is the report's lens target); recipients do not.
+    `known_terms` lists, per recipient, the terms above KNOWN_TERM_STRENGTH, so exposure
+    writes or decay only change the key when they flip a gap.
+    """
+    payload = json.dumps(
+        {
+            "generation": list(generation),
+            "draft": hashlib.blake2b(draft_text.encode("utf-8"), digest_size=16).hexdigest(),
+            "recipients": sorted(recipients),
+            "lenses": [lens.value for lens in recipient_lenses],
+            "mode": mode.value,
+            "known": {rid: sorted(terms) for rid, terms in sorted(known_terms.items())},
+            "embedder": embedder_name,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ReportCache:
+    """Per-process LRU of AlignmentReports by report_key, optionally backed by SQLite.
+
+    Keys already encode the workspace generations, so entries are never invalidated, only
+    evicted; a write to the workspace simply makes new requests compute new keys. Returned
+    reports are shared between callers: treat them as read-only.
+    """
+
+    def __init__(
+        self,
+        max_size: int = REPORT_CACHE_SIZE,
+        persist: bool = REPORT_CACHE_PERSIST,
+        max_age_seconds: float = REPORT_CACHE_MAX_AGE_SECONDS,
+    ) -> None:
+        self.max_size = max_size
+        self.persist = persist
+        self.max_age = timedelta(seconds=max_age_seconds)
+        self._reports: "OrderedDict[str, AlignmentReport]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.persisted_hits = 0
+        self.misses = 0
+
+    def get(self, con, key: str) -> Optional[AlignmentReport]:
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                self._reports.move_to_end(key)
+                self.hits += 1
+                return report
+        if self.persist:
+            row = con.execute(
+                "SELECT report_json FROM report_cache WHERE cache_key=? AND created_at >= ?",
+                (key, (datetime.utcnow() - self.max_age).isoformat()),
+            ).fetchone()
+            if row is not None:
+                report = AlignmentReport.model_validate_json(row["report_json"])
+                self._store(key, report)
+                self.persisted_hits += 1
+                return report
+        self.misses += 1
+        return None
+
+    def put(self, con, key: str, report: AlignmentReport) -> None:
+        self._store(key, report)
+        if self.persist:
+            now = datetime.utcnow()
+            con.execute(
+                "DELETE FROM report_cache WHERE created_at < ?", ((now - self.max_age).isoformat(),)
+            )
+            con.execute(
+                """
+                INSERT OR REPLACE INTO report_cache(cache_key, workspace_id, report_json, created_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (key, report.workspace_id, report.model_dump_json(), now.isoformat()),
+            )
+
+    def _store(self, key: str, report: AlignmentReport) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._reports[key] = report
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.max_size:
+                self._reports.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reports.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._reports),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "persisted_hits": self.persisted_hits,
+            "misses": self.misses,
+        }
+
+
+report_cache = ReportCache()
+
+
+def cached_analyze_draft(
+    con,
+    workspace_id: str,
+    draft_text: str,
+    recipients: List[str],
+    recipient_lenses: List[Lens],
+    mode: AnalysisMode,
+    embedder=None,
+    if_none_match: Iterable[str] = (),
+) -> Tuple[str, Optional[AlignmentReport]]:
+    """(key, report) for a one-shot analysis, served from report_cache when possible.
+
+    The report is None when the key is in `if_none_match`: the caller already holds it.
+    """
+    policy = workspace_contexts.get(con, workspace_id).policy
+    exposure = load_term_exposure(
+        con, workspace_id, recipients, half_life_days=policy.exposure_half_life_days
+    )
+    known = {
+        rid: [term for term, strength in terms.items() if strength > KNOWN_TERM_STRENGTH]
+        for rid, terms in exposure.items()
+    }
+    key = report_key(
+        all_generations(con, workspace_id, REPORT_GENERATION_COLUMNS),
+        draft_text,
+        recipients,
+        recipient_lenses,
+        mode,
+        known,
+        _embedder_name(embedder),
+    )
+    if key in set(if_none_match):
+        return key, None
+    report = report_cache.get(con, key)
+    if report is None:
+        for _stage, report in analysis_stages(
+            con,
+            workspace_id,
+            draft_text,
+            recipients,
+            recipient_lenses,
+            mode,
+            embedder=embedder,
+            exposure=exposure,
+        ):
+            pass
+        report_cache.put(con, key, report)
+    return key, report
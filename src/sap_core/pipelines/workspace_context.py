@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import json
+import os
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from sap_core.domain.models import Capsule, CapsuleType, EvidenceLevel, Lens, PolicyConfig
+from sap_core.retrieval.retrieve import CapsuleFilter, load_capsules, recent_capsule_ids
+from sap_core.scoring.scoring import (
+    EVID_ORDER,
+    ConflictIndex,
+    GlossaryIndex,
+    build_glossary_index,
+)
+from sap_store.sqlite.centroids import FACET_ALL, FACET_TYPE, FacetKey, load_centroids
+from sap_store.sqlite.state import all_generations
+
+CONTEXT_CACHE_SIZE = int(os.environ.get("SAP_CONTEXT_CACHE_SIZE", "256"))
+# Comma-separated workspace ids compiled when the API starts.
+WARM_WORKSPACES = [w for w in os.environ.get("SAP_WARM_WORKSPACES", "").split(",") if w.strip()]
+# Upper bound on capsules of each precompiled type (glossary, constraint, capability, goal).
+CONTEXT_MAX_CAPSULES = int(os.environ.get("SAP_CONTEXT_MAX_CAPSULES", "5000"))
+
+
+def load_policy(con, workspace_id: str) -> PolicyConfig:
+    row = con.execute("SELECT policy_json FROM policy WHERE workspace_id=?", (workspace_id,)).fetchone()
+    if not row:
+        return PolicyConfig(workspace_id=workspace_id)
+    return PolicyConfig(**json.loads(row["policy_json"]))
+
+
+@dataclass
+class WorkspaceContext:
+    """Everything draft analysis needs about a workspace that does not depend on the draft.
+
+    Built once per workspace write generation (capsules, embeddings, policy) and shared
+    by every analysis until one of them moves. Treat it as read-only.
+    """
+
+    workspace_id: str
+    generation: Tuple[int, ...]
+    policy: PolicyConfig
+    glossary: GlossaryIndex
+    constraints: List[Capsule] = field(default_factory=list)
+    capabilities: List[Capsule] = field(default_factory=list)
+    conflicts: ConflictIndex = field(default_factory=lambda: ConflictIndex([], []))
+    # Unit capsule centroids by (facet, value): ("all", ""), ("type", t), ("lens", l),
+    # ("circle", c); read from the persisted running sums, so building them is O(facets).
+    centroids: Dict[FacetKey, np.ndarray] = field(default_factory=dict)
+    centroid_dim: Optional[int] = None
+
+    def centroid(self, facet: str, value: str = "") -> Optional[np.ndarray]:
+        return self.centroids.get((facet, value))
+
+    @property
+    def group_centroid(self) -> Optional[np.ndarray]:
+        return self.centroid(FACET_ALL)
+
+    @property
+    def goal_centroid(self) -> Optional[np.ndarray]:
+        return self.centroid(FACET_TYPE, CapsuleType.goal.value)
+
+    def expected_evidence(self, lenses: Iterable[Lens]) -> Optional[EvidenceLevel]:
+        """Strictest evidence level the policy expects for any of the recipient lenses."""
+        levels = [self.policy.expected_evidence_by_lens.get(lens) for lens in lenses]
+        levels = [lvl for lvl in levels if lvl is not None]
+        return max(levels, key=lambda lvl: EVID_ORDER[lvl]) if levels else None
+
+
+def _capsules_of_type(con, workspace_id: str, type: CapsuleType) -> List[Capsule]:
+    ids = recent_capsule_ids(
+        con, workspace_id, limit=CONTEXT_MAX_CAPSULES, filters=CapsuleFilter(type=type)
+    )
+    # Up to CONTEXT_MAX_CAPSULES per type would churn the shared capsule cache, and the
+    # context keeps its own copies for the whole generation anyway.
+    return load_capsules(con, workspace_id, ids, use_cache=False)
+
+
+def build_workspace_context(
+    con, workspace_id: str, generation: Optional[Tuple[int, ...]] = None
+) -> WorkspaceContext:
+    if generation is None:
+        generation = all_generations(con, workspace_id)
+    glossary = build_glossary_index(_capsules_of_type(con, workspace_id, CapsuleType.glossary))
+    glossary.matcher  # compile now rather than on the first analysis
+    constraints = _capsules_of_type(con, workspace_id, CapsuleType.constraint)
+    capabilities = _capsules_of_type(con, workspace_id, CapsuleType.capability)
+    centroid_dim, centroids = load_centroids(con, workspace_id, "capsule")
+    return WorkspaceContext(
+        workspace_id=workspace_id,
+        generation=generation,
+        policy=load_policy(con, workspace_id),
+        glossary=glossary,
+        constraints=constraints,
+        capabilities=capabilities,
+        conflicts=ConflictIndex(constraints, capabilities),
+        centroids=centroids,
+        centroid_dim=centroid_dim,
+    )
+
+
+class WorkspaceContextCache:
+    """Per-process LRU of WorkspaceContext objects, validated by workspace generations."""
+
+    def __init__(self, max_size: int = CONTEXT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._contexts: "OrderedDict[str, WorkspaceContext]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, con, workspace_id: str) -> WorkspaceContext:
+        generation = all_generations(con, workspace_id)
+        with self._lock:
+            ctx = self._contexts.get(workspace_id)
+            if ctx is not None and ctx.generation == generation:
+                self._contexts.move_to_end(workspace_id)
+                self.hits += 1
+                return ctx
+            self.misses += 1
+        ctx = build_workspace_context(con, workspace_id, generation)
+        self._store(ctx)
+        return ctx
+
+    def _store(self, ctx: WorkspaceContext) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._contexts[ctx.workspace_id] = ctx
+            self._contexts.move_to_end(ctx.workspace_id)
+            while len(self._contexts) > self.max_size:
+                self._contexts.popitem(last=False)
+
+    def warm(self, con, workspace_ids: Iterable[str]) -> int:
+        """Compile contexts ahead of the first analysis; returns how many were built."""
+        built = 0
+        for workspace_id in workspace_ids:
+            self._store(build_workspace_context(con, workspace_id.strip()))
+            built += 1
+        return built
+
+    def invalidate(self, workspace_id: Optional[str] = None) -> None:
+        with self._lock:
+            if workspace_id is None:
+                self._contexts.clear()
+            else:
+                self._contexts.pop(workspace_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._contexts),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+workspace_contexts = WorkspaceContextCache()
+
+
+def warm_workspace_contexts(con, workspace_ids: Optional[Iterable[str]] = None) -> int:
+    """Warm the process-wide cache for `workspace_ids` (default: SAP_WARM_WORKSPACES)."""
+    return workspace_contexts.warm(con, WARM_WORKSPACES if workspace_ids is None else workspace_ids)
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from sap_core.retrieval.vector_index import (
+    VectorIndex,
+    reconcile_snapshot,
+    settled,
+    top_k_indices,
+)
+from sap_store.sqlite.db import DEFAULT_DB_PATH, vector_dir
+from sap_store.sqlite.embeddings import (
+    count_embedding_owners,
+    dominant_dim,
+    load_embedding_rows,
+)
+from sap_store.sqlite.jobs import request_job
+from sap_store.sqlite.state import embedding_generation
+
+ANN_REBUILD_JOB = "ann_rebuild"
+
+# Exact scans are used below this many vectors; above it an IVF index is built in the
+# background and used once it exists.
+ANN_MIN_VECTORS = int(os.environ.get("SAP_ANN_MIN_VECTORS", "50000"))
+ANN_NPROBE = int(os.environ.get("SAP_ANN_NPROBE", "8"))
+# 0 means "pick from the corpus size" (about 4 * sqrt(n) lists).
+ANN_NLIST = int(os.environ.get("SAP_ANN_NLIST", "0"))
+# Schedule a rebuild once post-build inserts/deletes exceed this fraction of the index.
+ANN_REBUILD_DRIFT = float(os.environ.get("SAP_ANN_REBUILD_DRIFT", "0.2"))
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True) + 1e-9
+    return (mat / norms).astype(np.float32, copy=False)
+
+
+def auto_nlist(n: int) -> int:
+    return max(1, min(n, int(4 * np.sqrt(n))))
+
+
+class IVFIndex:
+    """Inverted-file index: k-means centroids plus vectors grouped by nearest centroid.
+
+    Rows are stored sorted by list so each probed list is a contiguous slice
+    `vecs[offsets[l]:offsets[l + 1]]`. Writes after the build land in an exact `extra`
+    VectorIndex and tombstones, until a rebuild folds them back in.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        vecs: np.ndarray,
+        ids: Sequence[str],
+        offsets: np.ndarray,
+        max_rowid: int = 0,
+    ):
+        self.centroids = centroids
+        self.vecs = vecs
+        self.ids = list(ids)
+        self.offsets = offsets
+        self.max_rowid = max_rowid
+        self.dim = int(centroids.shape[1])
+        self._row = {oid: i for i, oid in enumerate(self.ids)}
+        self._alive = np.ones(len(self.ids), dtype=bool)
+        self.extra = VectorIndex(self.dim)
+        self.rebuild_requested = False
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + len(self.extra)
+
+    @property
+    def drift(self) -> float:
+        changed = len(self.extra) + int((~self._alive).sum())
+        return changed / max(1, len(self.ids))
+
+    def add(self, owner_id: str, vec: Sequence[float]) -> None:
+        self.tombstone([owner_id])
+        self.extra.add(owner_id, vec)
+
+    def live_ids(self) -> List[str]:
+        alive = [oid for oid, ok in zip(self.ids, self._alive) if ok]
+        return alive + self.extra.live_ids()
+
+    def tombstone(self, owner_ids: Sequence[str]) -> None:
+        for oid in owner_ids:
+            row = self._row.get(oid)
+            if row is not None:
+                self._alive[row] = False
+        self.extra.remove(owner_ids)
+
+    def search(
+        self,
+        query_vec: Sequence[float],
+        k: int,
+        nprobe: int = ANN_NPROBE,
+    ) -> List[Tuple[str, float]]:
+        if k <= 0:
+            return []
+        q = _normalize(np.asarray(query_vec, dtype=np.float32).reshape(-1))
+        hits: List[Tuple[str, float]] = []
+        if self.ids:
+            nprobe = max(1, min(nprobe, self.nlist))
+            probe = top_k_indices(self.centroids @ q, nprobe)
+            rows = np.concatenate(
+                [np.arange(self.offsets[l], self.offsets[l + 1]) for l in probe]
+            )
+            rows = rows[self._alive[rows]]
+            if rows.size:
+                scores = self.vecs[rows] @ q
+                top = top_k_indices(scores, k)
+                hits = [(self.ids[rows[i]], float(scores[i])) for i in top]
+        if len(self.extra):
+            hits.extend(self.extra.search(q, k))
+            hits.sort(key=lambda x: x[1], reverse=True)
+        return hits[:k]
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                vecs=self.vecs,
+                ids=np.array(self.ids, dtype=str),
+                offsets=self.offsets,
+                max_rowid=np.array(self.max_rowid, dtype=np.int64),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                centroids=data["centroids"],
+                vecs=data["vecs"],
+                ids=data["ids"].tolist(),
+                offsets=data["offsets"],
+                max_rowid=int(data["max_rowid"]),
+            )
+
+
+def build_ivf(
+    ids: Sequence[str],
+    mat: np.ndarray,
+    nlist: Optional[int] = None,
+    max_rowid: int = 0,
+    seed: int = 0,
+) -> IVFIndex:
+    vecs = _normalize(np.asarray(mat, dtype=np.float32))
+    n = vecs.shape[0]
+    if n == 0:
+        return IVFIndex(
+            centroids=np.zeros((1, mat.shape[1]), dtype=np.float32),
+            vecs=vecs,
+            ids=[],
+            offsets=np.zeros(2, dtype=np.int64),
+            max_rowid=max_rowid,
+        )
+
+    nlist = min(n, nlist or auto_nlist(n))
+    km = MiniBatchKMeans(
+        n_clusters=nlist,
+        random_state=seed,
+        n_init=3,
+        batch_size=max(1024, 4 * nlist),
+    )
+    km.fit(vecs)
+    centroids = _normalize(km.cluster_centers_.astype(np.float32))
+    assign = np.argmax(vecs @ centroids.T, axis=1)
+    order = np.argsort(assign, kind="stable")
+    counts = np.bincount(assign, minlength=nlist)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return IVFIndex(
+        centroids=centroids,
+        vecs=np.ascontiguousarray(vecs[order]),
+        ids=[ids[i] for i in order],
+        offsets=offsets,
+        max_rowid=max_rowid,
+    )
+
+
+def ann_index_path(workspace_id: str, owner_type: str, db_path: Path = DEFAULT_DB_PATH) -> Path:
+    return vector_dir(db_path) / f"{workspace_id}.{owner_type}.ivf.npz"
+
+
+def rebuild_ann_index(
+    con,
+    workspace_id: str,
+    owner_type: str = "capsule",
+    dim: Optional[int] = None,
+    nlist: Optional[int] = None,
+) -> IVFIndex:
+    dim = dim or dominant_dim(con, workspace_id, owner_type)
+    if dim is None:
+        raise ValueError(f"no embeddings for workspace {workspace_id}")
+    ids, mat, max_rowid = load_embedding_rows(con, workspace_id, owner_type, dim)
+    index = build_ivf(ids, mat, nlist=nlist or ANN_NLIST or None, max_rowid=max_rowid)
+    index.save(ann_index_path(workspace_id, owner_type))
+    ann_indexes.invalidate(workspace_id)
+    return index
+
+
+class AnnIndexRegistry:
+    """Loads persisted IVF indexes lazily and reloads them when the file changes on disk.
+
+    Committed writes since the snapshot (or since the last search) are folded in whenever
+    the workspace's embedding generation moves.
+    """
+
+    def __init__(self) -> None:
+        self._indexes: Dict[Tuple[str, str], Tuple[float, int, IVFIndex]] = {}
+        self._sizes: Dict[Tuple[str, str, int], Tuple[int, int]] = {}
+        self._lock = Lock()
+
+    def corpus_size(self, con, workspace_id: str, owner_type: str, dim: int) -> int:
+        """Owners with a `dim` vector, counted in SQL once per embedding generation."""
+        key = (workspace_id, owner_type, dim)
+        generation = embedding_generation(con, workspace_id)
+        cached = self._sizes.get(key)
+        if cached and cached[0] == generation:
+            return cached[1]
+        n = count_embedding_owners(con, workspace_id, owner_type, dim)
+        with self._lock:
+            self._sizes[key] = (generation, n)
+        return n
+
+    def get(self, con, workspace_id: str, owner_type: str, dim: int) -> Optional[IVFIndex]:
+        path = ann_index_path(workspace_id, owner_type)
+        if not path.exists():
+            return None
+        mtime = path.stat().st_mtime
+        generation = embedding_generation(con, workspace_id)
+        key = (workspace_id, owner_type)
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached and cached[0] == mtime:
+                index = cached[2]
+                if cached[1] != generation and settled(con):
+                    reconcile_snapshot(con, index, workspace_id, owner_type)
+                    self._indexes[key] = (mtime, generation, index)
+            else:
+                index = IVFIndex.load(path)
+                reconcile_snapshot(con, index, workspace_id, owner_type)
+                if settled(con):
+                    self._indexes[key] = (mtime, generation, index)
+        return index if index.dim == dim else None
+
+    def invalidate(self, workspace_id: Optional[str] = None) -> None:
+        with self._lock:
+            if workspace_id is None:
+                self._indexes.clear()
+                return
+            for key in [k for k in self._indexes if k[0] == workspace_id]:
+                del self._indexes[key]
+
+
+ann_indexes = AnnIndexRegistry()
+
+
+def request_ann_rebuild(con, workspace_id: str, owner_type: str, dim: int) -> Optional[str]:
+    """Best-effort: None on read-only connections or when the database is busy."""
+    return request_job(
+        con,
+        workspace_id,
+        ANN_REBUILD_JOB,
+        {"owner_type": owner_type, "dim": dim},
+        priority=8,
+    )
+
+
+def ann_search(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    query_vec: np.ndarray,
+    limit: int,
+    nprobe: Optional[int] = None,
+    read_only: bool = False,
+) -> Optional[List[Tuple[str, float]]]:
+    """Search the IVF index if one exists, scheduling rebuilds as it drifts.
+
+    Returns None when the caller should fall back to the exact index. With `read_only`,
+    no rebuild is requested.
+    """
+    dim = int(query_vec.shape[0])
+    index = ann_indexes.get(con, workspace_id, owner_type, dim)
+    if index is None:
+        if read_only:
+            return None
+        if ann_indexes.corpus_size(con, workspace_id, owner_type, dim) >= ANN_MIN_VECTORS:
+            request_ann_rebuild(con, workspace_id, owner_type, dim)
+        return None
+    if index.drift > ANN_REBUILD_DRIFT and not index.rebuild_requested and not read_only:
+        index.rebuild_requested = (
+            request_ann_rebuild(con, workspace_id, owner_type, dim) is not None
+        )
+    return index.search(query_vec, limit, nprobe=nprobe or ANN_NPROBE)
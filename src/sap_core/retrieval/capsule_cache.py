@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import os
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sap_core.domain.models import Capsule
+
+CAPSULE_CACHE_SIZE = int(os.environ.get("SAP_CAPSULE_CACHE_SIZE", "4096"))
+
+
+class CapsuleCache:
+    """Bounded LRU of parsed Capsule models keyed by capsule_id.
+
+    Each entry remembers the workspace capsule generation it was loaded under and is only
+    served while that generation is current, so any capsule write in the workspace (from
+    any process) invalidates it. Cached models are shared: treat them as read-only.
+    """
+
+    def __init__(self, max_size: int = CAPSULE_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[str, int, Capsule]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(
+        self, workspace_id: str, ids: Iterable[str], generation: int
+    ) -> Dict[str, Capsule]:
+        found: Dict[str, Capsule] = {}
+        with self._lock:
+            for cid in ids:
+                entry = self._entries.get(cid)
+                if entry is None or entry[0] != workspace_id:
+                    self.misses += 1
+                    continue
+                if entry[1] != generation:
+                    del self._entries[cid]
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(cid)
+                found[cid] = entry[2]
+                self.hits += 1
+        return found
+
+    def put_many(self, workspace_id: str, capsules: List[Capsule], generation: int) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for c in capsules:
+                self._entries[c.capsule_id] = (workspace_id, generation, c)
+                self._entries.move_to_end(c.capsule_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, workspace_id: Optional[str] = None) -> None:
+        with self._lock:
+            if workspace_id is None:
+                self._entries.clear()
+                return
+            for cid in [k for k, v in self._entries.items() if v[0] == workspace_id]:
+                del self._entries[cid]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+capsule_cache = CapsuleCache()
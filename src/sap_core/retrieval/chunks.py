@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sap_core.domain.models import SourceSpan
+from sap_core.retrieval.retrieve import rrf_fuse, vector_top_owners
+
+# Raw artifact text added next to the capsule bundle is capped by characters, not chunks,
+# so analysis cost stays flat however long the matching messages are.
+CHUNK_CONTEXT_CHARS = int(os.environ.get("SAP_CHUNK_CONTEXT_CHARS", "2000"))
+CHUNK_CONTEXT_SPANS = 8
+
+_QUOTED_TERM_RE = re.compile(r'"((?:[^"]|"")+)"(\*?)')
+
+
+@dataclass
+class ChunkHit:
+    chunk_id: str
+    artifact_id: str
+    start_char: int
+    end_char: int
+    text: str
+    score: float
+    sources: Dict[str, float] = field(default_factory=dict)
+
+    def to_span(self) -> SourceSpan:
+        return SourceSpan(
+            artifact_id=self.artifact_id,
+            chunk_id=self.chunk_id,
+            start_char=self.start_char,
+            end_char=self.end_char,
+        )
+
+
+def fts_chunks_scored(con, workspace_id: str, q: str, limit: int = 30) -> List[Tuple[str, float]]:
+    """FTS hits over ingested chunks best first, scored as -bm25()."""
+    rows = con.execute(
+        """
+        SELECT chunk_id, bm25(fts_chunks) AS rank
+        FROM fts_chunks
+        WHERE fts_chunks MATCH ? AND workspace_id=?
+        ORDER BY rank
+        LIMIT ?
+        """,
+        (q, workspace_id, limit),
+    ).fetchall()
+    return [(r["chunk_id"], -float(r["rank"])) for r in rows]
+
+
+def _has_chunk_embeddings(con, workspace_id: str) -> bool:
+    row = con.execute(
+        "SELECT 1 FROM embedding WHERE workspace_id=? AND owner_type='chunk' LIMIT 1",
+        (workspace_id,),
+    ).fetchone()
+    return row is not None
+
+
+def _load_chunks(con, workspace_id: str, ids: List[str]) -> Dict[str, Tuple[str, int, int, str]]:
+    if not ids:
+        return {}
+    qmarks = ",".join("?" for _ in ids)
+    rows = con.execute(
+        f"""
+        SELECT chunk_id, artifact_id, start_char, end_char, text FROM chunk
+        WHERE workspace_id=? AND chunk_id IN ({qmarks})
+        """,
+        [workspace_id, *ids],
+    ).fetchall()
+    return {
+        r["chunk_id"]: (r["artifact_id"], int(r["start_char"]), int(r["end_char"]), r["text"])
+        for r in rows
+    }
+
+
+def query_terms(query: str) -> List[str]:
+    """Plain terms of a compiled FTS query (see sap_core.retrieval.query), prefixes included."""
+    return [m.group(1).replace('""', '"').lower() for m in _QUOTED_TERM_RE.finditer(query)]
+
+
+def _snippet_window(text: str, terms: List[str], width: int) -> Tuple[int, int]:
+    """Chunk-local [start, end) of at most `width` chars around the first query-term match."""
+    if len(text) <= width:
+        return 0, len(text)
+    lowered = text.lower()
+    positions = [p for p in (lowered.find(t) for t in terms) if p >= 0]
+    center = min(positions) if positions else 0
+    start = max(0, min(center - width // 4, len(text) - width))
+    return start, start + width
+
+
+def retrieve_chunks(
+    con,
+    workspace_id: str,
+    query: str,
+    query_vec: Optional[List[float]] = None,
+    limit: int = CHUNK_CONTEXT_SPANS,
+    char_budget: int = CHUNK_CONTEXT_CHARS,
+    fts_limit: int = 30,
+    read_only: bool = False,
+) -> List[ChunkHit]:
+    """Best chunk per artifact, fused from bm25 and (if chunk embeddings exist) cosine hits.
+
+    Hits are trimmed to a snippet around the first matched term so the sum of their lengths
+    stays within `char_budget`; start_char/end_char are offsets into the artifact body.
+    """
+    if limit <= 0 or char_budget <= 0:
+        return []
+    ranked_lists: Dict[str, List[Tuple[str, float]]] = {}
+    if query.strip():
+        ranked_lists["fts"] = fts_chunks_scored(con, workspace_id, query, limit=fts_limit)
+    if query_vec is not None and _has_chunk_embeddings(con, workspace_id):
+        ranked_lists["vector"] = vector_top_owners(
+            con, workspace_id, "chunk", query_vec, limit=fts_limit, read_only=read_only
+        )
+    fused = rrf_fuse(ranked_lists)
+    if not fused:
+        return []
+
+    chunks = _load_chunks(con, workspace_id, [cid for cid, _score, _raw in fused])
+    terms = query_terms(query)
+    per_span = max(1, char_budget // limit)
+    seen_artifacts = set()
+    out: List[ChunkHit] = []
+    remaining = char_budget
+    for cid, score, sources in fused:
+        chunk = chunks.get(cid)
+        if chunk is None:
+            continue
+        artifact_id, start_char, _end_char, text = chunk
+        if artifact_id in seen_artifacts:
+            continue
+        seen_artifacts.add(artifact_id)
+        # Earlier (better) hits may take up to half of what is left; later ones taper off.
+        lo, hi = _snippet_window(text, terms, min(remaining, max(per_span, remaining // 2)))
+        out.append(
+            ChunkHit(
+                chunk_id=cid,
+                artifact_id=artifact_id,
+                start_char=start_char + lo,
+                end_char=start_char + hi,
+                text=text[lo:hi],
+                score=score,
+                sources=sources,
+            )
+        )
+        remaining -= hi - lo
+        if len(out) >= limit or remaining <= 0:
+            break
+    return out
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from sap_core.retrieval.vector_index import (
+    VectorIndex,
+    reconcile_snapshot,
+    settled,
+    top_k_indices,
+    vector_indexes,
+)
+from sap_store.sqlite.db import DEFAULT_DB_PATH, vector_dir
+from sap_store.sqlite.embeddings import (
+    dominant_dim,
+    load_embedding_rows,
+    load_embeddings_for_owners,
+)
+from sap_store.sqlite.jobs import request_job
+from sap_store.sqlite.state import embedding_generation
+
+QUANT_REBUILD_JOB = "quant_rebuild"
+
+# "none" (exact float scan), "int8" (scalar, per-vector scale) or "pq" (product quantization).
+QUANT_MODE = os.environ.get("SAP_VECTOR_QUANT", "none")
+# Candidates re-ranked with exact float vectors = k * SAP_QUANT_RERANK.
+QUANT_RERANK = int(os.environ.get("SAP_QUANT_RERANK", "4"))
+# PQ sub-vector width; 384-dim MiniLM vectors become 48 one-byte codes.
+PQ_SUBVECTOR_DIM = int(os.environ.get("SAP_PQ_SUBVECTOR_DIM", "8"))
+PQ_TRAIN_SAMPLE = 20000
+_SCORE_BLOCK = 65536
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True) + 1e-9
+    return (mat / norms).astype(np.float32, copy=False)
+
+
+class Int8Codec:
+    """Symmetric scalar quantization: x ~= codes * scale, one float scale per vector."""
+
+    kind = "int8"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scales = np.abs(mat).max(axis=1) / 127.0 + 1e-12
+        codes = np.rint(mat / scales[:, None]).clip(-127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def scores(self, codes: np.ndarray, scales: np.ndarray, q: np.ndarray) -> np.ndarray:
+        # Asymmetric: the query stays float, only the stored side is quantized.
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], _SCORE_BLOCK):
+            block = codes[start:start + _SCORE_BLOCK].astype(np.float32)
+            out[start:start + _SCORE_BLOCK] = block @ q
+        return out * scales
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+
+class PQCodec:
+    """Product quantization: each sub-vector is replaced by the id of its nearest centroid.
+
+    Scoring uses asymmetric distance computation: one (m, ksub) table of query/centroid
+    inner products per query, then a gather-and-sum over the uint8 codes.
+    """
+
+    kind = "pq"
+
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = codebooks.astype(np.float32)
+        self.m, self.ksub, self.dsub = codebooks.shape
+        self.dim = self.m * self.dsub
+
+    @classmethod
+    def train(cls, mat: np.ndarray, dsub: int = PQ_SUBVECTOR_DIM, seed: int = 0) -> "PQCodec":
+        n, dim = mat.shape
+        if dim % dsub:
+            raise ValueError(f"dim {dim} is not divisible by sub-vector width {dsub}")
+        m = dim // dsub
+        ksub = max(1, min(256, n))
+        rng = np.random.default_rng(seed)
+        sample = mat[rng.choice(n, size=min(n, PQ_TRAIN_SAMPLE), replace=False)]
+        codebooks = np.zeros((m, ksub, dsub), dtype=np.float32)
+        for j in range(m):
+            km = MiniBatchKMeans(n_clusters=ksub, random_state=seed, n_init=1, batch_size=4096)
+            km.fit(sample[:, j * dsub:(j + 1) * dsub])
+            codebooks[j] = km.cluster_centers_
+        return cls(codebooks)
+
+    def encode(self, mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n = mat.shape[0]
+        codes = np.empty((n, self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = mat[:, j * self.dsub:(j + 1) * self.dsub]
+            cb = self.codebooks[j]
+            dists = (sub * sub).sum(1)[:, None] - 2 * sub @ cb.T + (cb * cb).sum(1)[None, :]
+            codes[:, j] = np.argmin(dists, axis=1)
+        return codes, np.ones(n, dtype=np.float32)
+
+    def scores(self, codes: np.ndarray, scales: np.ndarray, q: np.ndarray) -> np.ndarray:
+        lut = np.einsum("mkd,md->mk", self.codebooks, q.reshape(self.m, self.dsub))
+        return lut[np.arange(self.m), codes].sum(axis=1)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+
+class QuantizedIndex:
+    """Compressed codes for every vector, scored with ADC and re-ranked with exact floats."""
+
+    def __init__(
+        self,
+        codec,
+        codes: np.ndarray,
+        scales: np.ndarray,
+        ids: Sequence[str],
+        max_rowid: int = 0,
+    ):
+        self.codec = codec
+        self.dim = codec.dim
+        self.codes = codes
+        self.scales = scales
+        self.ids = list(ids)
+        self.max_rowid = max_rowid
+        self._row = {oid: i for i, oid in enumerate(self.ids)}
+        self._alive = np.ones(len(self.ids), dtype=bool)
+        self.extra = VectorIndex(self.dim)
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + len(self.extra)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def add(self, owner_id: str, vec: Sequence[float]) -> None:
+        self.tombstone([owner_id])
+        self.extra.add(owner_id, vec)
+
+    def live_ids(self) -> List[str]:
+        alive = [oid for oid, ok in zip(self.ids, self._alive) if ok]
+        return alive + self.extra.live_ids()
+
+    def tombstone(self, owner_ids: Sequence[str]) -> None:
+        for oid in owner_ids:
+            row = self._row.get(oid)
+            if row is not None:
+                self._alive[row] = False
+        self.extra.remove(owner_ids)
+
+    def candidates(self, query_vec: Sequence[float], k: int) -> List[str]:
+        q = _normalize(np.asarray(query_vec, dtype=np.float32).reshape(-1))
+        out: List[str] = []
+        if self.ids:
+            scores = self.codec.scores(self.codes, self.scales, q)
+            scores[~self._alive] = -np.inf
+            out = [self.ids[i] for i in top_k_indices(scores, k) if np.isfinite(scores[i])]
+        out.extend(oid for oid, _score in self.extra.search(q, k))
+        return out
+
+    def search(
+        self,
+        con,
+        workspace_id: str,
+        owner_type: str,
+        query_vec: Sequence[float],
+        k: int,
+        rerank: int = QUANT_RERANK,
+    ) -> List[Tuple[str, float]]:
+        if k <= 0:
+            return []
+        cands = self.candidates(query_vec, max(k, k * rerank))
+        ids, mat = load_embeddings_for_owners(con, workspace_id, owner_type, self.dim, cands)
+        if not ids:
+            return []
+        exact = VectorIndex.from_matrix(ids, mat)
+        return exact.search(query_vec, k)
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                kind=np.array(self.codec.kind),
+                dim=np.array(self.dim, dtype=np.int64),
+                codes=self.codes,
+                scales=self.scales,
+                ids=np.array(self.ids, dtype=str),
+                max_rowid=np.array(self.max_rowid, dtype=np.int64),
+                **self.codec.state(),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "QuantizedIndex":
+        with np.load(path, allow_pickle=False) as data:
+            kind = str(data["kind"])
+            codec = PQCodec(data["codebooks"]) if kind == "pq" else Int8Codec(int(data["dim"]))
+            return cls(
+                codec,
+                codes=data["codes"],
+                scales=data["scales"],
+                ids=data["ids"].tolist(),
+                max_rowid=int(data["max_rowid"]),
+            )
+
+
+def build_quantized(
+    ids: Sequence[str],
+    mat: np.ndarray,
+    mode: str,
+    max_rowid: int = 0,
+) -> QuantizedIndex:
+    vecs = _normalize(np.asarray(mat, dtype=np.float32))
+    if mode == "pq":
+        codec = PQCodec.train(vecs)
+    elif mode == "int8":
+        codec = Int8Codec(vecs.shape[1])
+    else:
+        raise ValueError(f"unknown quantization mode: {mode}")
+    codes, scales = codec.encode(vecs)
+    return QuantizedIndex(codec, codes, scales, ids, max_rowid=max_rowid)
+
+
+def quant_index_path(
+    workspace_id: str,
+    owner_type: str,
+    mode: str,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> Path:
+    return vector_dir(db_path) / f"{workspace_id}.{owner_type}.{mode}.npz"
+
+
+def rebuild_quant_index(
+    con,
+    workspace_id: str,
+    owner_type: str = "capsule",
+    mode: Optional[str] = None,
+    dim: Optional[int] = None,
+) -> QuantizedIndex:
+    mode = mode or QUANT_MODE
+    dim = dim or dominant_dim(con, workspace_id, owner_type)
+    if dim is None:
+        raise ValueError(f"no embeddings for workspace {workspace_id}")
+    ids, mat, max_rowid = load_embedding_rows(con, workspace_id, owner_type, dim)
+    index = build_quantized(ids, mat, mode, max_rowid=max_rowid)
+    index.save(quant_index_path(workspace_id, owner_type, mode))
+    quant_indexes.invalidate(workspace_id)
+    return index
+
+
+class QuantIndexRegistry:
+    """Loads persisted quantized indexes lazily; reloads when the file changes on disk.
+
+    Like AnnIndexRegistry, committed writes are folded in when the embedding generation moves.
+    """
+
+    def __init__(self) -> None:
+        self._indexes: Dict[Tuple[str, str, str], Tuple[float, int, QuantizedIndex]] = {}
+        self._lock = Lock()
+
+    def get(self, con, workspace_id: str, owner_type: str, mode: str) -> Optional[QuantizedIndex]:
+        path = quant_index_path(workspace_id, owner_type, mode)
+        if not path.exists():
+            return None
+        mtime = path.stat().st_mtime
+        generation = embedding_generation(con, workspace_id)
+        key = (workspace_id, owner_type, mode)
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached and cached[0] == mtime:
+                index = cached[2]
+                if cached[1] != generation and settled(con):
+                    reconcile_snapshot(con, index, workspace_id, owner_type)
+                    self._indexes[key] = (mtime, generation, index)
+                return index
+            index = QuantizedIndex.load(path)
+            reconcile_snapshot(con, index, workspace_id, owner_type)
+            if settled(con):
+                self._indexes[key] = (mtime, generation, index)
+            return index
+
+    def invalidate(self, workspace_id: Optional[str] = None) -> None:
+        with self._lock:
+            if workspace_id is None:
+                self._indexes.clear()
+                return
+            for key in [k for k in self._indexes if k[0] == workspace_id]:
+                del self._indexes[key]
+
+
+quant_indexes = QuantIndexRegistry()
+
+
+def quant_search(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    query_vec: np.ndarray,
+    limit: int,
+    mode: Optional[str] = None,
+    read_only: bool = False,
+) -> Optional[List[Tuple[str, float]]]:
+    """Search the quantized index for `mode`; None means fall back to the exact path.
+
+    A missing index queues a quant_rebuild job (one per workspace while it is queued or
+    running) so later queries can use it, unless `read_only`.
+    """
+    mode = mode or QUANT_MODE
+    if mode == "none":
+        return None
+    index = quant_indexes.get(con, workspace_id, owner_type, mode)
+    if index is None or index.dim != query_vec.shape[0]:
+        if read_only:
+            return None
+        request_job(
+            con,
+            workspace_id,
+            QUANT_REBUILD_JOB,
+            {"owner_type": owner_type, "mode": mode, "dim": int(query_vec.shape[0])},
+            priority=8,
+        )
+        return None
+    return index.search(con, workspace_id, owner_type, query_vec, limit)
+
+
+def quantized_recall(
+    con,
+    workspace_id: str,
+    query_vecs: Sequence[Sequence[float]],
+    k: int = 10,
+    owner_type: str = "capsule",
+    mode: Optional[str] = None,
+) -> float:
+    """Mean recall@k of the quantized path against the exact float scan."""
+    mode = mode or QUANT_MODE
+    hits = 0
+    total = 0
+    for qv in query_vecs:
+        q = np.asarray(qv, dtype=np.float32).reshape(-1)
+        exact = vector_indexes.get(con, workspace_id, owner_type, int(q.shape[0])).search(q, k)
+        approx = quant_search(con, workspace_id, owner_type, q, k, mode=mode) or []
+        hits += len({oid for oid, _ in exact} & {oid for oid, _ in approx})
+        total += len(exact)
+    return hits / max(1, total)
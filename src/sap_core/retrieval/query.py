@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+import math
+import re
+from typing import Dict, List
+
+# Draft text is never passed to MATCH verbatim: it is reduced to a bounded OR of quoted
+# terms, so punctuation cannot break the query and its cost does not grow with the draft.
+QUERY_MAX_TERMS = 12
+# Distinct draft tokens looked up in the vocab table, most frequent first.
+QUERY_MAX_CANDIDATES = 64
+# Tokens unknown to the index but at least this long are tried as prefixes ("deploy"*).
+PREFIX_MIN_LEN = 4
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# FTS tables a query can be compiled for, with their fts5vocab ('row') companions.
+VOCAB_TABLES = {"fts_capsules": "fts_capsules_vocab", "fts_chunks": "fts_chunks_vocab"}
+
+STOPWORDS = frozenset(
+    """
+    a about above after again against all also am an and any are as at be because been
+    before being below between both but by can could did do does doing down during each
+    few for from further had has have having he her here hers herself him himself his how
+    i if in into is it its itself just let me more most my myself no nor not now of off on
+    once only or other our ours ourselves out over own please same she should so some such
+    than that the their theirs them themselves then there these they this those through to
+    too under until up us very was we were what when where which while who whom why will
+    with would you your yours yourself yourselves hi hello thanks thank regards cheers
+    """.split()
+)
+
+
+@dataclass
+class QueryTerm:
+    term: str
+    idf: float
+    prefix: bool = False
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens without stopwords, one-character tokens or bare numbers."""
+    return [
+        tok
+        for tok in _TOKEN_RE.findall(text.lower())
+        if len(tok) > 1 and not tok.isdigit() and tok not in STOPWORDS
+    ]
+
+
+def _read_varint(buf: bytes) -> int:
+    # SQLite varint: big-endian 7-bit groups with a continuation bit; a 9th byte has 8 bits.
+    value = 0
+    for i, byte in enumerate(buf[:9]):
+        if i == 8:
+            return (value << 8) | byte
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            break
+    return value
+
+
+def _doc_count(con, table: str) -> int:
+    """Rows in FTS5 `table`, without scanning it.
+
+    FTS5 keeps the row count it needs for bm25() as the first varint of the averages record
+    (id 1 of the `<table>_data` shadow table). The record is written when a transaction
+    commits, so rows added by the open transaction are not counted yet; an index that looks
+    empty is counted directly, which costs nothing while it really is empty.
+    """
+    row = con.execute(f"SELECT block FROM {table}_data WHERE id=1").fetchone()
+    n = _read_varint(bytes(row["block"])) if row is not None and row["block"] else 0
+    if n == 0:
+        n = int(con.execute(f"SELECT COUNT(*) AS n FROM {table}").fetchone()["n"])
+    return n
+
+
+def _term_doc_freqs(con, vocab: str, terms: List[str]) -> Dict[str, int]:
+    if not terms:
+        return {}
+    qmarks = ",".join("?" for _ in terms)
+    rows = con.execute(
+        f"SELECT term, doc FROM {vocab} WHERE term IN ({qmarks})",
+        terms,
+    ).fetchall()
+    return {r["term"]: int(r["doc"]) for r in rows}
+
+
+def _prefix_doc_freq(con, vocab: str, prefix: str) -> int:
+    # Upper bound on documents matching prefix*: the most common completion's frequency.
+    row = con.execute(
+        f"SELECT MAX(doc) AS doc FROM {vocab} WHERE term >= ? AND term < ?",
+        (prefix, prefix + "\U0010ffff"),
+    ).fetchone()
+    return int(row["doc"] or 0)
+
+
+def _idf(n_docs: int, df: int) -> float:
+    return math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+def salient_terms(
+    con,
+    text: str,
+    max_terms: int = QUERY_MAX_TERMS,
+    table: str = "fts_capsules",
+) -> List[QueryTerm]:
+    """Pick the draft's most informative terms by IDF over an FTS index (see VOCAB_TABLES).
+
+    Terms no indexed row contains are dropped unless they work as a prefix of indexed terms.
+    Ties on IDF go to the term used more often in the draft.
+    """
+    vocab = VOCAB_TABLES[table]
+    counts = Counter(tokenize(text))
+    if not counts:
+        return []
+    candidates = [t for t, _ in counts.most_common(QUERY_MAX_CANDIDATES)]
+    n_docs = _doc_count(con, table)
+    if n_docs == 0:
+        return []
+    dfs = _term_doc_freqs(con, vocab, candidates)
+
+    terms: List[QueryTerm] = []
+    for tok in candidates:
+        df = dfs.get(tok, 0)
+        prefix = False
+        if df == 0 and len(tok) >= PREFIX_MIN_LEN:
+            df = _prefix_doc_freq(con, vocab, tok)
+            prefix = df > 0
+        if df == 0:
+            continue
+        terms.append(QueryTerm(term=tok, idf=_idf(n_docs, df), prefix=prefix))
+
+    terms.sort(key=lambda qt: (qt.idf, counts[qt.term]), reverse=True)
+    return terms[:max_terms]
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def to_match_expression(terms: List[QueryTerm]) -> str:
+    return " OR ".join(_quote(t.term) + ("*" if t.prefix else "") for t in terms)
+
+
+def compile_fts_query(
+    con,
+    text: str,
+    max_terms: int = QUERY_MAX_TERMS,
+    table: str = "fts_capsules",
+) -> str:
+    """Compile free text into a safe FTS5 MATCH expression ("" when nothing is worth matching)."""
+    return to_match_expression(salient_terms(con, text, max_terms=max_terms, table=table))
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+import os
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("SAP_RETRIEVAL_CACHE_SIZE", "1024"))
+
+
+def query_hash(query: str) -> str:
+    # Only whitespace is normalized: FTS5 operators (OR, NEAR, ...) are case sensitive.
+    return hashlib.blake2b(" ".join(query.split()).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def vector_hash(query_vec: Optional[Sequence[float]]) -> str:
+    if query_vec is None:
+        return ""
+    arr = np.ascontiguousarray(np.asarray(query_vec, dtype="<f4").reshape(-1))
+    return hashlib.blake2b(arr.tobytes(), digest_size=16).hexdigest()
+
+
+class RetrievalCache:
+    """Bounded LRU of retrieval results validated by workspace write generations.
+
+    Keys are (workspace_id, query hash, vector hash, params); an entry is served only while
+    the generations it was computed under are still current. hits/misses are exposed via
+    stats() for sizing SAP_RETRIEVAL_CACHE_SIZE.
+    """
+
+    def __init__(self, max_size: int = RETRIEVAL_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, Any]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, generation: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, generation: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, workspace_id: Optional[str] = None) -> None:
+        with self._lock:
+            if workspace_id is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == workspace_id]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+retrieval_cache = RetrievalCache()
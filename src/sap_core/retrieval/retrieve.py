@@ -1,60 +1,256 @@
 from __future__ import annotations
 
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Collection, Dict, List, Optional, Set, Tuple
 import json
+import os
 import numpy as np
 
-from sap_core.domain.models import Capsule, CapsuleType, EvidenceLevel, Scope
+from sap_core.domain.models import Capsule, CapsuleType, EvidenceLevel, Lens, Scope
+from sap_core.retrieval.ann import ann_search
+from sap_core.retrieval.capsule_cache import capsule_cache
+from sap_core.retrieval.quant import quant_search
+from sap_core.retrieval.result_cache import query_hash, retrieval_cache, vector_hash
+from sap_core.retrieval.vector_index import vector_indexes
+from sap_store.sqlite.state import capsule_generation, workspace_generations
 
 
-def _cos(a: np.ndarray, b: np.ndarray) -> float:
-    denom = (np.linalg.norm(a) * np.linalg.norm(b)) + 1e-9
-    return float(np.dot(a, b) / denom)
+# Reciprocal-rank fusion: each source adds weight / (RRF_K + rank) for every capsule it ranks.
+RRF_K = 60
+RRF_WEIGHTS: Dict[str, float] = {"fts": 1.0, "vector": 1.0, "guard": 0.5}
+GUARD_TYPES = ("goal", "constraint", "decision")
+# Filtered vector search over-fetches limit * this many unfiltered hits and widens by the same
+# factor until `limit` pass the filter; after VECTOR_FILTER_ROUNDS it scans the matches exactly.
+VECTOR_FILTER_OVERFETCH = int(os.environ.get("SAP_VECTOR_FILTER_OVERFETCH", "4"))
+VECTOR_FILTER_ROUNDS = 3
 
 
-def fts_capsules(con, workspace_id: str, q: str, limit: int = 30) -> List[str]:
+@dataclass
+class RankedCapsule:
+    capsule: Capsule
+    score: float
+    sources: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class CapsuleFilter:
+    """type/scope/lens predicates applied inside SQL and the vector scan, not after loading."""
+
+    type: Optional[CapsuleType] = None
+    scope: Optional[Scope] = None
+    lens: Optional[Lens] = None
+
+    def __bool__(self) -> bool:
+        return self.type is not None or self.scope is not None or self.lens is not None
+
+    def sql(self, alias: str = "c") -> Tuple[str, List[object]]:
+        """` AND ...` clause over capsule alias `alias` plus its parameters."""
+        clause, params = "", []
+        if self.type is not None:
+            clause += f" AND {alias}.type=?"
+            params.append(self.type.value)
+        if self.scope is not None:
+            clause += f" AND {alias}.scope=?"
+            params.append(self.scope.value)
+        if self.lens is not None:
+            clause += (
+                f" AND EXISTS (SELECT 1 FROM capsule_lens l"
+                f" WHERE l.capsule_id={alias}.capsule_id AND l.lens=?)"
+            )
+            params.append(self.lens.value)
+        return clause, params
+
+
+def filtered_capsule_ids(con, workspace_id: str, filters: CapsuleFilter) -> Set[str]:
+    clause, params = filters.sql()
     rows = con.execute(
-        "SELECT capsule_id FROM fts_capsules WHERE fts_capsules MATCH ? AND workspace_id=? LIMIT ?",
-        (q, workspace_id, limit),
+        f"SELECT c.capsule_id FROM capsule c WHERE c.workspace_id=?{clause}",
+        [workspace_id, *params],
     ).fetchall()
-    return [r["capsule_id"] for r in rows]
+    return {r["capsule_id"] for r in rows}
 
 
-def load_capsules(con, workspace_id: str, ids: List[str]) -> List[Capsule]:
+def filter_capsule_ids(
+    con, workspace_id: str, ids: Collection[str], filters: CapsuleFilter
+) -> Set[str]:
+    """The subset of `ids` that match `filters`, checked in SQL by primary key."""
     if not ids:
-        return []
+        return set()
+    clause, params = filters.sql()
     qmarks = ",".join("?" for _ in ids)
     rows = con.execute(
-        f"SELECT * FROM capsule WHERE workspace_id=? AND capsule_id IN ({qmarks})",
-        [workspace_id, *ids],
+        f"""
+        SELECT c.capsule_id FROM capsule c
+        WHERE c.workspace_id=? AND c.capsule_id IN ({qmarks}){clause}
+        """,
+        [workspace_id, *ids, *params],
     ).fetchall()
+    return {r["capsule_id"] for r in rows}
 
-    out: List[Capsule] = []
-    for r in rows:
-        out.append(
-            Capsule(
-                capsule_id=r["capsule_id"],
-                workspace_id=r["workspace_id"],
-                type=CapsuleType(r["type"]),
-                title=r["title"],
-                body=r["body"],
-                lens_tags=json.loads(r["lens_tags_json"] or "[]"),
-                scope=Scope(r["scope"]),
-                evidence_level=EvidenceLevel(r["evidence_level"]),
-                confidence=float(r["confidence"]),
-                created_at=datetime.fromisoformat(r["created_at"]),
-                created_by_actor_id=r["created_by_actor_id"],
-                provenance=json.loads(r["provenance_json"] or "{}"),
-                is_published=bool(r["is_published"]),
-                redaction_profile_id=r["redaction_profile_id"],
-                content_hash=r["content_hash"],
-                signer_key_id=r["signer_key_id"],
-                signature_b64=r["signature_b64"],
-                meta=json.loads(r["meta_json"] or "{}"),
-            )
+
+def fts_capsules_scored(
+    con,
+    workspace_id: str,
+    q: str,
+    limit: int = 30,
+    filters: Optional[CapsuleFilter] = None,
+) -> List[Tuple[str, float]]:
+    """FTS hits best first, scored as -bm25() so that larger is better."""
+    if filters:
+        clause, params = filters.sql()
+        rows = con.execute(
+            f"""
+            SELECT f.capsule_id, bm25(fts_capsules) AS rank
+            FROM fts_capsules f
+            JOIN capsule c ON c.capsule_id = f.capsule_id
+            WHERE fts_capsules MATCH ? AND f.workspace_id=?{clause}
+            ORDER BY rank
+            LIMIT ?
+            """,
+            [q, workspace_id, *params, limit],
+        ).fetchall()
+    else:
+        rows = con.execute(
+            """
+            SELECT capsule_id, bm25(fts_capsules) AS rank
+            FROM fts_capsules
+            WHERE fts_capsules MATCH ? AND workspace_id=?
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (q, workspace_id, limit),
+        ).fetchall()
+    return [(r["capsule_id"], -float(r["rank"])) for r in rows]
+
+
+def fts_capsules(
+    con,
+    workspace_id: str,
+    q: str,
+    limit: int = 30,
+    filters: Optional[CapsuleFilter] = None,
+) -> List[str]:
+    hits = fts_capsules_scored(con, workspace_id, q, limit=limit, filters=filters)
+    return [cid for cid, _score in hits]
+
+
+def recent_capsule_ids(
+    con,
+    workspace_id: str,
+    limit: int = 50,
+    filters: Optional[CapsuleFilter] = None,
+) -> List[str]:
+    clause, params = (filters or CapsuleFilter()).sql()
+    rows = con.execute(
+        f"""
+        SELECT c.capsule_id FROM capsule c
+        WHERE c.workspace_id=?{clause}
+        ORDER BY c.created_at DESC LIMIT ?
+        """,
+        [workspace_id, *params, limit],
+    ).fetchall()
+    return [r["capsule_id"] for r in rows]
+
+
+def guard_capsule_ids(
+    con,
+    workspace_id: str,
+    limit: int = 30,
+    filters: Optional[CapsuleFilter] = None,
+) -> List[str]:
+    qmarks = ",".join("?" for _ in GUARD_TYPES)
+    clause, params = (filters or CapsuleFilter()).sql()
+    rows = con.execute(
+        f"""
+        SELECT c.capsule_id FROM capsule c
+        WHERE c.workspace_id=? AND c.type IN ({qmarks}){clause}
+        ORDER BY c.created_at DESC LIMIT ?
+        """,
+        [workspace_id, *GUARD_TYPES, *params, limit],
+    ).fetchall()
+    return [r["capsule_id"] for r in rows]
+
+
+def _row_to_capsule(r) -> Capsule:
+    return Capsule(
+        capsule_id=r["capsule_id"],
+        workspace_id=r["workspace_id"],
+        type=CapsuleType(r["type"]),
+        title=r["title"],
+        body=r["body"],
+        lens_tags=json.loads(r["lens_tags_json"] or "[]"),
+        scope=Scope(r["scope"]),
+        evidence_level=EvidenceLevel(r["evidence_level"]),
+        confidence=float(r["confidence"]),
+        created_at=datetime.fromisoformat(r["created_at"]),
+        created_by_actor_id=r["created_by_actor_id"],
+        provenance=json.loads(r["provenance_json"] or "{}"),
+        is_published=bool(r["is_published"]),
+        redaction_profile_id=r["redaction_profile_id"],
+        content_hash=r["content_hash"],
+        signer_key_id=r["signer_key_id"],
+        signature_b64=r["signature_b64"],
+        meta=json.loads(r["meta_json"] or "{}"),
+    )
+
+
+def load_capsules(
+    con, workspace_id: str, ids: List[str], use_cache: bool = True
+) -> List[Capsule]:
+    """Capsules for `ids` in the given order; only ids missing from capsule_cache hit SQLite.
+
+    Bulk loads that would flood the cache (workspace context builds) pass `use_cache=False`
+    to read straight from SQLite without evicting hot retrieval entries.
+    """
+    if not ids:
+        return []
+    generation = capsule_generation(con, workspace_id) if use_cache else 0
+    by_id = capsule_cache.get_many(workspace_id, ids, generation) if use_cache else {}
+    missing = [cid for cid in dict.fromkeys(ids) if cid not in by_id]
+    if missing:
+        qmarks = ",".join("?" for _ in missing)
+        rows = con.execute(
+            f"SELECT * FROM capsule WHERE workspace_id=? AND capsule_id IN ({qmarks})",
+            [workspace_id, *missing],
+        ).fetchall()
+        loaded = [_row_to_capsule(r) for r in rows]
+        if use_cache:
+            capsule_cache.put_many(workspace_id, loaded, generation)
+        by_id.update((c.capsule_id, c) for c in loaded)
+    return [by_id[cid] for cid in dict.fromkeys(ids) if cid in by_id]
+
+
+def vector_top_owners(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    query_vec: List[float],
+    limit: int = 50,
+    nprobe: Optional[int] = None,
+    allow: Optional[Collection[str]] = None,
+    read_only: bool = False,
+) -> List[Tuple[str, float]]:
+    """Cosine top-k over one owner type: quantized codes if enabled and built, else IVF,
+    else exact.
+
+    With `allow`, only those owners are scored (exact scan over their rows), so a
+    pre-filtered search still returns up to `limit` hits. `read_only` searches without
+    queueing index builds.
+    """
+    qv = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    if allow is not None:
+        index = vector_indexes.get(con, workspace_id, owner_type, dim=int(qv.shape[0]))
+        return index.search(qv, limit, allow=allow)
+    hits = quant_search(con, workspace_id, owner_type, qv, limit, read_only=read_only)
+    if hits is None:
+        hits = ann_search(
+            con, workspace_id, owner_type, qv, limit, nprobe=nprobe, read_only=read_only
         )
-    return out
+    if hits is not None:
+        return hits
+    index = vector_indexes.get(con, workspace_id, owner_type, dim=int(qv.shape[0]))
+    return index.search(qv, limit)
 
 
 def vector_top_capsules(
@@ -62,43 +258,141 @@ def vector_top_capsules(
     workspace_id: str,
     query_vec: List[float],
     limit: int = 50,
+    nprobe: Optional[int] = None,
+    filters: Optional[CapsuleFilter] = None,
+    read_only: bool = False,
 ) -> List[Tuple[str, float]]:
-    rows = con.execute(
-        "SELECT owner_id, vec_json FROM embedding WHERE workspace_id=? AND owner_type='capsule'",
-        (workspace_id,),
-    ).fetchall()
-    if not rows:
-        return []
-    qv = np.array(query_vec, dtype=np.float32)
-    scored: List[Tuple[str, float]] = []
-    for r in rows:
-        v = np.array(json.loads(r["vec_json"]), dtype=np.float32)
-        scored.append((r["owner_id"], _cos(qv, v)))
-    scored.sort(key=lambda x: x[1], reverse=True)
-    return scored[:limit]
+    """Vector hits for capsules, best first.
+
+    Filtered queries stay on the quantized/IVF path: unfiltered candidates are over-fetched
+    and checked against the filter in SQL, widening k until `limit` match or the index runs
+    out. Only very selective filters, still short after VECTOR_FILTER_ROUNDS, fall back to
+    an exact scan over every matching capsule.
+    """
+    if not filters:
+        return vector_top_owners(
+            con,
+            workspace_id,
+            "capsule",
+            query_vec,
+            limit=limit,
+            nprobe=nprobe,
+            read_only=read_only,
+        )
+    k = limit * VECTOR_FILTER_OVERFETCH
+    for _round in range(VECTOR_FILTER_ROUNDS):
+        hits = vector_top_owners(
+            con, workspace_id, "capsule", query_vec, limit=k, nprobe=nprobe, read_only=read_only
+        )
+        allowed = filter_capsule_ids(con, workspace_id, [cid for cid, _ in hits], filters)
+        matched = [(cid, score) for cid, score in hits if cid in allowed]
+        if len(matched) >= limit or len(hits) < k:
+            return matched[:limit]
+        k *= VECTOR_FILTER_OVERFETCH
+    return vector_top_owners(
+        con,
+        workspace_id,
+        "capsule",
+        query_vec,
+        limit=limit,
+        nprobe=nprobe,
+        allow=filtered_capsule_ids(con, workspace_id, filters),
+        read_only=read_only,
+    )
 
 
-def retrieve_bundle(
+def rrf_fuse(
+    ranked_lists: Dict[str, List[Tuple[str, float]]],
+    weights: Optional[Dict[str, float]] = None,
+    k: int = RRF_K,
+) -> List[Tuple[str, float, Dict[str, float]]]:
+    """Merge best-first (id, raw_score) lists; returns (id, fused_score, raw scores by source)."""
+    weights = weights or RRF_WEIGHTS
+    fused: Dict[str, float] = {}
+    raw: Dict[str, Dict[str, float]] = {}
+    for source, hits in ranked_lists.items():
+        w = weights.get(source, 1.0)
+        for rank, (cid, score) in enumerate(hits, start=1):
+            fused[cid] = fused.get(cid, 0.0) + w / (k + rank)
+            raw.setdefault(cid, {})[source] = score
+    order = sorted(fused, key=lambda cid: fused[cid], reverse=True)
+    return [(cid, fused[cid], raw[cid]) for cid in order]
+
+
+def retrieve_ranked(
     con,
     workspace_id: str,
     query: str,
     query_vec: Optional[List[float]] = None,
     limit: int = 40,
-) -> List[Capsule]:
-    guard = con.execute(
-        "SELECT capsule_id FROM capsule WHERE workspace_id=? AND type IN ('goal','constraint','decision') ORDER BY created_at DESC LIMIT 30",
-        (workspace_id,),
-    ).fetchall()
-    guard_ids = [r["capsule_id"] for r in guard]
+    guard_limit: int = 30,
+    fts_limit: int = 30,
+    filters: Optional[CapsuleFilter] = None,
+    read_only: bool = False,
+) -> List[RankedCapsule]:
+    """Hybrid retrieval: guard capsules, bm25 FTS hits and cosine hits fused by RRF.
 
-    ids = set(guard_ids)
+    The result is ordered best first and capped at `limit`, so callers can stop early.
+    Results are cached per (workspace, query, query vector) until a capsule or embedding
+    write in the workspace moves its generation. `read_only` never queues index jobs.
+    """
+    key = (
+        workspace_id,
+        query_hash(query),
+        vector_hash(query_vec),
+        limit,
+        guard_limit,
+        fts_limit,
+        filters or None,
+    )
+    generation = workspace_generations(con, workspace_id)
+    cached = retrieval_cache.get(key, generation)
+    if cached is not None:
+        return list(cached)
 
+    ranked_lists: Dict[str, List[Tuple[str, float]]] = {
+        "guard": [
+            (cid, 1.0)
+            for cid in guard_capsule_ids(con, workspace_id, limit=guard_limit, filters=filters)
+        ],
+    }
     if query.strip():
-        for cid in fts_capsules(con, workspace_id, query, limit=30):
-            ids.add(cid)
-
+        ranked_lists["fts"] = fts_capsules_scored(
+            con, workspace_id, query, limit=fts_limit, filters=filters
+        )
     if query_vec is not None:
-        for cid, _score in vector_top_capsules(con, workspace_id, query_vec, limit=limit):
-            ids.add(cid)
+        ranked_lists["vector"] = vector_top_capsules(
+            con, workspace_id, query_vec, limit=limit, filters=filters, read_only=read_only
+        )
 
-    return load_capsules(con, workspace_id, list(ids))
+    fused = rrf_fuse(ranked_lists)[:limit]
+    capsules = load_capsules(con, workspace_id, [cid for cid, _score, _raw in fused])
+    by_id = {c.capsule_id: c for c in capsules}
+    ranked = [
+        RankedCapsule(capsule=by_id[cid], score=score, sources=sources)
+        for cid, score, sources in fused
+        if cid in by_id
+    ]
+    retrieval_cache.put(key, generation, ranked)
+    return list(ranked)
+
+
+def retrieve_bundle(
+    con,
+    workspace_id: str,
+    query: str,
+    query_vec: Optional[List[float]] = None,
+    limit: int = 40,
+    filters: Optional[CapsuleFilter] = None,
+    read_only: bool = False,
+) -> List[Capsule]:
+    ranked = retrieve_ranked(
+        con,
+        workspace_id,
+        query,
+        query_vec=query_vec,
+        limit=limit,
+        filters=filters,
+        read_only=read_only,
+    )
+    return [r.capsule for r in ranked]
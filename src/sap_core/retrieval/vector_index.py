@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import os
+from threading import Lock
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from sap_store.sqlite.db import vector_dir
+from sap_store.sqlite.embeddings import (
+    count_embedding_owners,
+    delete_embeddings,
+    embedding_owner_ids,
+    insert_embedding,
+    load_embedding_rows,
+)
+from sap_store.sqlite.jobs import enqueue_job
+from sap_store.sqlite.state import embedding_generation
+from sap_store.vectors.shard import VectorShard
+
+SHARD_COMPACT_JOB = "shard_compact"
+
+# "memory" keeps a private heap matrix per process; "memmap" maps shared shard files
+# under <db dir>/vectors so several API workers share one copy through the page cache.
+VECTOR_STORE = os.environ.get("SAP_VECTOR_STORE", "memory")
+# Compact a shard once this fraction of its rows are tombstoned.
+SHARD_COMPACT_RATIO = float(os.environ.get("SAP_SHARD_COMPACT_RATIO", "0.25"))
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True) + 1e-9
+    return (mat / norms).astype(np.float32, copy=False)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first (argpartition, then sort only k)."""
+    n = scores.shape[0]
+    if k < n:
+        top = np.argpartition(scores, n - k)[n - k:]
+    else:
+        top = np.arange(n)
+    return top[np.argsort(-scores[top])]
+
+
+def _normalize_query(query_vec: Sequence[float]) -> np.ndarray:
+    q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    return q / (np.linalg.norm(q) + 1e-9)
+
+
+def _search_rows(
+    mat: np.ndarray, ids: Sequence[str], rows: np.ndarray, q: np.ndarray, k: int
+) -> List[Tuple[str, float]]:
+    # Pre-filtered scan: only the allowed rows are gathered and scored.
+    if rows.size == 0:
+        return []
+    scores = np.asarray(mat[rows] @ q, dtype=np.float32)
+    return [(ids[rows[i]], float(scores[i])) for i in top_k_indices(scores, k)]
+
+
+class VectorIndex:
+    """Contiguous, pre-normalized (n, dim) float32 matrix plus the owner id of each row.
+
+    Cosine scoring is one matrix-vector product; deletes swap the last row into the hole
+    so the live rows always stay packed in `_mat[:n]`. `max_rowid` is the embedding seq
+    watermark the rows were loaded up to (see reconcile_snapshot).
+    """
+
+    def __init__(self, dim: int, capacity: int = 64, max_rowid: int = 0):
+        self.dim = dim
+        self.max_rowid = max_rowid
+        self._mat = np.zeros((max(capacity, 1), dim), dtype=np.float32)
+        self._ids: List[str] = []
+        self._row: Dict[str, int] = {}
+
+    @classmethod
+    def from_matrix(
+        cls, ids: Sequence[str], mat: np.ndarray, max_rowid: int = 0
+    ) -> "VectorIndex":
+        index = cls(dim=int(mat.shape[1]), capacity=len(ids), max_rowid=max_rowid)
+        if ids:
+            index._mat[: len(ids)] = _normalize_rows(np.asarray(mat, dtype=np.float32))
+            index._ids = list(ids)
+            # Later rows win, matching "most recent embedding per owner".
+            index._row = {oid: i for i, oid in enumerate(index._ids)}
+            if len(index._row) != len(index._ids):
+                index._dedupe()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, owner_id: str) -> bool:
+        return owner_id in self._row
+
+    @property
+    def ids(self) -> List[str]:
+        return self._ids
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._mat[: len(self._ids)]
+
+    def live_ids(self) -> List[str]:
+        return list(self._ids)
+
+    def _dedupe(self) -> None:
+        keep = sorted(self._row.values())
+        self._mat[: len(keep)] = self._mat[keep]
+        self._ids = [self._ids[i] for i in keep]
+        self._row = {oid: i for i, oid in enumerate(self._ids)}
+
+    def _grow(self, needed: int) -> None:
+        cap = self._mat.shape[0]
+        if needed <= cap:
+            return
+        new_cap = max(needed, cap * 2)
+        mat = np.zeros((new_cap, self.dim), dtype=np.float32)
+        mat[: len(self._ids)] = self._mat[: len(self._ids)]
+        self._mat = mat
+
+    def add(self, owner_id: str, vec: Sequence[float]) -> None:
+        v = np.asarray(vec, dtype=np.float32).reshape(-1)
+        if v.shape[0] != self.dim:
+            raise ValueError(f"expected dim {self.dim}, got {v.shape[0]}")
+        v = v / (np.linalg.norm(v) + 1e-9)
+        row = self._row.get(owner_id)
+        if row is None:
+            row = len(self._ids)
+            self._grow(row + 1)
+            self._ids.append(owner_id)
+            self._row[owner_id] = row
+        self._mat[row] = v
+
+    def remove(self, owner_ids: Iterable[str]) -> int:
+        removed = 0
+        for oid in owner_ids:
+            row = self._row.pop(oid, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._mat[row] = self._mat[last]
+                self._ids[row] = moved
+                self._row[moved] = row
+            self._ids.pop()
+            removed += 1
+        return removed
+
+    def tombstone(self, owner_ids: Iterable[str]) -> None:
+        self.remove(owner_ids)
+
+    def search(
+        self,
+        query_vec: Sequence[float],
+        k: int,
+        allow: Optional[Collection[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """Top-k by cosine; with `allow`, only those owner ids' rows are scored."""
+        n = len(self._ids)
+        if n == 0 or k <= 0:
+            return []
+        q = _normalize_query(query_vec)
+        if allow is None:
+            scores = self._mat[:n] @ q
+            return [(self._ids[i], float(scores[i])) for i in top_k_indices(scores, k)]
+        rows = np.fromiter((self._row[oid] for oid in allow if oid in self._row), dtype=np.int64)
+        return _search_rows(self._mat, self._ids, rows, q, k)
+
+
+class ShardVectorIndex:
+    """VectorIndex interface over a memory-mapped VectorShard (rows stored normalized).
+
+    Shards only ever receive committed rows: `sync` copies what SQLite holds past the
+    manifest's seq watermark, so rollbacks, crashes and plain-SQL writes are caught up on
+    the next open or generation change instead of leaving the shard out of step for good.
+    """
+
+    def __init__(self, shard: VectorShard):
+        self.shard = shard
+        self.dim = shard.dim
+
+    @staticmethod
+    def shard_name(workspace_id: str, owner_type: str, dim: int) -> str:
+        return f"{workspace_id}.{owner_type}.{dim}"
+
+    @classmethod
+    def open(cls, con, workspace_id: str, owner_type: str, dim: int) -> "ShardVectorIndex":
+        shard = VectorShard(vector_dir(), cls.shard_name(workspace_id, owner_type, dim), dim)
+
+        def _from_sqlite():
+            ids, mat, max_rowid = load_embedding_rows(con, workspace_id, owner_type, dim)
+            index = VectorIndex.from_matrix(ids, mat)
+            return index.ids, index.matrix, max_rowid
+
+        shard.ensure(_from_sqlite)
+        index = cls(shard)
+        index.sync(con, workspace_id, owner_type)
+        return index
+
+    def sync(self, con, workspace_id: str, owner_type: str) -> None:
+        """Append committed rows past the shard watermark and tombstone deleted owners."""
+
+        def _delta(after_rowid: int, live: List[str]):
+            ids, mat, max_rowid = load_embedding_rows(
+                con, workspace_id, owner_type, self.dim, after_rowid=after_rowid
+            )
+            fresh = VectorIndex.from_matrix(ids, mat)
+            deleted: List[str] = []
+            known = set(live).union(fresh.ids)
+            if len(known) != count_embedding_owners(con, workspace_id, owner_type, self.dim):
+                current = embedding_owner_ids(con, workspace_id, owner_type, self.dim)
+                deleted = [oid for oid in live if oid not in current]
+            return fresh.ids, fresh.matrix, deleted, max_rowid
+
+        self.shard.sync(_delta)
+
+    @classmethod
+    def open_existing(
+        cls, workspace_id: str, owner_type: str, dim: int
+    ) -> Optional["ShardVectorIndex"]:
+        shard = VectorShard(vector_dir(), cls.shard_name(workspace_id, owner_type, dim), dim)
+        if not shard.exists():
+            return None
+        shard.refresh()
+        return cls(shard)
+
+    @classmethod
+    def existing(cls, workspace_id: str) -> List[Tuple[str, int]]:
+        """(owner_type, dim) of every shard stored for a workspace."""
+        out = []
+        for path in vector_dir().glob(f"{workspace_id}.*.*.json"):
+            _ws, owner_type, dim = path.name[: -len(".json")].split(".")
+            if dim.isdigit():
+                out.append((owner_type, int(dim)))
+        return out
+
+    def dead_ratio(self, pending: int = 0) -> float:
+        """Tombstoned fraction of rows, counting `pending` deletes not yet synced in."""
+        self.shard.refresh()
+        return float(self.shard.dead.sum() + pending) / max(1, len(self.shard))
+
+    def __len__(self) -> int:
+        self.shard.refresh()
+        return self.shard.live_count()
+
+    def __contains__(self, owner_id: str) -> bool:
+        return owner_id in self.ids
+
+    @property
+    def ids(self) -> List[str]:
+        self.shard.refresh()
+        return [oid for oid, dead in zip(self.shard.ids, self.shard.dead) if not dead]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        self.shard.refresh()
+        return np.asarray(self.shard.matrix)[~self.shard.dead]
+
+    def search(
+        self,
+        query_vec: Sequence[float],
+        k: int,
+        allow: Optional[Collection[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        self.shard.refresh()
+        n = len(self.shard)
+        if n == 0 or k <= 0:
+            return []
+        q = _normalize_query(query_vec)
+        if allow is not None:
+            return _search_rows(self.shard.matrix, self.shard.ids, self.shard.rows_for(allow), q, k)
+        scores = np.asarray(self.shard.matrix @ q, dtype=np.float32)
+        scores[self.shard.dead] = -np.inf
+        ids = self.shard.ids
+        return [(ids[i], float(scores[i])) for i in top_k_indices(scores, k) if np.isfinite(scores[i])]
+
+    def compact(self, min_ratio: float = SHARD_COMPACT_RATIO) -> int:
+        if len(self.shard) == 0 or self.dead_ratio() < min_ratio:
+            return 0
+        return self.shard.compact()
+
+
+AnyVectorIndex = Union[VectorIndex, ShardVectorIndex]
+
+
+class VectorIndexRegistry:
+    """Process-wide cache of VectorIndex objects keyed by (workspace, owner_type, dim).
+
+    Each index remembers the embedding generation it was reconciled at; when the
+    generation moves (a commit from this or any other process) the next `get` folds the
+    committed delta in (reconcile_snapshot in memory, ShardVectorIndex.sync for shards).
+    Writers never touch these indexes directly, so a rolled-back write cannot leave
+    phantom vectors behind.
+    """
+
+    def __init__(self) -> None:
+        self._indexes: Dict[Tuple[str, str, int], AnyVectorIndex] = {}
+        self._generations: Dict[Tuple[str, str, int], int] = {}
+        self._lock = Lock()
+
+    def get(self, con, workspace_id: str, owner_type: str, dim: int) -> AnyVectorIndex:
+        key = (workspace_id, owner_type, dim)
+        generation = embedding_generation(con, workspace_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                if self._generations.get(key) != generation and settled(con):
+                    if isinstance(index, ShardVectorIndex):
+                        index.sync(con, workspace_id, owner_type)
+                    else:
+                        reconcile_snapshot(con, index, workspace_id, owner_type)
+                    self._generations[key] = generation
+                return index
+            if VECTOR_STORE == "memmap" and settled(con):
+                index = ShardVectorIndex.open(con, workspace_id, owner_type, dim)
+            else:
+                ids, mat, max_rowid = load_embedding_rows(con, workspace_id, owner_type, dim)
+                index = VectorIndex.from_matrix(ids, mat, max_rowid=max_rowid)
+                if not settled(con):
+                    # Built from this connection's uncommitted rows: use it, don't share it.
+                    return index
+            self._indexes[key] = index
+            self._generations[key] = generation
+            return index
+
+    def peek(self, workspace_id: str, owner_type: str, dim: int) -> Optional[AnyVectorIndex]:
+        return self._indexes.get((workspace_id, owner_type, dim))
+
+    def invalidate(self, workspace_id: Optional[str] = None) -> None:
+        with self._lock:
+            if workspace_id is None:
+                self._indexes.clear()
+                self._generations.clear()
+                return
+            for key in [k for k in self._indexes if k[0] == workspace_id]:
+                del self._indexes[key]
+                self._generations.pop(key, None)
+
+
+vector_indexes = VectorIndexRegistry()
+
+
+def settled(con) -> bool:
+    """True unless `con` holds uncommitted writes, which process-wide indexes must not see."""
+    return not con.in_transaction
+
+
+def reconcile_snapshot(con, index, workspace_id: str, owner_type: str) -> None:
+    """Bring an index (persisted snapshot or cached in memory) up to date with SQLite.
+
+    `index` needs `dim`, `max_rowid`, `live_ids()`, `tombstone(ids)` and `add(id, vec)`.
+    Rows written after the seq watermark are (re-)added; owners deleted since are only
+    looked for when the live count no longer matches SQLite, so a pure-append delta costs
+    one indexed COUNT rather than a scan of every owner id.
+    """
+    ids, mat, max_rowid = load_embedding_rows(
+        con, workspace_id, owner_type, index.dim, after_rowid=index.max_rowid
+    )
+    for oid, vec in zip(ids, mat):
+        index.add(oid, vec)
+    index.max_rowid = max_rowid
+    if len(index) != count_embedding_owners(con, workspace_id, owner_type, index.dim):
+        current = embedding_owner_ids(con, workspace_id, owner_type, index.dim)
+        index.tombstone([oid for oid in index.live_ids() if oid not in current])
+
+
+def add_embedding(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    owner_id: str,
+    vec: Sequence[float],
+    model_name: Optional[str] = None,
+) -> str:
+    """Replace the stored embedding for an owner.
+
+    Loaded indexes and shards pick the row up from the embedding generation once it is
+    committed.
+    """
+    arr = np.asarray(vec, dtype=np.float32).reshape(-1)
+    delete_embeddings(con, workspace_id, owner_type, [owner_id])
+    return insert_embedding(con, workspace_id, owner_type, owner_id, arr, model_name=model_name)
+
+
+def remove_embeddings(con, workspace_id: str, owner_type: str, owner_ids: Iterable[str]) -> int:
+    ids = list(owner_ids)
+    deleted = delete_embeddings(con, workspace_id, owner_type, ids)
+    if VECTOR_STORE == "memmap":
+        for otype, dim in ShardVectorIndex.existing(workspace_id):
+            index = vector_indexes.peek(workspace_id, otype, dim)
+            if otype != owner_type or index is None:
+                continue
+            if index.dead_ratio(pending=deleted) >= SHARD_COMPACT_RATIO:
+                enqueue_job(con, workspace_id, SHARD_COMPACT_JOB, {}, priority=8)
+                break
+    return deleted
+
+
+def compact_vector_shards(
+    workspace_id: str, min_ratio: float = SHARD_COMPACT_RATIO, con=None
+) -> int:
+    """Compact every memmap shard of a workspace; returns the number of rows dropped.
+
+    With `con`, shards are synced first so deletes not yet folded in count toward the ratio.
+    """
+    removed = 0
+    for owner_type, dim in ShardVectorIndex.existing(workspace_id):
+        index = ShardVectorIndex.open_existing(workspace_id, owner_type, dim)
+        if index is not None:
+            if con is not None and settled(con):
+                index.sync(con, workspace_id, owner_type)
+            removed += index.compact(min_ratio=min_ratio)
+    return removed
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sap_core.scoring.matcher import fold_case
+
+Span = Tuple[int, int]
+
+# Evidence wording, as whole words (phrases are space-separated words).
+CONFIDENT_WORDS = ("must", "will", "guarantee", "always", "never", "cannot fail")
+HEDGE_WORDS = ("might", "may", "could", "suggests", "hypothesis", "likely", "uncertain")
+
+# Word tokens and sentence breaks (terminal punctuation plus whitespace) in one pass.
+_SCAN_RE = re.compile(r"(\w+)|[.!?]\s+", re.UNICODE)
+_ACRONYM_RE = re.compile(r"[A-Z][A-Z0-9]{2,}")
+
+
+def _phrase_table(phrases: Sequence[str]) -> Dict[str, List[Tuple[str, ...]]]:
+    table: Dict[str, List[Tuple[str, ...]]] = {}
+    for phrase in phrases:
+        words = tuple(phrase.lower().split())
+        table.setdefault(words[0], []).append(words)
+    for entries in table.values():
+        entries.sort(key=len, reverse=True)
+    return table
+
+
+_CONFIDENT = _phrase_table(CONFIDENT_WORDS)
+_HEDGE = _phrase_table(HEDGE_WORDS)
+
+
+class DraftDocument:
+    """One tokenization pre-pass over a draft, shared by every detector.
+
+    Holds the case-folded text, word-token offsets, sentence spans, acronym hits and
+    confident/hedged wording hits. Matchers run over the folded text once per document
+    (see `matches`), so per-recipient loops do not re-scan the draft.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = fold_case(text)
+        self.tokens: List[Span] = []
+        self.sentences: List[Span] = []
+        self.acronyms: List[Tuple[str, Span]] = []
+        self.confident: List[Span] = []
+        self.hedged: List[Span] = []
+        self._matches: Dict[int, Tuple[Any, List[Tuple[int, int, str]]]] = {}
+        self._scan()
+
+    def _scan(self) -> None:
+        text = self.text
+        sentence_start = 0
+        for m in _SCAN_RE.finditer(text):
+            if m.group(1) is None:
+                self.sentences.append((sentence_start, m.end()))
+                sentence_start = m.end()
+                continue
+            start, end = m.span()
+            self.tokens.append((start, end))
+            if _ACRONYM_RE.fullmatch(text, start, end):
+                self.acronyms.append((text[start:end], (start, end)))
+        if sentence_start < len(text):
+            self.sentences.append((sentence_start, len(text)))
+        self.confident = self._phrase_hits(_CONFIDENT)
+        self.hedged = self._phrase_hits(_HEDGE)
+
+    def _phrase_hits(self, table: Dict[str, List[Tuple[str, ...]]]) -> List[Span]:
+        hits: List[Span] = []
+        tokens, lower = self.tokens, self.lower
+        for i, (start, end) in enumerate(tokens):
+            entries = table.get(lower[start:end])
+            if not entries:
+                continue
+            for words in entries:
+                j = i + len(words)
+                if j > len(tokens):
+                    continue
+                # Phrase words must be separated by exactly one space.
+                if all(
+                    lower[tokens[i + k][0] : tokens[i + k][1]] == words[k]
+                    and (k == 0 or lower[tokens[i + k - 1][1] : tokens[i + k][0]] == " ")
+                    for k in range(len(words))
+                ):
+                    hits.append((start, tokens[j - 1][1]))
+                    break
+        return hits
+
+    def matches(self, matcher) -> List[Tuple[int, int, str]]:
+        """matcher.find_all over this document, computed once per matcher."""
+        cached = self._matches.get(id(matcher))
+        if cached is None or cached[0] is not matcher:
+            cached = (matcher, matcher.find_all(self.text, folded=self.lower))
+            self._matches[id(matcher)] = cached
+        return cached[1]
+
+    def first_confident(self, span: Optional[Span] = None) -> Optional[Span]:
+        return _first_within(self.confident, span)
+
+    def first_hedged(self, span: Optional[Span] = None) -> Optional[Span]:
+        return _first_within(self.hedged, span)
+
+
+def _first_within(hits: List[Span], span: Optional[Span]) -> Optional[Span]:
+    if span is None:
+        return hits[0] if hits else None
+    return next((h for h in hits if span[0] <= h[0] and h[1] <= span[1]), None)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+import os
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+SENTENCE_CACHE_SIZE = int(os.environ.get("SAP_SENTENCE_CACHE_SIZE", "8192"))
+
+
+def text_key(model_name: str, text: str) -> Tuple[str, bytes]:
+    return model_name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class SentenceEmbeddingCache:
+    """LRU of sentence vectors keyed by (model name, text hash).
+
+    `embed` sends only the texts it has not seen to the embedder, in a single batch call,
+    so re-analyzing a draft costs one model call for the edited sentences only.
+    """
+
+    def __init__(self, max_size: int = SENTENCE_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._vecs: "OrderedDict[Tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, embedder, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dim) float32 matrix, rows in the order of `texts`."""
+        model_name = getattr(embedder, "model_name", type(embedder).__name__)
+        keys = [text_key(model_name, t) for t in texts]
+        found: Dict[Tuple[str, bytes], np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vec = self._vecs.get(key)
+                if vec is not None:
+                    self._vecs.move_to_end(key)
+                    found[key] = vec
+        missing: List[int] = []
+        seen = set(found)
+        for i, key in enumerate(keys):
+            if key not in seen:
+                seen.add(key)
+                missing.append(i)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vecs = np.asarray(embedder.embed([texts[i] for i in missing]), dtype=np.float32)
+            for i, vec in zip(missing, vecs):
+                found[keys[i]] = vec
+            self._store({keys[i]: found[keys[i]] for i in missing})
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def _store(self, vecs: Dict[Tuple[str, bytes], np.ndarray]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for key, vec in vecs.items():
+                self._vecs[key] = vec
+                self._vecs.move_to_end(key)
+            while len(self._vecs) > self.max_size:
+                self._vecs.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._vecs)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._vecs),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+sentence_embeddings = SentenceEmbeddingCache()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def fold_case(text: str) -> str:
+    """Lower-case `text` without changing its length, so match offsets stay valid."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+
+class AhoCorasick:
+    """Case-insensitive multi-pattern matcher with word-boundary checks.
+
+    The automaton is built once from the pattern set; `find_all` then reports every
+    occurrence of every pattern in one pass over the text, independent of how many
+    patterns there are. A pattern that starts (or ends) with a word character only matches
+    where the neighbouring text character is not a word character, so "api" does not
+    match inside "capital".
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        seen = set()
+        for pattern in patterns:
+            p = fold_case(pattern)
+            if not p or p in seen:
+                continue
+            seen.add(p)
+            self._insert(p, len(self.patterns))
+            self.patterns.append(p)
+        self._build_links()
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _insert(self, pattern: str, idx: int) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(idx)
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                link = self._goto[f].get(ch, 0)
+                self._fail[child] = link if link != child else 0
+                # Inherit the outputs of the longest proper suffix that is a pattern.
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str, folded: Optional[str] = None) -> List[Tuple[int, int, str]]:
+        """(start, end, pattern) for every boundary-respecting match, ordered by end offset.
+
+        Pass `folded` (fold_case(text)) when the caller already has it.
+        """
+        if not self.patterns:
+            return []
+        if folded is None:
+            folded = fold_case(text)
+        n = len(folded)
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        hits: List[Tuple[int, int, str]] = []
+        node = 0
+        for i, ch in enumerate(folded):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            end = i + 1
+            for idx in out[node]:
+                pattern = patterns[idx]
+                start = end - len(pattern)
+                if _is_word_char(pattern[0]) and start > 0 and _is_word_char(folded[start - 1]):
+                    continue
+                if _is_word_char(pattern[-1]) and end < n and _is_word_char(folded[end]):
+                    continue
+                hits.append((start, end, pattern))
+        return hits
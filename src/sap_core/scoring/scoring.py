@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 import re
 
 import numpy as np
@@ -13,11 +14,16 @@ from sap_core.domain.models import (
     MismatchFinding,
     RareThoughtFinding,
 )
+from sap_core.scoring.document import CONFIDENT_WORDS, HEDGE_WORDS, DraftDocument
+from sap_core.scoring.matcher import AhoCorasick, fold_case
 
 
 _ACRONYM_RE = re.compile(r"\b[A-Z][A-Z0-9]{2,}\b")
-_CONFIDENT_WORDS = re.compile(r"\b(must|will|guarantee|always|never|cannot fail)\b", re.IGNORECASE)
-_HEDGE_WORDS = re.compile(r"\b(might|may|could|suggests|hypothesis|likely|uncertain)\b", re.IGNORECASE)
+_CONFIDENT_WORDS = re.compile(r"\b(" + "|".join(CONFIDENT_WORDS) + r")\b", re.IGNORECASE)
+_HEDGE_WORDS = re.compile(r"\b(" + "|".join(HEDGE_WORDS) + r")\b", re.IGNORECASE)
+
+# A recipient knows a term once their decayed exposure strength exceeds this.
+KNOWN_TERM_STRENGTH = 0.5
 
 EVID_ORDER: Dict[EvidenceLevel, int] = {
     EvidenceLevel.hypothesis: 0,
@@ -28,14 +34,37 @@ EVID_ORDER: Dict[EvidenceLevel, int] = {
 }
 
 
-def evidence_word_level(text: str) -> EvidenceLevel:
-    if _CONFIDENT_WORDS.search(text):
+Span = Tuple[int, int]
+
+
+def evidence_word_spans(text: str) -> Tuple[Optional[Span], Optional[Span]]:
+    """Spans of the first confident and the first hedged word (None when absent)."""
+    confident = _CONFIDENT_WORDS.search(text)
+    hedged = _HEDGE_WORDS.search(text)
+    return (
+        confident.span() if confident else None,
+        hedged.span() if hedged else None,
+    )
+
+
+def evidence_word_flags(text: str) -> Tuple[bool, bool]:
+    """(has confident wording, has hedged wording)."""
+    confident, hedged = evidence_word_spans(text)
+    return confident is not None, hedged is not None
+
+
+def evidence_level_from_flags(confident: bool, hedged: bool) -> EvidenceLevel:
+    if confident:
         return EvidenceLevel.measured
-    if _HEDGE_WORDS.search(text):
+    if hedged:
         return EvidenceLevel.hypothesis
     return EvidenceLevel.estimate
 
 
+def evidence_word_level(text: str) -> EvidenceLevel:
+    return evidence_level_from_flags(*evidence_word_flags(text))
+
+
 def split_spans(text: str) -> List[Tuple[int, int]]:
     spans = []
     start = 0
@@ -55,8 +84,56 @@ def extract_acronyms(text: str) -> List[Tuple[str, Tuple[int, int]]]:
     return out
 
 
-def build_glossary_index(capsules: List[Capsule]) -> Dict[str, str]:
-    idx: Dict[str, str] = {}
+class GlossaryIndex(dict):
+    """term -> definition map that also carries a compiled matcher over its terms.
+
+    The matcher is built on first use and dropped whenever the mapping changes.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._matcher: Optional[AhoCorasick] = None
+
+    @property
+    def matcher(self) -> AhoCorasick:
+        if self._matcher is None:
+            self._matcher = AhoCorasick(self.keys())
+        return self._matcher
+
+    def _changed(self) -> None:
+        self._matcher = None
+
+    def __setitem__(self, key: str, value: str) -> None:
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args, **kwargs) -> None:
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def pop(self, *args):
+        self._changed()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super().popitem()
+
+    def setdefault(self, key: str, default: str = ""):
+        self._changed()
+        return super().setdefault(key, default)
+
+    def clear(self) -> None:
+        super().clear()
+        self._changed()
+
+
+def build_glossary_index(capsules: List[Capsule]) -> GlossaryIndex:
+    idx = GlossaryIndex()
     for c in capsules:
         if c.type != CapsuleType.glossary:
             continue
@@ -73,115 +150,259 @@ def build_glossary_index(capsules: List[Capsule]) -> Dict[str, str]:
     return idx
 
 
+def glossary_matcher(glossary_idx: Dict[str, str]) -> AhoCorasick:
+    if isinstance(glossary_idx, GlossaryIndex):
+        return glossary_idx.matcher
+    return AhoCorasick(glossary_idx.keys())
+
+
+def acronym_gap(
+    acr: str, span: Tuple[int, int], recipient_actor_id: Optional[str] = None
+) -> GapFinding:
+    return GapFinding(
+        span=span,
+        kind="acronym_unknown",
+        description=f"Acronym '{acr}' likely unknown to recipient.",
+        recipient_actor_id=recipient_actor_id,
+        suggested_bridge=f"{acr} = [define once here].",
+        supporting_capsule_ids=[],
+        confidence=0.75,
+    )
+
+
+def glossary_gap(
+    term: str,
+    definition: str,
+    span: Tuple[int, int],
+    recipient_actor_id: Optional[str] = None,
+) -> GapFinding:
+    return GapFinding(
+        span=span,
+        kind="missing_glossary",
+        description=(
+            f"Term '{term}' used; recipient likely hasn't seen its project-specific definition."
+        ),
+        recipient_actor_id=recipient_actor_id,
+        suggested_bridge=f"{term} ({definition})",
+        supporting_capsule_ids=[],
+        confidence=0.65,
+    )
+
+
 def gap_findings(
     draft: str,
     glossary_idx: Dict[str, str],
     recipient_exposure_terms: Optional[Dict[str, float]] = None,
     recipient_actor_id: Optional[str] = None,
+    doc: Optional[DraftDocument] = None,
 ) -> List[GapFinding]:
+    """Acronym and glossary gaps for one recipient.
+
+    Pass the draft's `doc` when scoring several recipients so the text is scanned once.
+    """
     recipient_exposure_terms = recipient_exposure_terms or {}
+    if doc is None:
+        doc = DraftDocument(draft)
 
     gaps: List[GapFinding] = []
 
-    for acr, span in extract_acronyms(draft):
-        known = recipient_exposure_terms.get(acr.lower(), 0.0) > 0.5 or (acr.lower() in glossary_idx)
+    for acr, span in doc.acronyms:
+        known = (
+            recipient_exposure_terms.get(acr.lower(), 0.0) > KNOWN_TERM_STRENGTH
+            or acr.lower() in glossary_idx
+        )
         if not known:
-            gaps.append(
-                GapFinding(
-                    span=span,
-                    kind="acronym_unknown",
-                    description=f"Acronym '{acr}' likely unknown to recipient.",
-                    recipient_actor_id=recipient_actor_id,
-                    suggested_bridge=f"{acr} = [define once here].",
-                    supporting_capsule_ids=[],
-                    confidence=0.75,
-                )
-            )
+            gaps.append(acronym_gap(acr, span, recipient_actor_id))
 
-    for term, definition in glossary_idx.items():
-        if term in draft.lower():
-            seen = recipient_exposure_terms.get(term, 0.0) > 0.5
-            if not seen:
-                pos = draft.lower().find(term)
-                span = (pos, pos + len(term))
-                gaps.append(
-                    GapFinding(
-                        span=span,
-                        kind="missing_glossary",
-                        description=(
-                            f"Term '{term}' used; recipient likely hasn't seen its project-specific definition."
-                        ),
-                        recipient_actor_id=recipient_actor_id,
-                        suggested_bridge=f"{term} ({definition})",
-                        supporting_capsule_ids=[],
-                        confidence=0.65,
-                    )
-                )
+    for start, end, term in doc.matches(glossary_matcher(glossary_idx)):
+        if recipient_exposure_terms.get(term, 0.0) > KNOWN_TERM_STRENGTH:
+            continue
+        gaps.append(
+            glossary_gap(term, glossary_idx.get(term, ""), (start, end), recipient_actor_id)
+        )
 
     return gaps
 
 
+# Trigger words behind the heuristic constraint/capability conflict checks.
+CLOUD_WORDS = ("cloud", "hosted")
+TIMELINE_WORDS = ("next week", "tomorrow")
+# Only constraints whose title contains this can conflict with cloud wording.
+NO_CLOUD = "no cloud"
+
+
+def constraint_keywords(c: Capsule) -> List[str]:
+    return [w for w in c.title.lower().split() if len(w) >= 5]
+
+
+def evidence_mismatch(stated: EvidenceLevel, expected: EvidenceLevel, span: Span) -> MismatchFinding:
+    return MismatchFinding(
+        span=span,
+        kind="evidence_mismatch",
+        description=(
+            f"Draft reads as '{stated.value}' but audience expects at least '{expected.value}'."
+        ),
+        conflicting_capsule_id=None,
+        recommendation="Add uncertainty framing or attach evidence/measurement plan.",
+        confidence=0.72,
+    )
+
+
+def evidence_span(
+    confident: Optional[Span], hedged: Optional[Span], draft_len: int
+) -> Span:
+    """Where the stated evidence level comes from: the deciding word, else the opening."""
+    return confident or hedged or (0, min(draft_len, 120))
+
+
+def constraint_conflict(c: Capsule, span: Span) -> MismatchFinding:
+    return MismatchFinding(
+        span=span,
+        kind="constraint_conflict",
+        description=f"Potential conflict with constraint: {c.title}",
+        conflicting_capsule_id=c.capsule_id,
+        recommendation=(
+            "Reframe as local-first alternative or request an exception explicitly."
+        ),
+        confidence=0.88,
+    )
+
+
+def capability_conflict(cap: Capsule, span: Span) -> MismatchFinding:
+    meta = cap.meta or {}
+    return MismatchFinding(
+        span=span,
+        kind="capability_conflict",
+        description=(
+            "Timeline wording may conflict with capability lead time "
+            f"({meta.get('lead_time_days')} days): {cap.title}"
+        ),
+        conflicting_capsule_id=cap.capsule_id,
+        recommendation=(
+            "State an achievable schedule or split prototype vs certified production plan."
+        ),
+        confidence=0.70,
+    )
+
+
+@dataclass
+class ConflictScan:
+    """Trigger hits of one ConflictIndex.scan: first keyword span per constraint, and the
+    spans of cloud and timeline wording, in text order."""
+
+    constraint_hits: Dict[str, Span] = field(default_factory=dict)
+    cloud: List[Span] = field(default_factory=list)
+    timeline: List[Span] = field(default_factory=list)
+
+    def shifted(self, offset: int) -> "ConflictScan":
+        return ConflictScan(
+            constraint_hits={
+                cid: (s + offset, e + offset) for cid, (s, e) in self.constraint_hits.items()
+            },
+            cloud=[(s + offset, e + offset) for s, e in self.cloud],
+            timeline=[(s + offset, e + offset) for s, e in self.timeline],
+        )
+
+    @classmethod
+    def combine(cls, scans: Iterable["ConflictScan"]) -> "ConflictScan":
+        """Merge scans of consecutive text pieces (already shifted, in text order)."""
+        out = cls()
+        for scan in scans:
+            for cid, span in scan.constraint_hits.items():
+                out.constraint_hits.setdefault(cid, span)
+            out.cloud.extend(scan.cloud)
+            out.timeline.extend(scan.timeline)
+        return out
+
+
+class ConflictIndex:
+    """Inverted index from trigger words/phrases to the constraints and capabilities they
+    can fire, with one Aho-Corasick automaton over all of them.
+
+    Built once per workspace; `scan` is a single pass over the text whatever the number of
+    constraints. Capsules that can never fire (constraints without "no cloud" in the title,
+    capabilities without a lead time) are left out at build time.
+    """
+
+    def __init__(self, constraints: Iterable[Capsule], capabilities: Iterable[Capsule]):
+        self.constraints: Dict[str, Capsule] = {
+            c.capsule_id: c for c in constraints if NO_CLOUD in c.title.lower()
+        }
+        self.capabilities: Dict[str, Capsule] = {
+            cap.capsule_id: cap
+            for cap in capabilities
+            if "lead_time_days" in (cap.meta or {})
+        }
+        self._keyword_owners: Dict[str, List[str]] = {}
+        for cid, c in self.constraints.items():
+            for w in dict.fromkeys(constraint_keywords(c)):
+                self._keyword_owners.setdefault(fold_case(w), []).append(cid)
+        self._cloud = {fold_case(w) for w in CLOUD_WORDS} if self.constraints else set()
+        self._timeline = {fold_case(w) for w in TIMELINE_WORDS} if self.capabilities else set()
+        self.matcher = AhoCorasick([*self._keyword_owners, *self._cloud, *self._timeline])
+
+    def scan(self, text: Union[str, DraftDocument]) -> ConflictScan:
+        hits = (
+            text.matches(self.matcher)
+            if isinstance(text, DraftDocument)
+            else self.matcher.find_all(text)
+        )
+        out = ConflictScan()
+        for start, end, pattern in hits:
+            span = (start, end)
+            for cid in self._keyword_owners.get(pattern, ()):
+                out.constraint_hits.setdefault(cid, span)
+            if pattern in self._cloud:
+                out.cloud.append(span)
+            if pattern in self._timeline:
+                out.timeline.append(span)
+        return out
+
+    def findings(
+        self, scan: ConflictScan, allowed_capabilities: Optional[Set[str]] = None
+    ) -> List[MismatchFinding]:
+        """Constraint then capability conflicts for a scan; each carries its trigger's span."""
+        out: List[MismatchFinding] = []
+        if scan.cloud:
+            for cid, c in self.constraints.items():
+                if cid in scan.constraint_hits:
+                    out.append(constraint_conflict(c, scan.cloud[0]))
+        if scan.timeline:
+            for cid, cap in self.capabilities.items():
+                if allowed_capabilities is None or cid in allowed_capabilities:
+                    out.append(capability_conflict(cap, scan.timeline[0]))
+        return out
+
+
 def mismatch_findings(
     draft: str,
     constraints: List[Capsule],
     capabilities: List[Capsule],
     expected_evidence: Optional[EvidenceLevel],
+    index: Optional[ConflictIndex] = None,
+    allowed_capabilities: Optional[Set[str]] = None,
+    doc: Optional[DraftDocument] = None,
 ) -> List[MismatchFinding]:
+    """Evidence, constraint and capability mismatches.
+
+    Pass a prebuilt `index` (e.g. WorkspaceContext.conflicts) to skip compiling one from
+    `constraints`/`capabilities`; `allowed_capabilities` then restricts capability hits.
+    `doc` reuses the draft's tokenization pass.
+    """
     mismatches: List[MismatchFinding] = []
+    if doc is None:
+        doc = DraftDocument(draft)
 
     if expected_evidence is not None:
-        stated = evidence_word_level(draft)
+        confident, hedged = doc.first_confident(), doc.first_hedged()
+        stated = evidence_level_from_flags(confident is not None, hedged is not None)
         if EVID_ORDER[stated] < EVID_ORDER[expected_evidence]:
-            mismatches.append(
-                MismatchFinding(
-                    span=(0, min(len(draft), 120)),
-                    kind="evidence_mismatch",
-                    description=(
-                        f"Draft reads as '{stated.value}' but audience expects at least '{expected_evidence.value}'."
-                    ),
-                    conflicting_capsule_id=None,
-                    recommendation="Add uncertainty framing or attach evidence/measurement plan.",
-                    confidence=0.72,
-                )
-            )
-
-    lower = draft.lower()
-    for c in constraints:
-        key = c.title.lower()
-        if any(w in lower for w in key.split() if len(w) >= 5):
-            if "no cloud" in c.title.lower() and ("cloud" in lower or "hosted" in lower):
-                mismatches.append(
-                    MismatchFinding(
-                        span=(0, min(len(draft), 200)),
-                        kind="constraint_conflict",
-                        description=f"Potential conflict with constraint: {c.title}",
-                        conflicting_capsule_id=c.capsule_id,
-                        recommendation=(
-                            "Reframe as local-first alternative or request an exception explicitly."
-                        ),
-                        confidence=0.88,
-                    )
-                )
-
-    for cap in capabilities:
-        meta = cap.meta or {}
-        if "lead_time_days" in meta and ("next week" in lower or "tomorrow" in lower):
-            mismatches.append(
-                MismatchFinding(
-                    span=(0, min(len(draft), 200)),
-                    kind="capability_conflict",
-                    description=(
-                        "Timeline wording may conflict with capability lead time "
-                        f"({meta.get('lead_time_days')} days): {cap.title}"
-                    ),
-                    conflicting_capsule_id=cap.capsule_id,
-                    recommendation=(
-                        "State an achievable schedule or split prototype vs certified production plan."
-                    ),
-                    confidence=0.70,
-                )
-            )
+            span = evidence_span(confident, hedged, len(draft))
+            mismatches.append(evidence_mismatch(stated, expected_evidence, span))
 
+    if index is None:
+        index = ConflictIndex(constraints, capabilities)
+    mismatches.extend(index.findings(index.scan(doc), allowed_capabilities))
     return mismatches
 
 
@@ -190,37 +411,48 @@ def cosine(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / denom)
 
 
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32).ravel()
+    return v / (np.linalg.norm(v) + 1e-9)
+
+
 def rare_thought_findings(
     idea_spans: List[Tuple[int, int]],
-    idea_vecs: List[List[float]],
-    group_centroid_vec: Optional[List[float]],
-    goal_centroid_vec: Optional[List[float]],
+    idea_vecs: Union[np.ndarray, List[List[float]]],
+    group_centroid_vec: Optional[Union[np.ndarray, List[float]]],
+    goal_centroid_vec: Optional[Union[np.ndarray, List[float]]],
     draft: str,
 ) -> List[RareThoughtFinding]:
-    if group_centroid_vec is None or goal_centroid_vec is None:
+    """Spans far from the group centroid (novel) yet close to the goal centroid (relevant).
+
+    All spans are scored at once: one (n, d) matrix against both centroids.
+    """
+    if group_centroid_vec is None or goal_centroid_vec is None or not idea_spans:
+        return []
+    mat = np.asarray(idea_vecs, dtype=np.float32).reshape(len(idea_spans), -1)
+    g = _unit(group_centroid_vec)
+    t = _unit(goal_centroid_vec)
+    if mat.shape[1] != g.shape[0] or mat.shape[1] != t.shape[0]:
         return []
-    g = np.array(group_centroid_vec, dtype=np.float32)
-    t = np.array(goal_centroid_vec, dtype=np.float32)
+    mat = mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-9)
+    novelty = np.clip(1.0 - mat @ g, 0.0, 1.0)
+    relevance = np.clip(mat @ t, 0.0, 1.0)
 
     out: List[RareThoughtFinding] = []
-    for (span, vec) in zip(idea_spans, idea_vecs):
-        v = np.array(vec, dtype=np.float32)
-        novelty = max(0.0, min(1.0, 1.0 - cosine(v, g)))
-        relevance = max(0.0, min(1.0, cosine(v, t)))
-
-        if novelty > 0.55 and relevance > 0.40:
-            snippet = draft[span[0]:span[1]].strip()
-            out.append(
-                RareThoughtFinding(
-                    span=span,
-                    idea_summary=(snippet[:200] + ("..." if len(snippet) > 200 else "")),
-                    fit_map=["Relates to current goals/open questions (high semantic overlap)."],
-                    protect_notes=(
-                        "Novel viewpoint detected: frame it as a testable option; do not dilute into consensus."
-                    ),
-                    novelty=novelty,
-                    relevance=relevance,
-                )
+    for i in np.flatnonzero((novelty > 0.55) & (relevance > 0.40)):
+        span = idea_spans[i]
+        snippet = draft[span[0]:span[1]].strip()
+        out.append(
+            RareThoughtFinding(
+                span=span,
+                idea_summary=(snippet[:200] + ("..." if len(snippet) > 200 else "")),
+                fit_map=["Relates to current goals/open questions (high semantic overlap)."],
+                protect_notes=(
+                    "Novel viewpoint detected: frame it as a testable option; do not dilute into consensus."
+                ),
+                novelty=float(novelty[i]),
+                relevance=float(relevance[i]),
             )
+        )
 
     return out
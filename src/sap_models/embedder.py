@@ -15,6 +15,7 @@ class LocalEmbedder:
             raise RuntimeError(
                 "sentence-transformers not installed. Install with: pip install sap[models]"
             )
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
 
     def embed(self, texts: List[str]) -> List[List[float]]:
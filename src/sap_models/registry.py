@@ -1,14 +1,28 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
+import os
+from threading import Lock, Thread
+import time
+from typing import Dict, Optional, Set
 
 from sap_models.catalog import ModelSpec
+from sap_models.embedder import LocalEmbedder
 from sap_models.llm import LocalLLM
 
+# Sentence embedder used for draft analysis (rare thoughts); "" disables it.
+EMBED_MODEL = os.environ.get("SAP_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Seconds before a failed embedder load is attempted again.
+EMBED_RETRY_SECONDS = float(os.environ.get("SAP_EMBED_RETRY_SECONDS", "300"))
+
 
 class ModelRegistry:
     def __init__(self) -> None:
         self._llms: Dict[str, LocalLLM] = {}
+        self._embedders: Dict[str, LocalEmbedder] = {}
+        # model name -> time.monotonic() of the last failed load
+        self._embed_failed: Dict[str, float] = {}
+        self._embed_loading: Set[str] = set()
+        self._embed_lock = Lock()
 
     def get_llm(self, spec: ModelSpec) -> Optional[LocalLLM]:
         if spec.path is None:
@@ -19,5 +33,52 @@ class ModelRegistry:
         self._llms[spec.name] = llm
         return llm
 
+    def _load_embedder(self, model_name: str) -> None:
+        try:
+            embedder = LocalEmbedder(model_name)
+        except Exception:
+            with self._embed_lock:
+                self._embed_failed[model_name] = time.monotonic()
+                self._embed_loading.discard(model_name)
+            return
+        with self._embed_lock:
+            self._embedders[model_name] = embedder
+            self._embed_failed.pop(model_name, None)
+            self._embed_loading.discard(model_name)
+
+    def _start_load(self, model_name: str) -> bool:
+        """Claim the load of `model_name`; False when loaded, loading or backing off."""
+        with self._embed_lock:
+            if model_name in self._embedders or model_name in self._embed_loading:
+                return False
+            failed = self._embed_failed.get(model_name)
+            if failed is not None and time.monotonic() - failed < EMBED_RETRY_SECONDS:
+                return False
+            self._embed_loading.add(model_name)
+            return True
+
+    def get_embedder(
+        self, model_name: str = EMBED_MODEL, wait: bool = True
+    ) -> Optional[LocalEmbedder]:
+        """Shared embedder, or None when disabled, still loading or recently failed to load.
+
+        With `wait=False` a missing model is loaded on a background thread and None is
+        returned until it is ready, so request handlers never block on the download. A failed
+        load is retried after SAP_EMBED_RETRY_SECONDS.
+        """
+        if not model_name:
+            return None
+        if self._start_load(model_name):
+            if wait:
+                self._load_embedder(model_name)
+            else:
+                Thread(
+                    target=self._load_embedder,
+                    args=(model_name,),
+                    name="embedder-load",
+                    daemon=True,
+                ).start()
+        return self._embedders.get(model_name)
+
 
 registry = ModelRegistry()
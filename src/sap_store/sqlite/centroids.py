@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from sap_store.sqlite.embeddings import VEC_DTYPE, VEC_DTYPE_NAME
+
+# Sums are kept in float64 so long insert/delete histories do not drift.
+SUM_DTYPE = np.dtype("<f8")
+FACET_ALL = "all"
+FACET_TYPE = "type"
+FACET_LENS = "lens"
+FACET_CIRCLE = "circle"
+# Embedding rows decoded per batch by rebuild_centroids.
+REBUILD_BATCH = 2048
+
+FacetKey = Tuple[str, str]
+_SumKey = Tuple[str, int, str, str]  # (owner_type, dim, facet, facet_value)
+
+
+def facet_keys(
+    capsule_type: Optional[str], lens_tags_json: Optional[str], circle_id: Optional[str]
+) -> List[FacetKey]:
+    """Every (facet, value) a vector contributes to; 'all' always, the rest when known."""
+    keys: List[FacetKey] = [(FACET_ALL, "")]
+    if capsule_type:
+        keys.append((FACET_TYPE, capsule_type))
+    try:
+        lenses = json.loads(lens_tags_json or "[]")
+    except ValueError:
+        lenses = []
+    for lens in dict.fromkeys(lenses if isinstance(lenses, list) else []):
+        keys.append((FACET_LENS, str(lens)))
+    if circle_id:
+        keys.append((FACET_CIRCLE, str(circle_id)))
+    return keys
+
+
+def _unit_rows(blobs: List[bytes], dim: int) -> np.ndarray:
+    mat = np.frombuffer(b"".join(blobs), dtype=VEC_DTYPE).reshape(len(blobs), dim).astype(SUM_DTYPE)
+    return mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12)
+
+
+class _Sums:
+    """Accumulates signed unit-vector sums per key, grouping rows so numpy does the adding."""
+
+    def __init__(self) -> None:
+        self._rows: Dict[Tuple[str, int], List[Tuple[bytes, int, List[FacetKey]]]] = {}
+
+    def add(self, owner_type: str, dim: int, blob: bytes, sign: int, keys: List[FacetKey]) -> None:
+        if len(blob) != dim * VEC_DTYPE.itemsize:
+            return
+        self._rows.setdefault((owner_type, dim), []).append((blob, sign, keys))
+
+    def totals(self) -> Dict[_SumKey, Tuple[np.ndarray, int]]:
+        out: Dict[_SumKey, Tuple[np.ndarray, int]] = {}
+        for (owner_type, dim), rows in self._rows.items():
+            signed = _unit_rows([b for b, _s, _k in rows], dim) * np.array(
+                [[s] for _b, s, _k in rows], dtype=SUM_DTYPE
+            )
+            by_key: Dict[FacetKey, List[int]] = {}
+            for i, (_b, _s, keys) in enumerate(rows):
+                for key in keys:
+                    by_key.setdefault(key, []).append(i)
+            for (facet, value), idx in by_key.items():
+                out[(owner_type, dim, facet, value)] = (
+                    signed[idx].sum(axis=0),
+                    int(sum(rows[i][1] for i in idx)),
+                )
+        return out
+
+
+def _apply(con, workspace_id: str, totals: Dict[_SumKey, Tuple[np.ndarray, int]]) -> None:
+    if not totals:
+        return
+    existing: Dict[_SumKey, Tuple[np.ndarray, int]] = {}
+    for r in con.execute(
+        "SELECT owner_type, dim, facet, facet_value, vec_sum, n FROM centroid WHERE workspace_id=?",
+        (workspace_id,),
+    ).fetchall():
+        key = (r["owner_type"], int(r["dim"]), r["facet"], r["facet_value"])
+        if key in totals:
+            existing[key] = (np.frombuffer(r["vec_sum"], dtype=SUM_DTYPE), int(r["n"]))
+    upserts = []
+    deletes = []
+    for key, (vec, n) in totals.items():
+        old_vec, old_n = existing.get(key, (None, 0))
+        new_n = old_n + n
+        if new_n <= 0:
+            deletes.append((workspace_id, *key))
+            continue
+        new_vec = vec if old_vec is None else old_vec + vec
+        upserts.append((workspace_id, *key, new_vec.astype(SUM_DTYPE).tobytes(), new_n))
+    con.executemany(
+        """
+        INSERT OR REPLACE INTO centroid(workspace_id, owner_type, dim, facet, facet_value, vec_sum, n)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        upserts,
+    )
+    con.executemany(
+        """
+        DELETE FROM centroid
+        WHERE workspace_id=? AND owner_type=? AND dim=? AND facet=? AND facet_value=?
+        """,
+        deletes,
+    )
+
+
+def _rebuild_sums(con, workspace_id: str) -> Tuple[_Sums, int]:
+    cur = con.execute(
+        """
+        SELECT e.owner_type, e.dim, e.vec_blob, c.type AS capsule_type, c.lens_tags_json,
+               CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+                 AS circle_id
+        FROM embedding e
+        LEFT JOIN capsule c ON e.owner_type = 'capsule' AND c.capsule_id = e.owner_id
+        WHERE e.workspace_id=? AND e.dtype=? AND e.vec_blob IS NOT NULL
+        """,
+        (workspace_id, VEC_DTYPE_NAME),
+    )
+    sums = _Sums()
+    seen = 0
+    while True:
+        rows = cur.fetchmany(REBUILD_BATCH)
+        if not rows:
+            break
+        for r in rows:
+            keys = facet_keys(r["capsule_type"], r["lens_tags_json"], r["circle_id"])
+            sums.add(r["owner_type"], int(r["dim"]), r["vec_blob"], 1, keys)
+        seen += len(rows)
+    return sums, seen
+
+
+def _delta_sums(rows) -> _Sums:
+    sums = _Sums()
+    for r in rows:
+        if r["dtype"] != VEC_DTYPE_NAME:
+            continue
+        keys = facet_keys(r["capsule_type"], r["lens_tags_json"], r["circle_id"])
+        sums.add(r["owner_type"], int(r["dim"]), r["vec_blob"], int(r["sign"]), keys)
+    return sums
+
+
+_DELTA_COLUMNS = "owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id"
+
+
+def _is_stale(con, workspace_id: str) -> bool:
+    return con.execute(
+        "SELECT 1 FROM centroid_stale WHERE workspace_id=?", (workspace_id,)
+    ).fetchone() is not None
+
+
+def rebuild_centroids(con, workspace_id: str) -> int:
+    """Recompute every centroid of a workspace from the embedding table; returns vectors read."""
+    # Writing first takes the write lock, so no delta can slip in between the clear and the scan.
+    con.execute("DELETE FROM centroid_delta WHERE workspace_id=?", (workspace_id,))
+    con.execute("DELETE FROM centroid WHERE workspace_id=?", (workspace_id,))
+    sums, seen = _rebuild_sums(con, workspace_id)
+    _apply(con, workspace_id, sums.totals())
+    con.execute("DELETE FROM centroid_stale WHERE workspace_id=?", (workspace_id,))
+    return seen
+
+
+def refresh_centroids(con, workspace_id: str) -> int:
+    """Fold pending embedding writes into the running sums; returns deltas applied.
+
+    Runs as the `centroid_refresh` job that triggers queue on every delta (see migration
+    0018). Cost is proportional to the writes since the last refresh, not to the workspace
+    size. Workspaces flagged stale by triggers are rebuilt instead.
+    """
+    if _is_stale(con, workspace_id):
+        rebuild_centroids(con, workspace_id)
+        return 0
+    if not con.execute(
+        "SELECT 1 FROM centroid_delta WHERE workspace_id=? LIMIT 1", (workspace_id,)
+    ).fetchone():
+        return 0
+    # Claiming the rows by deleting them keeps concurrent refreshes from double counting.
+    rows = con.execute(
+        f"DELETE FROM centroid_delta WHERE workspace_id=? RETURNING {_DELTA_COLUMNS}",
+        (workspace_id,),
+    ).fetchall()
+    _apply(con, workspace_id, _delta_sums(rows).totals())
+    return len(rows)
+
+
+def _current_sums(con, workspace_id: str, owner_type: str) -> Dict[_SumKey, Tuple[np.ndarray, int]]:
+    """Stored sums with pending deltas folded in memory (or a full scan while stale)."""
+    if _is_stale(con, workspace_id):
+        sums, _seen = _rebuild_sums(con, workspace_id)
+        totals = sums.totals()
+        return {k: v for k, v in totals.items() if k[0] == owner_type}
+    out: Dict[_SumKey, Tuple[np.ndarray, int]] = {}
+    for r in con.execute(
+        """
+        SELECT dim, facet, facet_value, vec_sum, n FROM centroid
+        WHERE workspace_id=? AND owner_type=?
+        """,
+        (workspace_id, owner_type),
+    ).fetchall():
+        key = (owner_type, int(r["dim"]), r["facet"], r["facet_value"])
+        out[key] = (np.frombuffer(r["vec_sum"], dtype=SUM_DTYPE), int(r["n"]))
+    pending = con.execute(
+        f"SELECT {_DELTA_COLUMNS} FROM centroid_delta WHERE workspace_id=? AND owner_type=?",
+        (workspace_id, owner_type),
+    ).fetchall()
+    for key, (vec, n) in _delta_sums(pending).totals().items():
+        old_vec, old_n = out.get(key, (None, 0))
+        out[key] = (vec if old_vec is None else old_vec + vec, old_n + n)
+    return out
+
+
+def load_centroids(
+    con,
+    workspace_id: str,
+    owner_type: str = "capsule",
+    dim: Optional[int] = None,
+    facets: Optional[Iterable[str]] = None,
+) -> Tuple[Optional[int], Dict[FacetKey, np.ndarray]]:
+    """(dim, {(facet, value): unit centroid}) including writes not yet folded in.
+
+    A pure read, safe on read-only connections: pending deltas are added in memory and left
+    for the centroid_refresh job. Without `dim`, the dimension with the most vectors is used.
+    """
+    sums = _current_sums(con, workspace_id, owner_type)
+    if dim is None:
+        totals = [(n, d) for (_o, d, facet, _v), (_vec, n) in sums.items() if facet == FACET_ALL]
+        if not totals or max(totals)[0] <= 0:
+            return None, {}
+        dim = max(totals)[1]
+    wanted = None if facets is None else set(facets)
+    out: Dict[FacetKey, np.ndarray] = {}
+    for (_o, d, facet, value), (vec, n) in sums.items():
+        if d != dim or n <= 0 or (wanted is not None and facet not in wanted):
+            continue
+        norm = np.linalg.norm(vec)
+        if norm > 1e-9:
+            out[(facet, value)] = (vec / norm).astype(np.float32)
+    return dim, out
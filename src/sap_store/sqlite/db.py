@@ -4,6 +4,7 @@ import os
 import sqlite3
 from contextlib import contextmanager
 from pathlib import Path
+from typing import Optional
 
 DEFAULT_DB_PATH = Path(os.environ.get("SAP_DB_PATH", Path.home() / ".sap" / "sap.db"))
 
@@ -20,6 +21,28 @@ def connect(db_path: Path = DEFAULT_DB_PATH) -> sqlite3.Connection:
     return con
 
 
+def connect_readonly(db_path: Path = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """Connection that cannot write (opened with mode=ro), e.g. for analysis worker processes."""
+    uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+    con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA query_only=ON;")
+    return con
+
+
+def is_readonly(con) -> bool:
+    """True for connections opened by connect_readonly (or otherwise set query_only)."""
+    return bool(con.execute("PRAGMA query_only").fetchone()[0])
+
+
+def database_path(con) -> Optional[Path]:
+    """File behind the connection's main database; None for in-memory and temp databases."""
+    for row in con.execute("PRAGMA database_list").fetchall():
+        if row[1] == "main":
+            return Path(row[2]) if row[2] else None
+    return None
+
+
 @contextmanager
 def db_session(db_path: Path = DEFAULT_DB_PATH):
     con = connect(db_path)
@@ -31,3 +54,10 @@ def db_session(db_path: Path = DEFAULT_DB_PATH):
         raise
     finally:
         con.close()
+
+
+def vector_dir(db_path: Path = DEFAULT_DB_PATH) -> Path:
+    """Directory for vector index files kept next to the SQLite database."""
+    path = Path(db_path).parent / "vectors"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from datetime import datetime
+import json
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import ulid
+
+# Vectors are stored as raw little-endian float32 so a whole workspace can be
+# decoded with a single np.frombuffer call instead of one json.loads per row.
+VEC_DTYPE = np.dtype("<f4")
+VEC_DTYPE_NAME = "float32"
+
+
+def encode_vec(vec: Sequence[float]) -> bytes:
+    return np.asarray(vec, dtype=VEC_DTYPE).tobytes()
+
+
+def decode_vec(blob: bytes, dim: int) -> np.ndarray:
+    return np.frombuffer(blob, dtype=VEC_DTYPE, count=dim)
+
+
+def insert_embedding(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    owner_id: str,
+    vec: Sequence[float],
+    model_name: Optional[str] = None,
+) -> str:
+    arr = np.asarray(vec, dtype=VEC_DTYPE).reshape(-1)
+    embedding_id = str(ulid.new())
+    con.execute(
+        """
+        INSERT INTO embedding(
+            embedding_id, workspace_id, owner_type, owner_id, dim, dtype, model_name, vec_blob, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            embedding_id,
+            workspace_id,
+            owner_type,
+            owner_id,
+            int(arr.shape[0]),
+            VEC_DTYPE_NAME,
+            model_name,
+            arr.tobytes(),
+            datetime.utcnow().isoformat(),
+        ),
+    )
+    return embedding_id
+
+
+def delete_embeddings(con, workspace_id: str, owner_type: str, owner_ids: Iterable[str]) -> int:
+    ids = list(owner_ids)
+    if not ids:
+        return 0
+    qmarks = ",".join("?" for _ in ids)
+    cur = con.execute(
+        f"DELETE FROM embedding WHERE workspace_id=? AND owner_type=? AND owner_id IN ({qmarks})",
+        [workspace_id, owner_type, *ids],
+    )
+    return cur.rowcount
+
+
+def load_embedding_matrix(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    dim: int,
+) -> Tuple[List[str], np.ndarray]:
+    """Return (owner_ids, (n, dim) float32 matrix) for every stored vector of `dim`."""
+    ids, mat, _max_rowid = load_embedding_rows(con, workspace_id, owner_type, dim)
+    return ids, mat
+
+
+def load_embedding_rows(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    dim: int,
+    after_rowid: int = 0,
+) -> Tuple[List[str], np.ndarray, int]:
+    """Like load_embedding_matrix, restricted to rows newer than `after_rowid`.
+
+    Also returns the highest `seq` seen so callers can snapshot a watermark; seq is an
+    AUTOINCREMENT key, so it never goes backwards or gets reused.
+    """
+    rows = con.execute(
+        """
+        SELECT seq, owner_id, vec_blob FROM embedding
+        WHERE workspace_id=? AND owner_type=? AND dim=? AND dtype=? AND vec_blob IS NOT NULL
+          AND seq > ?
+        ORDER BY seq
+        """,
+        (workspace_id, owner_type, dim, VEC_DTYPE_NAME, after_rowid),
+    ).fetchall()
+    if not rows:
+        return [], np.empty((0, dim), dtype=VEC_DTYPE), after_rowid
+    ids = [r["owner_id"] for r in rows]
+    buf = b"".join(r["vec_blob"] for r in rows)
+    mat = np.frombuffer(buf, dtype=VEC_DTYPE).reshape(len(ids), dim)
+    return ids, mat, int(rows[-1]["seq"])
+
+
+def load_embeddings_for_owners(
+    con,
+    workspace_id: str,
+    owner_type: str,
+    dim: int,
+    owner_ids: Sequence[str],
+) -> Tuple[List[str], np.ndarray]:
+    """Decode the stored vectors of specific owners (latest row wins for duplicates)."""
+    if not owner_ids:
+        return [], np.empty((0, dim), dtype=VEC_DTYPE)
+    qmarks = ",".join("?" for _ in owner_ids)
+    rows = con.execute(
+        f"""
+        SELECT owner_id, vec_blob FROM embedding
+        WHERE workspace_id=? AND owner_type=? AND dim=? AND dtype=? AND vec_blob IS NOT NULL
+          AND owner_id IN ({qmarks})
+        ORDER BY seq
+        """,
+        [workspace_id, owner_type, dim, VEC_DTYPE_NAME, *owner_ids],
+    ).fetchall()
+    latest = {r["owner_id"]: r["vec_blob"] for r in rows}
+    if not latest:
+        return [], np.empty((0, dim), dtype=VEC_DTYPE)
+    ids = list(latest)
+    mat = np.frombuffer(b"".join(latest[i] for i in ids), dtype=VEC_DTYPE).reshape(len(ids), dim)
+    return ids, mat
+
+
+def dominant_dim(con, workspace_id: str, owner_type: str) -> Optional[int]:
+    """Most common vector dimension stored for a workspace/owner type, if any."""
+    row = con.execute(
+        """
+        SELECT dim FROM embedding WHERE workspace_id=? AND owner_type=?
+        GROUP BY dim ORDER BY COUNT(*) DESC LIMIT 1
+        """,
+        (workspace_id, owner_type),
+    ).fetchone()
+    return int(row["dim"]) if row else None
+
+
+def embedding_owner_ids(
+    con, workspace_id: str, owner_type: str, dim: Optional[int] = None
+) -> Set[str]:
+    if dim is None:
+        rows = con.execute(
+            "SELECT owner_id FROM embedding WHERE workspace_id=? AND owner_type=?",
+            (workspace_id, owner_type),
+        ).fetchall()
+    else:
+        rows = con.execute(
+            """
+            SELECT owner_id FROM embedding
+            WHERE workspace_id=? AND owner_type=? AND dim=? AND dtype=? AND vec_blob IS NOT NULL
+            """,
+            (workspace_id, owner_type, dim, VEC_DTYPE_NAME),
+        ).fetchall()
+    return {r["owner_id"] for r in rows}
+
+
+def count_embedding_owners(con, workspace_id: str, owner_type: str, dim: int) -> int:
+    """Distinct owners with a loadable vector of `dim` (what an index over them holds)."""
+    row = con.execute(
+        """
+        SELECT COUNT(DISTINCT owner_id) AS n FROM embedding
+        WHERE workspace_id=? AND owner_type=? AND dim=? AND dtype=? AND vec_blob IS NOT NULL
+        """,
+        (workspace_id, owner_type, dim, VEC_DTYPE_NAME),
+    ).fetchone()
+    return int(row["n"])
+
+
+def convert_json_embeddings(con, batch_size: int = 500) -> int:
+    """Rewrite legacy vec_json rows as float32 blobs. Returns the number of rows converted."""
+    converted = 0
+    while True:
+        rows = con.execute(
+            "SELECT embedding_id, vec_json FROM embedding WHERE vec_blob IS NULL AND vec_json IS NOT NULL LIMIT ?",
+            (batch_size,),
+        ).fetchall()
+        if not rows:
+            return converted
+        updates = []
+        for r in rows:
+            arr = np.asarray(json.loads(r["vec_json"]), dtype=VEC_DTYPE).reshape(-1)
+            updates.append((int(arr.shape[0]), VEC_DTYPE_NAME, arr.tobytes(), r["embedding_id"]))
+        con.executemany(
+            "UPDATE embedding SET dim=?, dtype=?, vec_blob=?, vec_json=NULL WHERE embedding_id=?",
+            updates,
+        )
+        converted += len(updates)
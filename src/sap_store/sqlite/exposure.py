@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+import json
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import ulid
+
+# Matches PolicyConfig.exposure_half_life_days; None disables decay.
+DEFAULT_HALF_LIFE_DAYS: Optional[float] = 180.0
+# Decayed sums are capped here when read, so repeated exposure saturates instead of growing.
+MAX_TERM_STRENGTH = 1.0
+# Actors rebuilt per statement by recompute_workspace_exposure.
+RECOMPUTE_BATCH = 500
+
+
+def glossary_terms(body: str, meta_json: Optional[str]) -> List[str]:
+    """Lower-cased terms a glossary capsule defines (meta "terms" list, else "term: ...")."""
+    meta = json.loads(meta_json or "{}")
+    if "terms" in meta:
+        terms = [(t.get("term") or "").strip().lower() for t in meta["terms"]]
+        return [t for t in dict.fromkeys(terms) if t]
+    key = body.split(":", 1)[0].strip().lower()
+    return [key] if key else []
+
+
+def _parse_ts(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def decay_factor(
+    later: Optional[datetime], earlier: Optional[datetime], half_life_days: Optional[float]
+) -> float:
+    """0.5 ** (elapsed days / half-life); 1.0 without decay or when either time is unknown."""
+    if not half_life_days or later is None or earlier is None or later <= earlier:
+        return 1.0
+    days = (later - earlier).total_seconds() / 86400.0
+    return 0.5 ** (days / half_life_days)
+
+
+class _Aggregate:
+    """Decayed strength sum for one (actor, term), anchored at its latest exposure.
+
+    Folding an event is O(1) whatever its position in time: a newer event decays the sum up
+    to the event and moves the anchor, an older one is decayed to the anchor and added.
+    """
+
+    __slots__ = ("strength", "exposures", "anchor")
+
+    def __init__(self, strength: float = 0.0, exposures: int = 0, anchor: Optional[datetime] = None):
+        self.strength = strength
+        self.exposures = exposures
+        self.anchor = anchor
+
+    def fold(self, strength: float, ts: Optional[datetime], half_life_days: Optional[float]) -> None:
+        if self.anchor is None or (ts is not None and ts > self.anchor):
+            self.strength = self.strength * decay_factor(ts, self.anchor, half_life_days) + strength
+            self.anchor = ts if ts is not None else self.anchor
+        else:
+            self.strength += strength * decay_factor(self.anchor, ts, half_life_days)
+        self.exposures += 1
+
+
+def _write_aggregates(
+    con,
+    workspace_id: str,
+    half_life_days: Optional[float],
+    aggregates: Dict[Tuple[str, str], _Aggregate],
+) -> None:
+    con.executemany(
+        """
+        INSERT OR REPLACE INTO actor_term_exposure(
+            workspace_id, actor_id, term, strength, exposures, last_exposed_at, half_life_days
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                workspace_id,
+                actor_id,
+                term,
+                agg.strength,
+                agg.exposures,
+                agg.anchor.isoformat() if agg.anchor is not None else None,
+                half_life_days,
+            )
+            for (actor_id, term), agg in aggregates.items()
+        ],
+    )
+
+
+def _qmarks(values: Sequence[object]) -> str:
+    return ",".join("?" for _ in values)
+
+
+def _stale_actors(
+    con, workspace_id: str, actor_ids: Sequence[str], half_life_days: Optional[float]
+) -> List[str]:
+    """Actors flagged by triggers, or whose rows were aggregated with another half-life."""
+    if not actor_ids:
+        return []
+    qmarks = _qmarks(actor_ids)
+    rows = con.execute(
+        f"""
+        SELECT actor_id FROM actor_term_exposure_stale
+        WHERE workspace_id=? AND actor_id IN ({qmarks})
+        UNION
+        SELECT actor_id FROM actor_term_exposure
+        WHERE workspace_id=? AND actor_id IN ({qmarks}) AND half_life_days IS NOT ?
+        """,
+        [workspace_id, *actor_ids, workspace_id, *actor_ids, half_life_days],
+    ).fetchall()
+    return [r["actor_id"] for r in rows]
+
+
+# (actor_id, capsule_id, exposure_type, timestamp, strength)
+ExposureRow = Tuple[str, str, str, str, float]
+
+
+def record_exposures(
+    con,
+    workspace_id: str,
+    events: Sequence[ExposureRow],
+    half_life_days: Optional[float] = DEFAULT_HALF_LIFE_DAYS,
+) -> List[str]:
+    """Insert exposure events with one executemany and fold them into term aggregates.
+
+    Cost is a fixed number of statements per batch, whatever the number of events or actors.
+    Actors already awaiting a full recompute only get their events inserted.
+    """
+    if not events:
+        return []
+    actor_ids = list(dict.fromkeys(e[0] for e in events))
+    pending = set(_stale_actors(con, workspace_id, actor_ids, half_life_days))
+    exposure_ids = [str(ulid.new()) for _ in events]
+    con.executemany(
+        """
+        INSERT INTO exposure(exposure_id, workspace_id, actor_id, capsule_id, exposure_type, timestamp, strength)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(eid, workspace_id, *e) for eid, e in zip(exposure_ids, events)],
+    )
+    fresh = [aid for aid in actor_ids if aid not in pending]
+    if not fresh:
+        return exposure_ids
+
+    capsule_ids = list(dict.fromkeys(e[1] for e in events if e[0] not in pending))
+    terms_by_capsule = {
+        r["capsule_id"]: glossary_terms(r["body"], r["meta_json"])
+        for r in con.execute(
+            f"""
+            SELECT capsule_id, body, meta_json FROM capsule
+            WHERE capsule_id IN ({_qmarks(capsule_ids)}) AND type='glossary'
+            """,
+            capsule_ids,
+        ).fetchall()
+    }
+    terms = list(dict.fromkeys(t for ts in terms_by_capsule.values() for t in ts))
+    if terms:
+        existing = con.execute(
+            f"""
+            SELECT actor_id, term, strength, exposures, last_exposed_at FROM actor_term_exposure
+            WHERE workspace_id=? AND actor_id IN ({_qmarks(fresh)}) AND term IN ({_qmarks(terms)})
+            """,
+            [workspace_id, *fresh, *terms],
+        ).fetchall()
+        aggregates = {
+            (r["actor_id"], r["term"]): _Aggregate(
+                float(r["strength"]), int(r["exposures"]), _parse_ts(r["last_exposed_at"])
+            )
+            for r in existing
+        }
+        for actor_id, capsule_id, _type, timestamp, strength in events:
+            if actor_id in pending:
+                continue
+            ts = _parse_ts(timestamp)
+            for term in terms_by_capsule.get(capsule_id, []):
+                aggregates.setdefault((actor_id, term), _Aggregate()).fold(
+                    float(strength), ts, half_life_days
+                )
+        _write_aggregates(con, workspace_id, half_life_days, aggregates)
+    # The insert trigger marks actors stale for raw-SQL writers; these are up to date.
+    con.execute(
+        f"DELETE FROM actor_term_exposure_stale WHERE workspace_id=? AND actor_id IN ({_qmarks(fresh)})",
+        [workspace_id, *fresh],
+    )
+    return exposure_ids
+
+
+def record_exposure(
+    con,
+    workspace_id: str,
+    actor_id: str,
+    capsule_id: str,
+    exposure_type: str = "seen",
+    timestamp: Optional[str] = None,
+    strength: float = 0.7,
+    half_life_days: Optional[float] = DEFAULT_HALF_LIFE_DAYS,
+) -> str:
+    """Insert one exposure event and fold it into the actor's decayed term aggregates."""
+    timestamp = timestamp or datetime.utcnow().isoformat()
+    return record_exposures(
+        con,
+        workspace_id,
+        [(actor_id, capsule_id, exposure_type, timestamp, strength)],
+        half_life_days,
+    )[0]
+
+
+def _aggregate_log(
+    con,
+    workspace_id: str,
+    actor_ids: Sequence[str],
+    half_life_days: Optional[float],
+) -> Dict[Tuple[str, str], _Aggregate]:
+    """Fold the exposure log of `actor_ids` into fresh aggregates, without writing."""
+    qmarks = _qmarks(actor_ids)
+    events = con.execute(
+        f"""
+        SELECT e.actor_id, e.capsule_id, e.timestamp, e.strength
+        FROM exposure e
+        JOIN capsule c ON c.capsule_id = e.capsule_id
+        WHERE e.workspace_id=? AND e.actor_id IN ({qmarks}) AND c.type='glossary'
+        """,
+        [workspace_id, *actor_ids],
+    ).fetchall()
+    capsule_ids = sorted({r["capsule_id"] for r in events})
+    terms_by_capsule: Dict[str, List[str]] = {}
+    if capsule_ids:
+        for r in con.execute(
+            f"SELECT capsule_id, body, meta_json FROM capsule WHERE capsule_id IN ({_qmarks(capsule_ids)})",
+            capsule_ids,
+        ).fetchall():
+            terms_by_capsule[r["capsule_id"]] = glossary_terms(r["body"], r["meta_json"])
+
+    aggregates: Dict[Tuple[str, str], _Aggregate] = {}
+    for e in events:
+        ts = _parse_ts(e["timestamp"])
+        for term in terms_by_capsule.get(e["capsule_id"], []):
+            aggregates.setdefault((e["actor_id"], term), _Aggregate()).fold(
+                float(e["strength"]), ts, half_life_days
+            )
+    return aggregates
+
+
+def recompute_term_exposure(
+    con,
+    workspace_id: str,
+    actor_ids: Sequence[str],
+    half_life_days: Optional[float] = DEFAULT_HALF_LIFE_DAYS,
+) -> None:
+    """Rebuild actor_term_exposure rows for `actor_ids` from the exposure log."""
+    if not actor_ids:
+        return
+    qmarks = _qmarks(actor_ids)
+    aggregates = _aggregate_log(con, workspace_id, actor_ids, half_life_days)
+    con.execute(
+        f"DELETE FROM actor_term_exposure WHERE workspace_id=? AND actor_id IN ({qmarks})",
+        [workspace_id, *actor_ids],
+    )
+    _write_aggregates(con, workspace_id, half_life_days, aggregates)
+    con.execute(
+        f"DELETE FROM actor_term_exposure_stale WHERE workspace_id=? AND actor_id IN ({qmarks})",
+        [workspace_id, *actor_ids],
+    )
+
+
+def recompute_workspace_exposure(
+    con, workspace_id: str, half_life_days: Optional[float] = DEFAULT_HALF_LIFE_DAYS
+) -> int:
+    """Rebuild every actor's aggregates in a workspace (after a half-life change); returns actors."""
+    actor_ids = [
+        r["actor_id"]
+        for r in con.execute(
+            "SELECT DISTINCT actor_id FROM exposure WHERE workspace_id=?", (workspace_id,)
+        ).fetchall()
+    ]
+    for i in range(0, len(actor_ids), RECOMPUTE_BATCH):
+        recompute_term_exposure(con, workspace_id, actor_ids[i : i + RECOMPUTE_BATCH], half_life_days)
+    return len(actor_ids)
+
+
+def refresh_workspace_exposure(
+    con, workspace_id: str, half_life_days: Optional[float] = DEFAULT_HALF_LIFE_DAYS
+) -> int:
+    """Recompute every actor awaiting it (flagged stale or another half-life); returns actors.
+
+    Afterwards load_term_exposure(read_only=True) needs no in-memory refolds until new
+    exposure or glossary changes land.
+    """
+    actor_ids = [
+        r["actor_id"]
+        for r in con.execute(
+            """
+            SELECT actor_id FROM actor_term_exposure_stale WHERE workspace_id=?
+            UNION
+            SELECT actor_id FROM actor_term_exposure WHERE workspace_id=? AND half_life_days IS NOT ?
+            """,
+            (workspace_id, workspace_id, half_life_days),
+        ).fetchall()
+    ]
+    for i in range(0, len(actor_ids), RECOMPUTE_BATCH):
+        recompute_term_exposure(con, workspace_id, actor_ids[i : i + RECOMPUTE_BATCH], half_life_days)
+    return len(actor_ids)
+
+
+def load_term_exposure(
+    con,
+    workspace_id: str,
+    actor_ids: Iterable[str],
+    half_life_days: Optional[float] = DEFAULT_HALF_LIFE_DAYS,
+    now: Optional[datetime] = None,
+    read_only: bool = False,
+) -> Dict[str, Dict[str, float]]:
+    """term -> decayed strength (capped at MAX_TERM_STRENGTH) for every actor, in one query.
+
+    Reads cost one row per known term regardless of how many exposure events produced it.
+    Actors flagged stale, or aggregated under a different half-life, are recomputed first;
+    with `read_only` their aggregates are folded from the log in memory and not stored.
+    """
+    ids = list(dict.fromkeys(actor_ids))
+    out: Dict[str, Dict[str, float]] = {aid: {} for aid in ids}
+    if not ids:
+        return out
+    stale = _stale_actors(con, workspace_id, ids, half_life_days)
+    now = now or datetime.utcnow()
+    if read_only and stale:
+        aggregates = _aggregate_log(con, workspace_id, stale, half_life_days)
+        for (actor_id, term), agg in aggregates.items():
+            decayed = agg.strength * decay_factor(now, agg.anchor, half_life_days)
+            out[actor_id][term] = min(MAX_TERM_STRENGTH, decayed)
+        pending = set(stale)
+        ids = [aid for aid in ids if aid not in pending]
+    else:
+        recompute_term_exposure(con, workspace_id, stale, half_life_days)
+    if not ids:
+        return out
+    rows = con.execute(
+        f"""
+        SELECT actor_id, term, strength, last_exposed_at FROM actor_term_exposure
+        WHERE workspace_id=? AND actor_id IN ({_qmarks(ids)})
+        """,
+        [workspace_id, *ids],
+    ).fetchall()
+    for r in rows:
+        decayed = float(r["strength"]) * decay_factor(now, _parse_ts(r["last_exposed_at"]), half_life_days)
+        out[r["actor_id"]][r["term"]] = min(MAX_TERM_STRENGTH, decayed)
+    return out
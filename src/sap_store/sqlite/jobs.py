@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from datetime import datetime
+import json
+import sqlite3
+from typing import Any, Dict, Optional
+
+import ulid
+
+from .db import is_readonly
+
+
+def enqueue_job(
+    con,
+    workspace_id: str,
+    kind: str,
+    payload: Dict[str, Any],
+    priority: int = 5,
+    dedupe: bool = True,
+) -> Optional[str]:
+    """Queue a job for sap_workers.
+
+    With `dedupe`, an identical job that is still queued or already running is reused, so
+    callers that re-request a rebuild while one is in flight do not pile up duplicates.
+    """
+    payload_json = json.dumps(payload, sort_keys=True)
+    if dedupe:
+        row = con.execute(
+            """
+            SELECT job_id FROM job
+            WHERE workspace_id=? AND kind=? AND payload_json=?
+              AND status IN ('queued', 'running')
+            """,
+            (workspace_id, kind, payload_json),
+        ).fetchone()
+        if row is not None:
+            return row["job_id"]
+
+    job_id = str(ulid.new())
+    now = datetime.utcnow().isoformat()
+    con.execute(
+        """
+        INSERT INTO job(job_id, workspace_id, kind, payload_json, status, priority, created_at, updated_at)
+        VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)
+        """,
+        (job_id, workspace_id, kind, payload_json, priority, now, now),
+    )
+    return job_id
+
+
+def request_job(
+    con,
+    workspace_id: str,
+    kind: str,
+    payload: Dict[str, Any],
+    priority: int = 5,
+) -> Optional[str]:
+    """Best-effort, deduplicated enqueue for read paths that notice maintenance is due.
+
+    Skipped on read-only connections; a busy or read-only database is not worth failing
+    the request over, since the next query will ask again.
+    """
+    if is_readonly(con):
+        return None
+    try:
+        return enqueue_job(con, workspace_id, kind, payload, priority=priority)
+    except sqlite3.OperationalError:
+        return None
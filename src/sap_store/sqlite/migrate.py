@@ -4,6 +4,7 @@ from datetime import datetime
 from pathlib import Path
 
 from .db import DEFAULT_DB_PATH, db_session
+from .embeddings import convert_json_embeddings
 
 MIGRATIONS_DIR = Path(__file__).parent / "migrations"
 
@@ -39,3 +40,4 @@ def apply_all(db_path: Path = DEFAULT_DB_PATH) -> None:
                 "INSERT INTO schema_migrations(filename, applied_at) VALUES(?, ?)",
                 (f.name, datetime.utcnow().isoformat()),
             )
+        convert_json_embeddings(con)
@@ -0,0 +1,24 @@
+-- Embeddings move from vec_json TEXT to little-endian float32 BLOBs.
+-- vec_json is kept (nullable) so existing rows can be converted in place by
+-- sap_store.sqlite.embeddings.convert_json_embeddings after this migration runs.
+CREATE TABLE IF NOT EXISTS embedding_v2 (
+  embedding_id TEXT PRIMARY KEY,
+  workspace_id TEXT NOT NULL,
+  owner_type TEXT NOT NULL,
+  owner_id TEXT NOT NULL,
+  dim INTEGER NOT NULL,
+  dtype TEXT NOT NULL DEFAULT 'float32',
+  model_name TEXT,
+  vec_blob BLOB,
+  vec_json TEXT,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY (workspace_id) REFERENCES workspace(workspace_id)
+);
+
+INSERT INTO embedding_v2(embedding_id, workspace_id, owner_type, owner_id, dim, vec_json, created_at)
+SELECT embedding_id, workspace_id, owner_type, owner_id, dim, vec_json, created_at FROM embedding;
+
+DROP TABLE embedding;
+ALTER TABLE embedding_v2 RENAME TO embedding;
+
+CREATE INDEX IF NOT EXISTS idx_embedding_owner ON embedding(workspace_id, owner_type, owner_id);
@@ -0,0 +1,3 @@
+-- Per-term document frequencies over fts_capsules, used to pick salient query terms.
+CREATE VIRTUAL TABLE IF NOT EXISTS fts_capsules_vocab
+USING fts5vocab(fts_capsules, 'row');
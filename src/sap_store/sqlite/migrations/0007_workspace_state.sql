@@ -0,0 +1,27 @@
+-- Per-workspace write generations. Triggers bump them on every write so in-process caches
+-- can validate entries with one indexed read instead of reloading rows.
+CREATE TABLE IF NOT EXISTS workspace_state (
+  workspace_id TEXT PRIMARY KEY,
+  capsule_generation INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY (workspace_id) REFERENCES workspace(workspace_id)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_capsule_gen_insert AFTER INSERT ON capsule
+BEGIN
+  INSERT INTO workspace_state(workspace_id, capsule_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET capsule_generation = capsule_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_capsule_gen_update AFTER UPDATE ON capsule
+BEGIN
+  INSERT INTO workspace_state(workspace_id, capsule_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET capsule_generation = capsule_generation + 1;
+  INSERT INTO workspace_state(workspace_id, capsule_generation) VALUES (OLD.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET capsule_generation = capsule_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_capsule_gen_delete AFTER DELETE ON capsule
+BEGIN
+  INSERT INTO workspace_state(workspace_id, capsule_generation) VALUES (OLD.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET capsule_generation = capsule_generation + 1;
+END;
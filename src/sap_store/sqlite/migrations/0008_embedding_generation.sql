@@ -0,0 +1,20 @@
+-- Bumped on every embedding write so cached retrieval results notice new vectors.
+ALTER TABLE workspace_state ADD COLUMN embedding_generation INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS trg_embedding_gen_insert AFTER INSERT ON embedding
+BEGIN
+  INSERT INTO workspace_state(workspace_id, embedding_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET embedding_generation = embedding_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_embedding_gen_update AFTER UPDATE ON embedding
+BEGIN
+  INSERT INTO workspace_state(workspace_id, embedding_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET embedding_generation = embedding_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_embedding_gen_delete AFTER DELETE ON embedding
+BEGIN
+  INSERT INTO workspace_state(workspace_id, embedding_generation) VALUES (OLD.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET embedding_generation = embedding_generation + 1;
+END;
@@ -0,0 +1,3 @@
+-- Per-term document frequencies over fts_chunks, so chunk queries pick their own salient terms.
+CREATE VIRTUAL TABLE IF NOT EXISTS fts_chunks_vocab
+USING fts5vocab(fts_chunks, 'row');
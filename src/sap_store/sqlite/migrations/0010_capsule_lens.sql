@@ -0,0 +1,36 @@
+-- lens_tags_json normalized into an indexed side table so lens filters run in SQL.
+CREATE TABLE IF NOT EXISTS capsule_lens (
+  capsule_id TEXT NOT NULL,
+  workspace_id TEXT NOT NULL,
+  lens TEXT NOT NULL,
+  PRIMARY KEY (capsule_id, lens)
+);
+
+CREATE INDEX IF NOT EXISTS idx_capsule_lens_ws ON capsule_lens(workspace_id, lens, capsule_id);
+CREATE INDEX IF NOT EXISTS idx_capsule_ws_type_scope ON capsule(workspace_id, type, scope, created_at);
+
+INSERT OR IGNORE INTO capsule_lens(capsule_id, workspace_id, lens)
+SELECT c.capsule_id, c.workspace_id, j.value
+FROM capsule c,
+     json_each(CASE WHEN json_valid(c.lens_tags_json) THEN c.lens_tags_json ELSE '[]' END) j;
+
+CREATE TRIGGER IF NOT EXISTS trg_capsule_lens_insert AFTER INSERT ON capsule
+WHEN json_valid(NEW.lens_tags_json)
+BEGIN
+  INSERT OR IGNORE INTO capsule_lens(capsule_id, workspace_id, lens)
+  SELECT NEW.capsule_id, NEW.workspace_id, value FROM json_each(NEW.lens_tags_json);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_capsule_lens_update
+AFTER UPDATE OF capsule_id, workspace_id, lens_tags_json ON capsule
+BEGIN
+  DELETE FROM capsule_lens WHERE capsule_id = OLD.capsule_id;
+  INSERT OR IGNORE INTO capsule_lens(capsule_id, workspace_id, lens)
+  SELECT NEW.capsule_id, NEW.workspace_id, value
+  FROM json_each(CASE WHEN json_valid(NEW.lens_tags_json) THEN NEW.lens_tags_json ELSE '[]' END);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_capsule_lens_delete AFTER DELETE ON capsule
+BEGIN
+  DELETE FROM capsule_lens WHERE capsule_id = OLD.capsule_id;
+END;
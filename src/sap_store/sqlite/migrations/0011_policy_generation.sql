@@ -0,0 +1,20 @@
+-- Bumped on policy writes so compiled workspace contexts pick up new thresholds.
+ALTER TABLE workspace_state ADD COLUMN policy_generation INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS trg_policy_gen_insert AFTER INSERT ON policy
+BEGIN
+  INSERT INTO workspace_state(workspace_id, policy_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET policy_generation = policy_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_policy_gen_update AFTER UPDATE ON policy
+BEGIN
+  INSERT INTO workspace_state(workspace_id, policy_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET policy_generation = policy_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_policy_gen_delete AFTER DELETE ON policy
+BEGIN
+  INSERT INTO workspace_state(workspace_id, policy_generation) VALUES (OLD.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET policy_generation = policy_generation + 1;
+END;
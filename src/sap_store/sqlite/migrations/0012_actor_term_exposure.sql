@@ -0,0 +1,58 @@
+-- Materialized glossary-term exposure per actor, maintained on exposure writes.
+CREATE TABLE IF NOT EXISTS actor_term_exposure (
+  workspace_id TEXT NOT NULL,
+  actor_id TEXT NOT NULL,
+  term TEXT NOT NULL,
+  strength REAL NOT NULL,
+  exposures INTEGER NOT NULL DEFAULT 0,
+  last_exposed_at TEXT,
+  PRIMARY KEY (workspace_id, actor_id, term)
+);
+
+-- Actors whose rows must be recomputed before the next read: exposure rows written by raw
+-- SQL, or glossary capsules edited/deleted after the actor saw them.
+CREATE TABLE IF NOT EXISTS actor_term_exposure_stale (
+  workspace_id TEXT NOT NULL,
+  actor_id TEXT NOT NULL,
+  PRIMARY KEY (workspace_id, actor_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_exposure_actor ON exposure(workspace_id, actor_id, capsule_id);
+CREATE INDEX IF NOT EXISTS idx_exposure_capsule ON exposure(capsule_id);
+
+INSERT OR IGNORE INTO actor_term_exposure_stale(workspace_id, actor_id)
+SELECT DISTINCT workspace_id, actor_id FROM exposure;
+
+CREATE TRIGGER IF NOT EXISTS trg_exposure_stale_insert AFTER INSERT ON exposure
+BEGIN
+  INSERT OR IGNORE INTO actor_term_exposure_stale(workspace_id, actor_id)
+  VALUES (NEW.workspace_id, NEW.actor_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exposure_stale_delete AFTER DELETE ON exposure
+BEGIN
+  INSERT OR IGNORE INTO actor_term_exposure_stale(workspace_id, actor_id)
+  VALUES (OLD.workspace_id, OLD.actor_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_glossary_exposure_stale_insert AFTER INSERT ON capsule
+WHEN NEW.type = 'glossary'
+BEGIN
+  INSERT OR IGNORE INTO actor_term_exposure_stale(workspace_id, actor_id)
+  SELECT workspace_id, actor_id FROM exposure WHERE capsule_id = NEW.capsule_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_glossary_exposure_stale_update
+AFTER UPDATE OF type, title, body, meta_json ON capsule
+WHEN OLD.type = 'glossary' OR NEW.type = 'glossary'
+BEGIN
+  INSERT OR IGNORE INTO actor_term_exposure_stale(workspace_id, actor_id)
+  SELECT workspace_id, actor_id FROM exposure WHERE capsule_id = NEW.capsule_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_glossary_exposure_stale_delete AFTER DELETE ON capsule
+WHEN OLD.type = 'glossary'
+BEGIN
+  INSERT OR IGNORE INTO actor_term_exposure_stale(workspace_id, actor_id)
+  SELECT workspace_id, actor_id FROM exposure WHERE capsule_id = OLD.capsule_id;
+END;
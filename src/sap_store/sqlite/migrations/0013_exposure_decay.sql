@@ -0,0 +1,57 @@
+-- actor_term_exposure.strength becomes a decayed sum of exposure strengths as of
+-- last_exposed_at, aggregated with the policy half-life recorded per row.
+ALTER TABLE actor_term_exposure ADD COLUMN half_life_days REAL;
+
+-- Rows written before decay existed hold a flat 0.8; rebuild them from the exposure log.
+INSERT OR IGNORE INTO actor_term_exposure_stale(workspace_id, actor_id)
+SELECT DISTINCT workspace_id, actor_id FROM actor_term_exposure;
+
+-- A half-life change queues one bulk recompute per workspace (reads stay correct meanwhile,
+-- since rows aggregated under another half-life are rebuilt on demand).
+CREATE TRIGGER IF NOT EXISTS trg_policy_exposure_recompute_insert AFTER INSERT ON policy
+WHEN EXISTS (SELECT 1 FROM actor_term_exposure WHERE workspace_id = NEW.workspace_id)
+ AND NOT EXISTS (
+   SELECT 1 FROM job
+   WHERE workspace_id = NEW.workspace_id AND kind = 'exposure_recompute' AND status = 'queued'
+ )
+BEGIN
+  INSERT INTO job(job_id, workspace_id, kind, payload_json, status, priority, created_at, updated_at)
+  VALUES (
+    lower(hex(randomblob(16))), NEW.workspace_id, 'exposure_recompute', '{}', 'queued', 7,
+    strftime('%Y-%m-%dT%H:%M:%f', 'now'), strftime('%Y-%m-%dT%H:%M:%f', 'now')
+  );
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_policy_exposure_recompute_update AFTER UPDATE OF policy_json ON policy
+WHEN (
+   json_type(OLD.policy_json, '$.exposure_half_life_days')
+     IS NOT json_type(NEW.policy_json, '$.exposure_half_life_days')
+   OR json_extract(OLD.policy_json, '$.exposure_half_life_days')
+     IS NOT json_extract(NEW.policy_json, '$.exposure_half_life_days')
+ )
+ AND EXISTS (SELECT 1 FROM actor_term_exposure WHERE workspace_id = NEW.workspace_id)
+ AND NOT EXISTS (
+   SELECT 1 FROM job
+   WHERE workspace_id = NEW.workspace_id AND kind = 'exposure_recompute' AND status = 'queued'
+ )
+BEGIN
+  INSERT INTO job(job_id, workspace_id, kind, payload_json, status, priority, created_at, updated_at)
+  VALUES (
+    lower(hex(randomblob(16))), NEW.workspace_id, 'exposure_recompute', '{}', 'queued', 7,
+    strftime('%Y-%m-%dT%H:%M:%f', 'now'), strftime('%Y-%m-%dT%H:%M:%f', 'now')
+  );
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_policy_exposure_recompute_delete AFTER DELETE ON policy
+WHEN EXISTS (SELECT 1 FROM actor_term_exposure WHERE workspace_id = OLD.workspace_id)
+ AND NOT EXISTS (
+   SELECT 1 FROM job
+   WHERE workspace_id = OLD.workspace_id AND kind = 'exposure_recompute' AND status = 'queued'
+ )
+BEGIN
+  INSERT INTO job(job_id, workspace_id, kind, payload_json, status, priority, created_at, updated_at)
+  VALUES (
+    lower(hex(randomblob(16))), OLD.workspace_id, 'exposure_recompute', '{}', 'queued', 7,
+    strftime('%Y-%m-%dT%H:%M:%f', 'now'), strftime('%Y-%m-%dT%H:%M:%f', 'now')
+  );
+END;
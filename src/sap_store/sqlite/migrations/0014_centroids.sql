@@ -0,0 +1,119 @@
+-- Per-workspace centroids kept as running sums of unit vectors (float64 BLOB) and counts.
+-- facet is 'all' (facet_value ''), 'type' (capsule type), 'lens' or 'circle'.
+CREATE TABLE IF NOT EXISTS centroid (
+  workspace_id TEXT NOT NULL,
+  owner_type TEXT NOT NULL,
+  dim INTEGER NOT NULL,
+  facet TEXT NOT NULL,
+  facet_value TEXT NOT NULL DEFAULT '',
+  vec_sum BLOB NOT NULL,
+  n INTEGER NOT NULL,
+  PRIMARY KEY (workspace_id, owner_type, dim, facet, facet_value)
+);
+
+-- Embedding writes not yet folded into centroid, with the owner's facets at write time.
+CREATE TABLE IF NOT EXISTS centroid_delta (
+  delta_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  workspace_id TEXT NOT NULL,
+  owner_type TEXT NOT NULL,
+  dim INTEGER NOT NULL,
+  dtype TEXT NOT NULL,
+  vec_blob BLOB NOT NULL,
+  sign INTEGER NOT NULL,
+  capsule_type TEXT,
+  lens_tags_json TEXT,
+  circle_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_centroid_delta_ws ON centroid_delta(workspace_id, delta_id);
+
+-- Workspaces whose sums must be rebuilt from the embedding table (facets of an embedded
+-- capsule changed, or the capsule went away before its vectors).
+CREATE TABLE IF NOT EXISTS centroid_stale (
+  workspace_id TEXT PRIMARY KEY
+);
+
+INSERT OR IGNORE INTO centroid_stale(workspace_id)
+SELECT DISTINCT workspace_id FROM embedding;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_embedding_insert AFTER INSERT ON embedding
+WHEN NEW.vec_blob IS NOT NULL
+BEGIN
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT NEW.workspace_id, NEW.owner_type, NEW.dim, NEW.dtype, NEW.vec_blob, 1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON NEW.owner_type = 'capsule' AND c.capsule_id = NEW.owner_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_embedding_delete AFTER DELETE ON embedding
+WHEN OLD.vec_blob IS NOT NULL
+BEGIN
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT OLD.workspace_id, OLD.owner_type, OLD.dim, OLD.dtype, OLD.vec_blob, -1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON OLD.owner_type = 'capsule' AND c.capsule_id = OLD.owner_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_embedding_update
+AFTER UPDATE OF workspace_id, owner_type, owner_id, dim, dtype, vec_blob ON embedding
+BEGIN
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT OLD.workspace_id, OLD.owner_type, OLD.dim, OLD.dtype, OLD.vec_blob, -1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON OLD.owner_type = 'capsule' AND c.capsule_id = OLD.owner_id
+  WHERE OLD.vec_blob IS NOT NULL;
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT NEW.workspace_id, NEW.owner_type, NEW.dim, NEW.dtype, NEW.vec_blob, 1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON NEW.owner_type = 'capsule' AND c.capsule_id = NEW.owner_id
+  WHERE NEW.vec_blob IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_capsule_insert AFTER INSERT ON capsule
+WHEN EXISTS (
+  SELECT 1 FROM embedding
+  WHERE workspace_id = NEW.workspace_id AND owner_type = 'capsule' AND owner_id = NEW.capsule_id
+)
+BEGIN
+  INSERT OR IGNORE INTO centroid_stale(workspace_id) VALUES (NEW.workspace_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_capsule_update
+AFTER UPDATE OF type, lens_tags_json, meta_json ON capsule
+WHEN (
+  OLD.type IS NOT NEW.type
+  OR OLD.lens_tags_json IS NOT NEW.lens_tags_json
+  OR (CASE WHEN json_valid(OLD.meta_json) THEN json_extract(OLD.meta_json, '$.circle_id') END)
+     IS NOT (CASE WHEN json_valid(NEW.meta_json) THEN json_extract(NEW.meta_json, '$.circle_id') END)
+)
+AND EXISTS (
+  SELECT 1 FROM embedding
+  WHERE workspace_id = NEW.workspace_id AND owner_type = 'capsule' AND owner_id = NEW.capsule_id
+)
+BEGIN
+  INSERT OR IGNORE INTO centroid_stale(workspace_id) VALUES (NEW.workspace_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_capsule_delete AFTER DELETE ON capsule
+WHEN EXISTS (
+  SELECT 1 FROM embedding
+  WHERE workspace_id = OLD.workspace_id AND owner_type = 'capsule' AND owner_id = OLD.capsule_id
+)
+BEGIN
+  INSERT OR IGNORE INTO centroid_stale(workspace_id) VALUES (OLD.workspace_id);
+END;
@@ -0,0 +1,31 @@
+-- Bumped on chunk writes so cached analysis reports (which carry chunk context) expire.
+ALTER TABLE workspace_state ADD COLUMN chunk_generation INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS trg_chunk_gen_insert AFTER INSERT ON chunk
+BEGIN
+  INSERT INTO workspace_state(workspace_id, chunk_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET chunk_generation = chunk_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_chunk_gen_update AFTER UPDATE ON chunk
+BEGIN
+  INSERT INTO workspace_state(workspace_id, chunk_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET chunk_generation = chunk_generation + 1;
+  INSERT INTO workspace_state(workspace_id, chunk_generation) VALUES (OLD.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET chunk_generation = chunk_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_chunk_gen_delete AFTER DELETE ON chunk
+BEGIN
+  INSERT INTO workspace_state(workspace_id, chunk_generation) VALUES (OLD.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET chunk_generation = chunk_generation + 1;
+END;
+
+-- Analysis reports persisted across restarts, addressed by their input key.
+CREATE TABLE IF NOT EXISTS report_cache (
+  cache_key TEXT PRIMARY KEY,
+  workspace_id TEXT NOT NULL,
+  report_json TEXT NOT NULL,
+  created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_report_cache_created ON report_cache(created_at);
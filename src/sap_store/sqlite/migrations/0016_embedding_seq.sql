@@ -0,0 +1,139 @@
+-- embedding gets a monotonic AUTOINCREMENT key so rowid watermarks kept by index snapshots
+-- and shards are never reused: a plain rowid table hands a deleted max rowid to the next
+-- insert, which put re-embedded owners below the watermark and out of every reconcile.
+-- seq aliases rowid and keeps the old values, so existing snapshot watermarks stay valid.
+
+-- Capsule triggers read embedding and would block the rename below; recreated at the end.
+DROP TRIGGER IF EXISTS trg_centroid_capsule_insert;
+DROP TRIGGER IF EXISTS trg_centroid_capsule_update;
+DROP TRIGGER IF EXISTS trg_centroid_capsule_delete;
+
+CREATE TABLE IF NOT EXISTS embedding_v3 (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  embedding_id TEXT NOT NULL UNIQUE,
+  workspace_id TEXT NOT NULL,
+  owner_type TEXT NOT NULL,
+  owner_id TEXT NOT NULL,
+  dim INTEGER NOT NULL,
+  dtype TEXT NOT NULL DEFAULT 'float32',
+  model_name TEXT,
+  vec_blob BLOB,
+  vec_json TEXT,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY (workspace_id) REFERENCES workspace(workspace_id)
+);
+
+INSERT INTO embedding_v3(
+  seq, embedding_id, workspace_id, owner_type, owner_id, dim, dtype, model_name, vec_blob,
+  vec_json, created_at
+)
+SELECT rowid, embedding_id, workspace_id, owner_type, owner_id, dim, dtype, model_name, vec_blob,
+       vec_json, created_at
+FROM embedding ORDER BY rowid;
+
+-- Dropping the table drops its index and triggers without firing them.
+DROP TABLE embedding;
+ALTER TABLE embedding_v3 RENAME TO embedding;
+
+CREATE INDEX IF NOT EXISTS idx_embedding_owner ON embedding(workspace_id, owner_type, owner_id);
+
+CREATE TRIGGER IF NOT EXISTS trg_embedding_gen_insert AFTER INSERT ON embedding
+BEGIN
+  INSERT INTO workspace_state(workspace_id, embedding_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET embedding_generation = embedding_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_embedding_gen_update AFTER UPDATE ON embedding
+BEGIN
+  INSERT INTO workspace_state(workspace_id, embedding_generation) VALUES (NEW.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET embedding_generation = embedding_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_embedding_gen_delete AFTER DELETE ON embedding
+BEGIN
+  INSERT INTO workspace_state(workspace_id, embedding_generation) VALUES (OLD.workspace_id, 1)
+  ON CONFLICT(workspace_id) DO UPDATE SET embedding_generation = embedding_generation + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_embedding_insert AFTER INSERT ON embedding
+WHEN NEW.vec_blob IS NOT NULL
+BEGIN
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT NEW.workspace_id, NEW.owner_type, NEW.dim, NEW.dtype, NEW.vec_blob, 1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON NEW.owner_type = 'capsule' AND c.capsule_id = NEW.owner_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_embedding_delete AFTER DELETE ON embedding
+WHEN OLD.vec_blob IS NOT NULL
+BEGIN
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT OLD.workspace_id, OLD.owner_type, OLD.dim, OLD.dtype, OLD.vec_blob, -1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON OLD.owner_type = 'capsule' AND c.capsule_id = OLD.owner_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_embedding_update
+AFTER UPDATE OF workspace_id, owner_type, owner_id, dim, dtype, vec_blob ON embedding
+BEGIN
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT OLD.workspace_id, OLD.owner_type, OLD.dim, OLD.dtype, OLD.vec_blob, -1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON OLD.owner_type = 'capsule' AND c.capsule_id = OLD.owner_id
+  WHERE OLD.vec_blob IS NOT NULL;
+  INSERT INTO centroid_delta(
+    workspace_id, owner_type, dim, dtype, vec_blob, sign, capsule_type, lens_tags_json, circle_id
+  )
+  SELECT NEW.workspace_id, NEW.owner_type, NEW.dim, NEW.dtype, NEW.vec_blob, 1,
+         c.type, c.lens_tags_json,
+         CASE WHEN json_valid(c.meta_json) THEN json_extract(c.meta_json, '$.circle_id') END
+  FROM (SELECT 1) LEFT JOIN capsule c
+    ON NEW.owner_type = 'capsule' AND c.capsule_id = NEW.owner_id
+  WHERE NEW.vec_blob IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_capsule_insert AFTER INSERT ON capsule
+WHEN EXISTS (
+  SELECT 1 FROM embedding
+  WHERE workspace_id = NEW.workspace_id AND owner_type = 'capsule' AND owner_id = NEW.capsule_id
+)
+BEGIN
+  INSERT OR IGNORE INTO centroid_stale(workspace_id) VALUES (NEW.workspace_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_capsule_update
+AFTER UPDATE OF type, lens_tags_json, meta_json ON capsule
+WHEN (
+  OLD.type IS NOT NEW.type
+  OR OLD.lens_tags_json IS NOT NEW.lens_tags_json
+  OR (CASE WHEN json_valid(OLD.meta_json) THEN json_extract(OLD.meta_json, '$.circle_id') END)
+     IS NOT (CASE WHEN json_valid(NEW.meta_json) THEN json_extract(NEW.meta_json, '$.circle_id') END)
+)
+AND EXISTS (
+  SELECT 1 FROM embedding
+  WHERE workspace_id = NEW.workspace_id AND owner_type = 'capsule' AND owner_id = NEW.capsule_id
+)
+BEGIN
+  INSERT OR IGNORE INTO centroid_stale(workspace_id) VALUES (NEW.workspace_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_capsule_delete AFTER DELETE ON capsule
+WHEN EXISTS (
+  SELECT 1 FROM embedding
+  WHERE workspace_id = OLD.workspace_id AND owner_type = 'capsule' AND owner_id = OLD.capsule_id
+)
+BEGIN
+  INSERT OR IGNORE INTO centroid_stale(workspace_id) VALUES (OLD.workspace_id);
+END;
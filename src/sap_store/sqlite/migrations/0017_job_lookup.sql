@@ -0,0 +1,3 @@
+-- Read paths ask for maintenance jobs (ANN/quant rebuilds) on every miss and dedupe
+-- against queued/running rows; without an index each ask scans the whole job history.
+CREATE INDEX IF NOT EXISTS idx_job_lookup ON job(workspace_id, kind, status);
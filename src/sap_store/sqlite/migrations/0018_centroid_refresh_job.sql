@@ -0,0 +1,39 @@
+-- Centroid deltas are folded by a worker job instead of inside analysis requests, so
+-- load_centroids stays a pure read. Any new delta or stale flag queues one
+-- centroid_refresh per workspace; a refresh already running may have claimed its
+-- deltas, so only a queued job counts as pending.
+CREATE TRIGGER IF NOT EXISTS trg_centroid_delta_refresh AFTER INSERT ON centroid_delta
+WHEN NOT EXISTS (
+  SELECT 1 FROM job
+  WHERE workspace_id = NEW.workspace_id AND kind = 'centroid_refresh' AND status = 'queued'
+)
+BEGIN
+  INSERT INTO job(job_id, workspace_id, kind, payload_json, status, priority, created_at, updated_at)
+  VALUES (
+    lower(hex(randomblob(16))), NEW.workspace_id, 'centroid_refresh', '{}', 'queued', 7,
+    strftime('%Y-%m-%dT%H:%M:%f', 'now'), strftime('%Y-%m-%dT%H:%M:%f', 'now')
+  );
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_centroid_stale_refresh AFTER INSERT ON centroid_stale
+WHEN NOT EXISTS (
+  SELECT 1 FROM job
+  WHERE workspace_id = NEW.workspace_id AND kind = 'centroid_refresh' AND status = 'queued'
+)
+BEGIN
+  INSERT INTO job(job_id, workspace_id, kind, payload_json, status, priority, created_at, updated_at)
+  VALUES (
+    lower(hex(randomblob(16))), NEW.workspace_id, 'centroid_refresh', '{}', 'queued', 7,
+    strftime('%Y-%m-%dT%H:%M:%f', 'now'), strftime('%Y-%m-%dT%H:%M:%f', 'now')
+  );
+END;
+
+-- Fold whatever is already pending.
+INSERT INTO job(job_id, workspace_id, kind, payload_json, status, priority, created_at, updated_at)
+SELECT lower(hex(randomblob(16))), workspace_id, 'centroid_refresh', '{}', 'queued', 7,
+       strftime('%Y-%m-%dT%H:%M:%f', 'now'), strftime('%Y-%m-%dT%H:%M:%f', 'now')
+FROM (
+  SELECT workspace_id FROM centroid_delta
+  UNION
+  SELECT workspace_id FROM centroid_stale
+);
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+
+def capsule_generation(con, workspace_id: str) -> int:
+    """Write generation of the workspace's capsules; bumped by triggers on every change."""
+    row = con.execute(
+        "SELECT capsule_generation FROM workspace_state WHERE workspace_id=?",
+        (workspace_id,),
+    ).fetchone()
+    return int(row["capsule_generation"]) if row else 0
+
+
+def embedding_generation(con, workspace_id: str) -> int:
+    """Write generation of the workspace's embeddings; bumped by triggers on every change."""
+    row = con.execute(
+        "SELECT embedding_generation FROM workspace_state WHERE workspace_id=?",
+        (workspace_id,),
+    ).fetchone()
+    return int(row["embedding_generation"]) if row else 0
+
+
+def workspace_generations(con, workspace_id: str) -> Tuple[int, int]:
+    """(capsule_generation, embedding_generation); either moves on any write it covers."""
+    row = con.execute(
+        """
+        SELECT capsule_generation, embedding_generation
+        FROM workspace_state WHERE workspace_id=?
+        """,
+        (workspace_id,),
+    ).fetchone()
+    if row is None:
+        return (0, 0)
+    return (int(row["capsule_generation"]), int(row["embedding_generation"]))
+
+
+GENERATION_COLUMNS = ("capsule_generation", "embedding_generation", "policy_generation")
+# Analysis reports also carry chunk context, so their cache keys track chunk writes too.
+REPORT_GENERATION_COLUMNS = (*GENERATION_COLUMNS, "chunk_generation")
+
+
+def all_generations(
+    con, workspace_id: str, columns: Tuple[str, ...] = GENERATION_COLUMNS
+) -> Tuple[int, ...]:
+    """Write generations of a workspace, in `columns` order (default GENERATION_COLUMNS)."""
+    row = con.execute(
+        f"SELECT {', '.join(columns)} FROM workspace_state WHERE workspace_id=?",
+        (workspace_id,),
+    ).fetchone()
+    if row is None:
+        return (0,) * len(columns)
+    return tuple(int(row[c]) for c in columns)
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import struct
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# Fixed-size .npy v1.0 header so the row count can be rewritten in place on append.
+HEADER_LEN = 128
+_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def _npy_header(rows: int, dim: int) -> bytes:
+    body = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (rows, dim)
+    pad = HEADER_LEN - len(_MAGIC) - 2 - len(body) - 1
+    if pad < 0:
+        raise ValueError("shard header overflow")
+    size = struct.pack("<H", HEADER_LEN - len(_MAGIC) - 2)
+    return _MAGIC + size + (body + " " * pad + "\n").encode("latin1")
+
+
+def _read_rows(path: Path) -> int:
+    with open(path, "rb") as f:
+        header = f.read(HEADER_LEN)
+    text = header[len(_MAGIC) + 2:].decode("latin1")
+    shape = text[text.index("(") + 1: text.index(")")]
+    return int(shape.split(",")[0])
+
+
+class VectorShard:
+    """Append-only float32 vector file for one (workspace, owner_type, dim).
+
+    Layout under `directory`, with `name` as the common prefix:
+      <name>.json          manifest: {"dim", "gen", "max_rowid"}; replaced atomically
+                           by compaction and sync (max_rowid = embedding seq synced up to)
+      <name>.<gen>.npy     .npy file (fixed 128-byte header) of normalized rows
+      <name>.<gen>.ids     owner id per row, newline separated
+      <name>.<gen>.del     tombstone bitmap (bit i set = row i deleted)
+
+    Readers map the .npy read-only with np.memmap, so every process serving the same
+    workspace shares the OS page cache instead of holding a private heap copy.
+    """
+
+    def __init__(self, directory: Path, name: str, dim: int):
+        self.directory = Path(directory)
+        self.name = name
+        self.dim = dim
+        self.gen = 0
+        self.max_rowid: Optional[int] = None
+        self._rows = 0
+        self._ids: List[str] = []
+        self._latest: Dict[str, int] = {}
+        self._ids_offset = 0
+        self._mat: np.ndarray = np.empty((0, dim), dtype=np.float32)
+        self._dead: np.ndarray = np.zeros(0, dtype=bool)
+        self._stamp: Optional[Tuple[float, ...]] = None
+
+    # -- paths -----------------------------------------------------------------
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.directory / f"{self.name}.json"
+
+    def _path(self, ext: str, gen: Optional[int] = None) -> Path:
+        return self.directory / f"{self.name}.{self.gen if gen is None else gen}.{ext}"
+
+    @contextmanager
+    def _locked(self, read_manifest: bool = True):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_path = self.directory / f"{self.name}.lock"
+        with open(lock_path, "a+b") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                if read_manifest:
+                    self._read_manifest()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    # -- lifecycle -------------------------------------------------------------
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    def ensure(self, loader: Callable[[], Tuple[Sequence[str], np.ndarray, int]]) -> None:
+        """Create the shard from `loader()` unless another process already did.
+
+        Shards from before manifests carried a watermark are rebuilt too: they were written
+        through ahead of commits and may hold rows SQLite never kept.
+        """
+        with self._locked(read_manifest=False):
+            fresh = not self.exists()
+            if not fresh:
+                self._read_manifest()
+            if fresh or self.max_rowid is None:
+                ids, mat, max_rowid = loader()
+                gen = 0 if fresh else self.gen + 1
+                self._write_generation(gen, ids, mat, max_rowid)
+                if not fresh:
+                    self._unlink_generation(gen - 1)
+        self.refresh()
+
+    def _write_generation(
+        self, gen: int, ids: Sequence[str], mat: np.ndarray, max_rowid: Optional[int]
+    ) -> None:
+        with open(self._path("npy", gen), "wb") as f:
+            f.write(_npy_header(len(ids), self.dim))
+            f.write(np.ascontiguousarray(mat, dtype="<f4").tobytes())
+        with open(self._path("ids", gen), "w", encoding="utf-8") as f:
+            f.writelines(f"{oid}\n" for oid in ids)
+        open(self._path("del", gen), "wb").close()
+        self._write_manifest(gen, max_rowid)
+
+    def _write_manifest(self, gen: int, max_rowid: Optional[int]) -> None:
+        tmp = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        manifest = {"dim": self.dim, "gen": gen, "max_rowid": max_rowid}
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+    def _unlink_generation(self, gen: int) -> None:
+        for ext in ("npy", "ids", "del"):
+            try:
+                self._path(ext, gen).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _read_manifest(self) -> None:
+        manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        gen = manifest["gen"]
+        self.max_rowid = manifest.get("max_rowid")
+        if gen != self.gen:
+            self.gen = gen
+            self._rows = 0
+            self._ids = []
+            self._latest = {}
+            self._ids_offset = 0
+            self._stamp = None
+
+    def refresh(self) -> None:
+        """Re-map files if another process appended, deleted, or compacted."""
+        self._read_manifest()
+        npy, dels = self._path("npy"), self._path("del")
+        npy_st, del_st = npy.stat(), dels.stat()
+        stamp = (self.gen, npy_st.st_size, npy_st.st_mtime_ns, del_st.st_size, del_st.st_mtime_ns)
+        if stamp == self._stamp:
+            return
+        rows = _read_rows(npy)
+        if rows > len(self._ids):
+            with open(self._path("ids"), "rb") as f:
+                f.seek(self._ids_offset)
+                while len(self._ids) < rows:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    oid = line[:-1].decode("utf-8")
+                    self._latest[oid] = len(self._ids)
+                    self._ids.append(oid)
+                    self._ids_offset += len(line)
+        rows = min(rows, len(self._ids))
+        self._rows = rows
+        if rows:
+            self._mat = np.memmap(
+                npy, dtype="<f4", mode="r", offset=HEADER_LEN, shape=(rows, self.dim)
+            )
+        else:
+            self._mat = np.empty((0, self.dim), dtype=np.float32)
+        bits = np.fromfile(dels, dtype=np.uint8)
+        dead = np.unpackbits(bits, bitorder="little")[:rows].astype(bool)
+        if dead.shape[0] < rows:
+            dead = np.concatenate([dead, np.zeros(rows - dead.shape[0], dtype=bool)])
+        self._dead = dead
+        self._stamp = stamp
+
+    # -- reads -----------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def ids(self) -> List[str]:
+        return self._ids[: self._rows]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._mat
+
+    @property
+    def dead(self) -> np.ndarray:
+        return self._dead
+
+    def live_count(self) -> int:
+        return int(self._rows - self._dead.sum())
+
+    def rows_for(self, owner_ids: Iterable[str]) -> np.ndarray:
+        """Live row numbers currently holding `owner_ids` (unknown ids are skipped)."""
+        rows = [self._latest[oid] for oid in owner_ids if oid in self._latest]
+        rows = np.asarray([r for r in rows if r < self._rows], dtype=np.int64)
+        return rows[~self._dead[rows]] if rows.size else rows
+
+    # -- writes ----------------------------------------------------------------
+
+    def upsert(self, ids: Sequence[str], mat: np.ndarray) -> None:
+        """Append rows, tombstoning any earlier row stored for the same owner id."""
+        with self._locked():
+            self._stamp = None
+            self.refresh()
+            self._append(ids, mat)
+
+    def delete(self, owner_ids: Iterable[str]) -> int:
+        with self._locked():
+            self._stamp = None
+            self.refresh()
+            return self._delete(owner_ids)
+
+    def sync(
+        self,
+        delta: Callable[
+            [int, List[str]], Tuple[Sequence[str], np.ndarray, Sequence[str], int]
+        ],
+    ) -> None:
+        """Catch the shard up with its source of truth under the shard lock.
+
+        `delta(max_rowid, live_ids)` returns (ids, rows, deleted_ids, new_max_rowid): rows
+        written after the manifest watermark and live owners that are gone. Appends land
+        before the watermark moves, so a crash in between only replays (and re-tombstones)
+        the same rows on the next sync.
+        """
+        with self._locked():
+            self._stamp = None
+            self.refresh()
+            live = [oid for oid, dead in zip(self.ids, self._dead) if not dead]
+            ids, mat, deleted, max_rowid = delta(self.max_rowid or 0, live)
+            self._delete(deleted)
+            if len(ids):
+                self._append(ids, mat)
+            if max_rowid != self.max_rowid:
+                self._write_manifest(self.gen, max_rowid)
+                self.max_rowid = max_rowid
+        self.refresh()
+
+    def _append(self, ids: Sequence[str], mat: np.ndarray) -> None:
+        data = np.ascontiguousarray(mat, dtype="<f4").reshape(len(ids), self.dim)
+        self._tombstone_rows([self._latest[oid] for oid in ids if oid in self._latest])
+        start = self._rows
+        # Drop ids left behind by an append that died before its header commit.
+        with open(self._path("ids"), "r+b") as idf:
+            idf.truncate(self._ids_offset)
+            idf.seek(self._ids_offset)
+            idf.write("".join(f"{oid}\n" for oid in ids).encode("utf-8"))
+        with open(self._path("npy"), "r+b") as f:
+            f.seek(HEADER_LEN + start * self.dim * 4)
+            f.write(data.tobytes())
+            f.truncate()
+            # The header row count is the commit point readers trust.
+            f.seek(0)
+            f.write(_npy_header(start + len(ids), self.dim))
+
+    def _delete(self, owner_ids: Iterable[str]) -> int:
+        rows = [self._latest[oid] for oid in owner_ids if oid in self._latest]
+        rows = [r for r in rows if not self._dead[r]]
+        self._tombstone_rows(rows)
+        return len(rows)
+
+    def _tombstone_rows(self, rows: Iterable[int]) -> None:
+        rows = sorted(set(int(r) for r in rows))
+        if not rows:
+            return
+        with open(self._path("del"), "r+b") as f:
+            size = os.fstat(f.fileno()).st_size
+            need = rows[-1] // 8 + 1
+            if need > size:
+                f.seek(size)
+                f.write(b"\x00" * (need - size))
+            for r in rows:
+                f.seek(r // 8)
+                byte = f.read(1)[0]
+                f.seek(r // 8)
+                f.write(bytes([byte | (1 << (r % 8))]))
+
+    def compact(self) -> int:
+        """Rewrite live rows into a new generation and drop tombstoned ones.
+
+        Returns the number of rows removed. Readers holding the previous generation keep
+        their (unlinked) mapping until their next refresh.
+        """
+        with self._locked():
+            old_gen = self.gen
+            self._stamp = None
+            self.refresh()
+            alive = ~self._dead
+            removed = int(self._rows - alive.sum())
+            ids = [oid for oid, keep in zip(self.ids, alive) if keep]
+            mat = np.asarray(self._mat)[alive] if self._rows else self._mat
+            self._write_generation(old_gen + 1, ids, mat, self.max_rowid)
+        self._unlink_generation(old_gen)
+        self.refresh()
+        return removed
@@ -0,0 +1,415 @@
+from __future__ import annotations
+
+import argparse
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+import json
+import os
+from pathlib import Path
+import sys
+import time
+from typing import IO, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sap_core.domain.models import AnalysisMode, Lens
+from sap_core.pipelines.draft_analyze import analysis_stages
+from sap_core.pipelines.workspace_context import WorkspaceContext, build_workspace_context
+from sap_models.registry import EMBED_MODEL, registry
+from sap_store.sqlite.centroids import refresh_centroids
+from sap_store.sqlite.db import DEFAULT_DB_PATH, connect, connect_readonly, database_path
+from sap_store.sqlite.exposure import load_term_exposure, refresh_workspace_exposure
+
+BATCH_ANALYZE_JOB = "batch_analyze"
+# Worker processes (0 = one per CPU; 1 analyzes in the calling process).
+BATCH_WORKERS = int(os.environ.get("SAP_BATCH_WORKERS", "0"))
+# Drafts per task sent to a worker; each task loads its recipients' exposure in one query.
+BATCH_CHUNK_SIZE = int(os.environ.get("SAP_BATCH_CHUNK_SIZE", "32"))
+BATCH_PROGRESS_SECONDS = float(os.environ.get("SAP_BATCH_PROGRESS_SECONDS", "5"))
+# Artifact rows fetched per round trip while streaming the artifact table.
+ARTIFACT_FETCH = 500
+
+
+@dataclass
+class BatchItem:
+    """One draft to analyze. Items that failed to parse carry `error` and are reported as such."""
+
+    item_id: str
+    draft_text: str = ""
+    recipients: List[str] = field(default_factory=list)
+    recipient_lenses: List[Lens] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def _item(
+    item_id: str,
+    record: Dict[str, Any],
+    text_key: str,
+    recipients: List[str],
+    lenses: List[Lens],
+) -> BatchItem:
+    try:
+        return BatchItem(
+            item_id=item_id,
+            draft_text=str(record.get(text_key) or ""),
+            recipients=list(record.get("recipients") or recipients),
+            recipient_lenses=[Lens(v) for v in record.get("recipient_lenses") or lenses],
+        )
+    except (TypeError, ValueError) as exc:
+        return BatchItem(item_id=item_id, error=str(exc))
+
+
+def artifact_items(
+    con,
+    workspace_id: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    types: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    recipients: Iterable[str] = (),
+    recipient_lenses: Iterable[Lens] = (),
+) -> Iterator[BatchItem]:
+    """Stream a workspace's artifacts oldest first; `meta.recipients` / `meta.recipient_lenses`
+    override the defaults per artifact."""
+    sql = "SELECT artifact_id, body, meta_json FROM artifact WHERE workspace_id=?"
+    params: List[Any] = [workspace_id]
+    if since:
+        sql += " AND created_at >= ?"
+        params.append(since)
+    if until:
+        sql += " AND created_at < ?"
+        params.append(until)
+    if types:
+        sql += f" AND type IN ({','.join('?' for _ in types)})"
+        params.extend(types)
+    sql += " ORDER BY created_at, artifact_id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    default_recipients, default_lenses = list(recipients), list(recipient_lenses)
+    cur = con.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(ARTIFACT_FETCH)
+        if not rows:
+            return
+        for r in rows:
+            try:
+                meta = json.loads(r["meta_json"] or "{}")
+            except ValueError:
+                meta = {}
+            yield _item(
+                r["artifact_id"],
+                {**(meta if isinstance(meta, dict) else {}), "body": r["body"]},
+                "body",
+                default_recipients,
+                default_lenses,
+            )
+
+
+def jsonl_items(
+    lines: Iterable[str],
+    workspace_id: str,
+    recipients: Iterable[str] = (),
+    recipient_lenses: Iterable[Lens] = (),
+) -> Iterator[BatchItem]:
+    """Items from JSON lines: {"id", "draft_text" (or "body"), "recipients", "recipient_lenses"}.
+
+    Lines default their id to the line number; lines naming another workspace are errors.
+    """
+    default_recipients, default_lenses = list(recipients), list(recipient_lenses)
+    for n, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as exc:
+            yield BatchItem(item_id=str(n), error=f"line {n}: {exc}")
+            continue
+        item_id = str(record.get("id", n))
+        if record.get("workspace_id", workspace_id) != workspace_id:
+            error = f"workspace {record['workspace_id']} != {workspace_id}"
+            yield BatchItem(item_id=item_id, error=error)
+            continue
+        text_key = "draft_text" if "draft_text" in record else "body"
+        yield _item(item_id, record, text_key, default_recipients, default_lenses)
+
+
+# Per-process worker state, set by _init_worker.
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(db_path: str, ctx: WorkspaceContext, embed_model: str) -> None:
+    _worker["con"] = connect_readonly(Path(db_path))
+    _worker["ctx"] = ctx
+    _worker["embedder"] = registry.get_embedder(embed_model)
+
+
+def _close_worker() -> None:
+    con = _worker.pop("con", None)
+    if con is not None:
+        con.close()
+    _worker.clear()
+
+
+def _analyze_chunk(items: List[BatchItem]) -> List[Tuple[bool, str]]:
+    """(ok, NDJSON line) per item, in input order."""
+    con, ctx, embedder = _worker["con"], _worker["ctx"], _worker["embedder"]
+    recipients = list(dict.fromkeys(rid for item in items for rid in item.recipients))
+    try:
+        # Exposure written since prepare_batch is folded in memory, never written back.
+        exposure = load_term_exposure(
+            con,
+            ctx.workspace_id,
+            recipients,
+            half_life_days=ctx.policy.exposure_half_life_days,
+            read_only=True,
+        )
+    except Exception:
+        # Fall back to per-item loads, which report the failure per draft.
+        exposure = None
+    out: List[Tuple[bool, str]] = []
+    for item in items:
+        item_id = json.dumps(item.item_id)
+        if item.error is not None:
+            out.append((False, f'{{"id":{item_id},"error":{json.dumps(item.error)}}}'))
+            continue
+        try:
+            for _stage, report in analysis_stages(
+                con,
+                ctx.workspace_id,
+                item.draft_text,
+                item.recipients,
+                item.recipient_lenses,
+                AnalysisMode.batch,
+                embedder=embedder,
+                exposure=exposure,
+                ctx=ctx,
+                read_only=True,
+            ):
+                pass
+            out.append((True, f'{{"id":{item_id},"report":{report.model_dump_json()}}}'))
+        except Exception as exc:
+            out.append((False, f'{{"id":{item_id},"error":{json.dumps(str(exc))}}}'))
+    return out
+
+
+@dataclass
+class BatchStats:
+    items: int = 0
+    errors: int = 0
+    started: float = field(default_factory=time.monotonic)
+    finished: bool = False
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "items_per_second": round(self.items / elapsed, 2) if elapsed > 0 else 0.0,
+            "finished": self.finished,
+        }
+
+
+ProgressFn = Callable[[BatchStats], None]
+
+
+def prepare_batch(con, workspace_id: str) -> WorkspaceContext:
+    """Build the context every worker shares and settle pending aggregates.
+
+    Workers run the analysis with read_only=True over read-only connections, so the lazy
+    work a request would do is done here and committed before they start: centroid deltas
+    are folded and stale exposure is recomputed.
+    """
+    refresh_centroids(con, workspace_id)
+    ctx = build_workspace_context(con, workspace_id)
+    refresh_workspace_exposure(con, workspace_id, ctx.policy.exposure_half_life_days)
+    con.commit()
+    return ctx
+
+
+def _chunks(items: Iterable[BatchItem], size: int) -> Iterator[List[BatchItem]]:
+    chunk: List[BatchItem] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(
+    con,
+    workspace_id: str,
+    items: Iterable[BatchItem],
+    out: IO[str],
+    workers: int = BATCH_WORKERS,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    embed_model: str = EMBED_MODEL,
+    db_path: Path = DEFAULT_DB_PATH,
+    progress: Optional[ProgressFn] = None,
+    progress_seconds: float = BATCH_PROGRESS_SECONDS,
+) -> BatchStats:
+    """Analyze `items` (mode=batch) and write one NDJSON line per item to `out`.
+
+    Lines are {"id", "report"} or {"id", "error"}, in input order. Items are streamed in
+    chunks to a process pool with at most two chunks in flight per worker, so memory stays
+    flat whatever the input size. `progress` is called every `progress_seconds` and once
+    at the end.
+    """
+    ctx = prepare_batch(con, workspace_id)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, chunk_size)
+    stats = BatchStats()
+    last_progress = time.monotonic()
+
+    def emit(results: List[Tuple[bool, str]]) -> None:
+        nonlocal last_progress
+        for ok, line in results:
+            out.write(line)
+            out.write("\n")
+            stats.items += 1
+            stats.errors += 0 if ok else 1
+        if progress is not None and time.monotonic() - last_progress >= progress_seconds:
+            last_progress = time.monotonic()
+            progress(stats)
+
+    if workers <= 1:
+        _init_worker(str(db_path), ctx, embed_model)
+        try:
+            for chunk in _chunks(items, chunk_size):
+                emit(_analyze_chunk(chunk))
+        finally:
+            _close_worker()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(str(db_path), ctx, embed_model),
+        ) as pool:
+            pending: Deque[Future] = deque()
+            for chunk in _chunks(items, chunk_size):
+                pending.append(pool.submit(_analyze_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    emit(pending.popleft().result())
+            while pending:
+                emit(pending.popleft().result())
+    out.flush()
+    stats.finished = True
+    if progress is not None:
+        progress(stats)
+    return stats
+
+
+def _write_metrics(path: str, stats: BatchStats) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(stats.as_dict(), fh)
+    os.replace(tmp, path)
+
+
+def run_batch_job(
+    con, workspace_id: str, payload: Dict[str, Any], progress: Optional[ProgressFn] = None
+) -> BatchStats:
+    """Run a batch described by a job payload (also what the CLI builds).
+
+    Payload keys: output (required; path, "-" for stdout), input (JSONL path; default the
+    artifact table), since, until, types, limit, recipients, recipient_lenses, workers,
+    chunk_size, embed_model, metrics (path rewritten with the stats on every progress tick),
+    db_path (database the worker processes read; default the file behind `con`).
+    """
+    output = payload.get("output")
+    if not output:
+        raise ValueError("batch job payload needs an output path ('-' for stdout)")
+    db_path = payload.get("db_path") or database_path(con) or DEFAULT_DB_PATH
+    recipients = payload.get("recipients") or []
+    lenses = [Lens(v) for v in payload.get("recipient_lenses") or []]
+    metrics = payload.get("metrics")
+
+    def report_progress(stats: BatchStats) -> None:
+        if metrics:
+            _write_metrics(metrics, stats)
+        if progress is not None:
+            progress(stats)
+
+    source = payload.get("input")
+    in_fh = open(source, encoding="utf-8") if source else None
+    out_fh = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        if in_fh is not None:
+            items: Iterable[BatchItem] = jsonl_items(in_fh, workspace_id, recipients, lenses)
+        else:
+            items = artifact_items(
+                con,
+                workspace_id,
+                since=payload.get("since"),
+                until=payload.get("until"),
+                types=payload.get("types"),
+                limit=payload.get("limit"),
+                recipients=recipients,
+                recipient_lenses=lenses,
+            )
+        return run_batch(
+            con,
+            workspace_id,
+            items,
+            out_fh,
+            workers=payload.get("workers", BATCH_WORKERS),
+            chunk_size=payload.get("chunk_size", BATCH_CHUNK_SIZE),
+            embed_model=payload.get("embed_model", EMBED_MODEL),
+            db_path=Path(db_path),
+            progress=report_progress,
+        )
+    finally:
+        if in_fh is not None:
+            in_fh.close()
+        if out_fh is not sys.stdout:
+            out_fh.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m sap_workers.batch",
+        description="Analyze stored artifacts or a JSONL file of drafts; writes NDJSON reports.",
+    )
+    parser.add_argument("workspace_id")
+    parser.add_argument("--input", help="JSONL drafts (default: the workspace's artifacts)")
+    parser.add_argument("--output", default="-", help="NDJSON output path (default: stdout)")
+    parser.add_argument("--since", help="artifacts created at or after this ISO time")
+    parser.add_argument("--until", help="artifacts created before this ISO time")
+    parser.add_argument("--type", dest="types", action="append", help="artifact type (repeatable)")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--recipient", dest="recipients", action="append", default=[])
+    parser.add_argument(
+        "--lens",
+        dest="recipient_lenses",
+        action="append",
+        default=[],
+        choices=[lens.value for lens in Lens],
+    )
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    parser.add_argument("--embed-model", default=EMBED_MODEL, help="empty disables rare thoughts")
+    parser.add_argument("--metrics", help="JSON file kept up to date with progress metrics")
+    args = parser.parse_args(argv)
+
+    def log_progress(stats: BatchStats) -> None:
+        print(json.dumps(stats.as_dict()), file=sys.stderr, flush=True)
+
+    con = connect()
+    try:
+        stats = run_batch_job(con, args.workspace_id, vars(args), progress=log_progress)
+        con.commit()
+    finally:
+        con.close()
+    return 1 if stats.errors and stats.errors == stats.items else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import argparse
 from datetime import datetime
 import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sap_store.sqlite.db import connect
+from sap_store.sqlite.migrate import apply_all
+
+# Seconds the polling loop sleeps while the queue is empty.
+WORKER_POLL_SECONDS = float(os.environ.get("SAP_WORKER_POLL_SECONDS", "1.0"))
 
 
 def claim_next_job(con):
     row = con.execute(
         """
-        SELECT job_id, kind, payload_json
+        SELECT job_id, workspace_id, kind, payload_json
         FROM job
         WHERE status='queued'
         ORDER BY priority ASC, created_at ASC
@@ -21,21 +32,135 @@ def claim_next_job(con):
         "UPDATE job SET status='running', updated_at=? WHERE job_id=?",
         (datetime.utcnow().isoformat(), row["job_id"]),
     )
+    # Publish the claim so other processes see the job running, and so handlers start
+    # from a settled connection (index caches ignore connections with pending writes).
+    con.commit()
     return {
         "job_id": row["job_id"],
+        "workspace_id": row["workspace_id"],
         "kind": row["kind"],
         "payload": json.loads(row["payload_json"]),
     }
 
 
+def _run_ann_rebuild(con, job: Dict[str, Any]) -> None:
+    from sap_core.retrieval.ann import rebuild_ann_index
+
+    payload = job["payload"]
+    rebuild_ann_index(
+        con,
+        job["workspace_id"],
+        owner_type=payload.get("owner_type", "capsule"),
+        dim=payload.get("dim"),
+        nlist=payload.get("nlist"),
+    )
+
+
+def _run_quant_rebuild(con, job: Dict[str, Any]) -> None:
+    from sap_core.retrieval.quant import rebuild_quant_index
+
+    payload = job["payload"]
+    rebuild_quant_index(
+        con,
+        job["workspace_id"],
+        owner_type=payload.get("owner_type", "capsule"),
+        mode=payload.get("mode"),
+        dim=payload.get("dim"),
+    )
+
+
+def _run_shard_compact(con, job: Dict[str, Any]) -> None:
+    from sap_core.retrieval.vector_index import compact_vector_shards
+
+    compact_vector_shards(
+        job["workspace_id"], min_ratio=job["payload"].get("min_ratio", 0.0), con=con
+    )
+
+
+def _run_exposure_recompute(con, job: Dict[str, Any]) -> None:
+    from sap_core.pipelines.workspace_context import load_policy
+    from sap_store.sqlite.exposure import recompute_workspace_exposure
+
+    policy = load_policy(con, job["workspace_id"])
+    recompute_workspace_exposure(con, job["workspace_id"], policy.exposure_half_life_days)
+
+
+def _run_centroid_refresh(con, job: Dict[str, Any]) -> None:
+    from sap_store.sqlite.centroids import refresh_centroids
+
+    refresh_centroids(con, job["workspace_id"])
+
+
+def _run_batch_analyze(con, job: Dict[str, Any]) -> None:
+    from sap_workers.batch import run_batch_job
+
+    run_batch_job(con, job["workspace_id"], job["payload"])
+
+
+JOB_HANDLERS: Dict[str, Callable[[Any, Dict[str, Any]], None]] = {
+    "ann_rebuild": _run_ann_rebuild,
+    "quant_rebuild": _run_quant_rebuild,
+    "shard_compact": _run_shard_compact,
+    "exposure_recompute": _run_exposure_recompute,
+    "centroid_refresh": _run_centroid_refresh,
+    "batch_analyze": _run_batch_analyze,
+}
+
+
 def run_once(con) -> bool:
+    """Claim and run the next queued job; False when the queue is empty.
+
+    A handler that raises has its uncommitted writes rolled back before the job is marked
+    failed, so a half-done job never lands alongside its status. The status is committed here.
+    """
     job = claim_next_job(con)
     if job is None:
         return False
 
-    # TODO: dispatch by job kind.
+    handler = JOB_HANDLERS.get(job["kind"])
+    status, error = "done", None
+    if handler is None:
+        status, error = "failed", f"unknown job kind: {job['kind']}"
+    else:
+        try:
+            handler(con, job)
+        except Exception as exc:
+            con.rollback()
+            status, error = "failed", str(exc)
+
     con.execute(
-        "UPDATE job SET status='done', updated_at=? WHERE job_id=?",
-        (datetime.utcnow().isoformat(), job["job_id"]),
+        "UPDATE job SET status=?, error=?, updated_at=? WHERE job_id=?",
+        (status, error, datetime.utcnow().isoformat(), job["job_id"]),
     )
+    con.commit()
     return True
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m sap_workers.worker",
+        description="Run queued jobs (index rebuilds, compaction, centroid and exposure refresh).",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="drain the queue and exit instead of polling"
+    )
+    parser.add_argument("--poll-seconds", type=float, default=WORKER_POLL_SECONDS)
+    args = parser.parse_args(argv)
+
+    apply_all()
+    con = connect()
+    try:
+        while True:
+            if run_once(con):
+                continue
+            if args.once:
+                return 0
+            time.sleep(args.poll_seconds)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())